@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app import app, db
 from models import Stock
 from sqlalchemy import text
+from backfill import run_backfill, sql_batch
 
 def add_unit_price_column():
     """Add unit_price column to Stock table if it doesn't exist"""
@@ -35,9 +36,8 @@ def add_unit_price_column():
 
                     print("✅ unit_price column added successfully!")
 
-                    # Update existing records to have unit_price = 0.0
-                    conn.execute(text("UPDATE stock SET unit_price = 0.0 WHERE unit_price IS NULL"))
-                    conn.commit()
+                    # Update existing records to have unit_price = 0.0, in batches
+                    run_backfill(conn, 'stock.unit_price', 'stock', sql_batch("unit_price = 0.0", "unit_price IS NULL"))
 
                     print("✅ Existing records updated with default unit_price!")
 
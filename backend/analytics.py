@@ -1,47 +1,61 @@
 from flask import Blueprint, request, jsonify
-from models import db, Sale, Stock
+from models import db, Sale, Stock, DemandStat, CustomerSegment, sale_business_days
+from demand import demand_estimate, nearest_horizon
+from forecasting import reorder_suggestions
+from sketches import heavy_hitters
+from segments import SEGMENTS
+from pivot import parse_pivot, run_pivot
+from rollup import product_sales_since
+from business_time import business_today, business_day_start
+from money import to_rupees
+from coalesce import coalesced
+from conditional import conditional
+from cache import cache
+from sync import current_change_version, SEGMENTS_COUNTER
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc, case
+from sqlalchemy import func, desc, case, or_
 
 analytics_bp = Blueprint('analytics', __name__)
 
 @analytics_bp.route('/dashboard-stats', methods=['GET'])
+@conditional('sale', 'stock', daily=True)
+@coalesced('sale', 'stock', daily=True)
 def get_dashboard_stats():
     """Get comprehensive dashboard statistics for admin"""
     try:
-        # Time periods
-        today = datetime.utcnow().date()
+        # Time periods (business days in the shop's time zone)
+        today = business_today()
         week_ago = today - timedelta(days=7)
         month_ago = today - timedelta(days=30)
         
         # Basic stats
         total_sales = Sale.query.count()
-        total_revenue = db.session.query(func.sum(Sale.sale_amount)).scalar() or 0
+        total_revenue = db.session.query(func.sum(Sale.sale_amount_paise)).scalar() or 0
         
         # Today's stats
-        today_sales = Sale.query.filter(func.date(Sale.sale_date) == today).count()
-        today_revenue = db.session.query(func.sum(Sale.sale_amount)).filter(
-            func.date(Sale.sale_date) == today
+        today_sales = Sale.query.filter(sale_business_days(today, today)).count()
+        today_revenue = db.session.query(func.sum(Sale.sale_amount_paise)).filter(
+            sale_business_days(today, today)
         ).scalar() or 0
         
         # Weekly stats
-        weekly_sales = Sale.query.filter(Sale.sale_date >= week_ago).count()
-        weekly_revenue = db.session.query(func.sum(Sale.sale_amount)).filter(
-            Sale.sale_date >= week_ago
+        weekly_sales = Sale.query.filter(sale_business_days(week_ago)).count()
+        weekly_revenue = db.session.query(func.sum(Sale.sale_amount_paise)).filter(
+            sale_business_days(week_ago)
         ).scalar() or 0
         
         # Monthly stats
-        monthly_sales = Sale.query.filter(Sale.sale_date >= month_ago).count()
-        monthly_revenue = db.session.query(func.sum(Sale.sale_amount)).filter(
-            Sale.sale_date >= month_ago
+        monthly_sales = Sale.query.filter(sale_business_days(month_ago)).count()
+        monthly_revenue = db.session.query(func.sum(Sale.sale_amount_paise)).filter(
+            sale_business_days(month_ago)
         ).scalar() or 0
         
         # Payment stats
-        paid_amount = db.session.query(func.sum(Sale.sale_amount)).filter(
+        paid_amount = db.session.query(func.sum(Sale.sale_amount_paise)).filter(
             Sale.payment_status == 'paid'
         ).scalar() or 0
         
-        unpaid_amount = db.session.query(func.sum(Sale.sale_amount)).filter(
+        unpaid_amount = db.session.query(func.sum(Sale.sale_amount_paise)).filter(
             Sale.payment_status == 'unpaid'
         ).scalar() or 0
         
@@ -53,201 +67,325 @@ def get_dashboard_stats():
         return jsonify({
             'total_stats': {
                 'total_sales': total_sales,
-                'total_revenue': float(total_revenue),
+                'total_revenue': to_rupees(total_revenue),
                 'total_products': total_products,
                 'low_stock_items': low_stock_items,
                 'out_of_stock_items': out_of_stock_items
             },
             'today_stats': {
                 'sales': today_sales,
-                'revenue': float(today_revenue)
+                'revenue': to_rupees(today_revenue)
             },
             'weekly_stats': {
                 'sales': weekly_sales,
-                'revenue': float(weekly_revenue)
+                'revenue': to_rupees(weekly_revenue)
             },
             'monthly_stats': {
                 'sales': monthly_sales,
-                'revenue': float(monthly_revenue)
+                'revenue': to_rupees(monthly_revenue)
             },
             'payment_stats': {
-                'paid_amount': float(paid_amount),
-                'unpaid_amount': float(unpaid_amount),
-                'payment_rate': (paid_amount / total_revenue * 100) if total_revenue > 0 else 0
+                'paid_amount': to_rupees(paid_amount),
+                'unpaid_amount': to_rupees(unpaid_amount),
+                'payment_rate': float(paid_amount / total_revenue * 100) if total_revenue > 0 else 0
             }
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def window_start(days):
+    """Start of a top-K window: the business day `days` days ago, the same boundary as the sketch day buckets"""
+    # Kept on sale_date so the window stays on the covering index
+    return business_day_start(business_today() - timedelta(days=days))
+
+def use_exact(days):
+    """Whether a top-K request must be answered by SQL instead of the heavy-hitters sketches"""
+    return request.args.get('exact', 'false').lower() == 'true' or not heavy_hitters.covers(days)
+
+def product_entry(product_name, company_name, total_quantity, sale_count, total_revenue, error=None):
+    """Product totals for the API; total_revenue is in paise, error is already in API units"""
+    entry = {
+        'product_name': product_name,
+        'company_name': company_name,
+        'total_quantity': int(total_quantity),
+        'sale_count': int(sale_count),
+        'total_revenue': to_rupees(total_revenue),
+        'avg_price': to_rupees(total_revenue / total_quantity) if total_quantity > 0 else 0
+    }
+    if error is not None:
+        entry['error'] = round(error, 2)
+    return entry
+
+def top_products(start_date, limit):
+    """Top products by quantity and by revenue, ranked from one aggregation of the window"""
+    totals = db.session.query(
+        Sale.product_name,
+        Sale.company_name,
+        func.sum(Sale.quantity_sold).label('total_quantity'),
+        func.count(Sale.id).label('sale_count'),
+        func.sum(Sale.sale_amount_paise).label('total_revenue')
+    ).filter(
+        Sale.sale_date >= start_date
+    ).group_by(
+        Sale.product_name, Sale.company_name
+    ).cte('product_totals')
+
+    ranked = db.session.query(
+        totals,
+        func.row_number().over(order_by=totals.c.total_quantity.desc()).label('quantity_rank'),
+        func.row_number().over(order_by=totals.c.total_revenue.desc()).label('revenue_rank')
+    ).subquery()
+
+    rows = db.session.query(ranked).filter(
+        or_(ranked.c.quantity_rank <= limit, ranked.c.revenue_rank <= limit)
+    ).all()
+    top_by_quantity = sorted((row for row in rows if row.quantity_rank <= limit), key=lambda row: row.quantity_rank)
+    top_by_revenue = sorted((row for row in rows if row.revenue_rank <= limit), key=lambda row: row.revenue_rank)
+    return top_by_quantity, top_by_revenue
+
+def customer_totals(start_date, limit):
+    """Top customers by amount spent, with their paid/unpaid split, in one aggregation of the window"""
+    return db.session.query(
+        Sale.customer_name,
+        func.sum(Sale.sale_amount_paise).label('total_spent'),
+        func.count(Sale.id).label('purchase_count'),
+        func.sum(Sale.quantity_sold).label('total_items'),
+        func.avg(Sale.sale_amount_paise).label('avg_purchase'),
+        func.sum(case((Sale.payment_status == 'paid', Sale.sale_amount_paise), else_=0)).label('paid_amount'),
+        func.sum(case((Sale.payment_status == 'unpaid', Sale.sale_amount_paise), else_=0)).label('unpaid_amount')
+    ).filter(
+        Sale.sale_date >= start_date
+    ).group_by(
+        Sale.customer_name
+    ).order_by(
+        desc('total_spent')
+    ).limit(limit).all()
+
 @analytics_bp.route('/top-selling-products', methods=['GET'])
+@conditional('sale', daily=True)
+@coalesced('sale', daily=True)
 def get_top_selling_products():
-    """Get top selling products by quantity and revenue"""
+    """Get top selling products by quantity and revenue (?exact=true to skip the sketches)"""
     try:
         days = request.args.get('days', 30, type=int)
         limit = request.args.get('limit', 10, type=int)
+
+        if not use_exact(days):
+            by_quantity, quantity_bound = heavy_hitters.top('product_quantity', days, limit)
+            by_revenue, revenue_bound = heavy_hitters.top('product_revenue', days, limit)
+            return jsonify({
+                'top_by_quantity': [
+                    product_entry(item[0], item[1], count, sales, revenue, error)
+                    for item, count, error, quantity, revenue, sales in by_quantity
+                ],
+                'top_by_revenue': [
+                    product_entry(item[0], item[1], quantity, sales, count, to_rupees(error))
+                    for item, count, error, quantity, revenue, sales in by_revenue
+                ],
+                'period_days': days,
+                'approximate': True,
+                # Any product not listed sold at most this much in the window
+                'error_bounds': {'quantity': round(quantity_bound, 2), 'revenue': round(to_rupees(revenue_bound), 2)}
+            }), 200
+
+        start_date = window_start(days)
         
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Top products by quantity
-        top_by_quantity = db.session.query(
-            Sale.product_name,
-            Sale.company_name,
-            func.sum(Sale.quantity_sold).label('total_quantity'),
-            func.count(Sale.id).label('sale_count'),
-            func.sum(Sale.sale_amount).label('total_revenue')
-        ).filter(
-            Sale.sale_date >= start_date
-        ).group_by(
-            Sale.product_name, Sale.company_name
-        ).order_by(
-            desc('total_quantity')
-        ).limit(limit).all()
-        
-        # Top products by revenue
-        top_by_revenue = db.session.query(
-            Sale.product_name,
-            Sale.company_name,
-            func.sum(Sale.quantity_sold).label('total_quantity'),
-            func.count(Sale.id).label('sale_count'),
-            func.sum(Sale.sale_amount).label('total_revenue')
-        ).filter(
-            Sale.sale_date >= start_date
-        ).group_by(
-            Sale.product_name, Sale.company_name
-        ).order_by(
-            desc('total_revenue')
-        ).limit(limit).all()
+        top_by_quantity, top_by_revenue = top_products(start_date, limit)
         
         return jsonify({
-            'top_by_quantity': [{
-                'product_name': item.product_name,
-                'company_name': item.company_name,
-                'total_quantity': int(item.total_quantity),
-                'sale_count': int(item.sale_count),
-                'total_revenue': float(item.total_revenue),
-                'avg_price': float(item.total_revenue / item.total_quantity) if item.total_quantity > 0 else 0
-            } for item in top_by_quantity],
-            'top_by_revenue': [{
-                'product_name': item.product_name,
-                'company_name': item.company_name,
-                'total_quantity': int(item.total_quantity),
-                'sale_count': int(item.sale_count),
-                'total_revenue': float(item.total_revenue),
-                'avg_price': float(item.total_revenue / item.total_quantity) if item.total_quantity > 0 else 0
-            } for item in top_by_revenue],
-            'period_days': days
+            'top_by_quantity': [
+                product_entry(item.product_name, item.company_name, item.total_quantity, item.sale_count, item.total_revenue)
+                for item in top_by_quantity
+            ],
+            'top_by_revenue': [
+                product_entry(item.product_name, item.company_name, item.total_quantity, item.sale_count, item.total_revenue)
+                for item in top_by_revenue
+            ],
+            'period_days': days,
+            'approximate': False
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def payment_entry(customer_name, paid_amount, unpaid_amount, total_amount):
+    return {
+        'customer_name': customer_name,
+        'paid_amount': to_rupees(paid_amount),
+        'unpaid_amount': to_rupees(unpaid_amount),
+        'total_amount': to_rupees(total_amount),
+        'payment_rate': float(paid_amount / total_amount * 100) if total_amount > 0 else 0
+    }
+
 @analytics_bp.route('/customer-analysis', methods=['GET'])
+@conditional('sale', daily=True)
+@coalesced('sale', daily=True)
 def get_customer_analysis():
-    """Get customer purchase analysis"""
+    """Get customer purchase analysis (?exact=true to skip the sketches)"""
     try:
         days = request.args.get('days', 30, type=int)
         limit = request.args.get('limit', 10, type=int)
         
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Top customers by revenue
-        top_customers = db.session.query(
-            Sale.customer_name,
-            func.sum(Sale.sale_amount).label('total_spent'),
-            func.count(Sale.id).label('purchase_count'),
-            func.sum(Sale.quantity_sold).label('total_items'),
-            func.avg(Sale.sale_amount).label('avg_purchase')
-        ).filter(
-            Sale.sale_date >= start_date
-        ).group_by(
-            Sale.customer_name
-        ).order_by(
-            desc('total_spent')
-        ).limit(limit).all()
+        start_date = window_start(days)
+
+        if not use_exact(days):
+            customers, bound = heavy_hitters.top('customer_revenue', days, limit)
+            names = [name for name, *_ in customers]
+
+            # Payment status changes after a sale, so the split is looked up for
+            # the top customers only (ix_sale_customer_date)
+            payments = db.session.query(
+                Sale.customer_name,
+                func.sum(case((Sale.payment_status == 'paid', Sale.sale_amount_paise), else_=0)),
+                func.sum(case((Sale.payment_status == 'unpaid', Sale.sale_amount_paise), else_=0)),
+                func.sum(Sale.sale_amount_paise)
+            ).filter(
+                Sale.customer_name.in_(names),
+                Sale.sale_date >= start_date
+            ).group_by(Sale.customer_name).all() if names else []
+            payments.sort(key=lambda row: row[3], reverse=True)
+
+            return jsonify({
+                'top_customers': [{
+                    'customer_name': name,
+                    'total_spent': round(to_rupees(count), 2),
+                    'purchase_count': int(sales),
+                    'total_items': int(quantity),
+                    'avg_purchase': to_rupees(revenue / sales) if sales else 0,
+                    'error': round(to_rupees(error), 2)
+                } for name, count, error, quantity, revenue, sales in customers],
+                'payment_behavior': [payment_entry(*row) for row in payments if row[3] > 0],
+                'period_days': days,
+                'approximate': True,
+                # Any customer not listed spent at most this much in the window
+                'error_bounds': {'total_spent': round(to_rupees(bound), 2)}
+            }), 200
         
-        # Customer payment behavior
-        customer_payments = db.session.query(
-            Sale.customer_name,
-            func.sum(case((Sale.payment_status == 'paid', Sale.sale_amount), else_=0)).label('paid_amount'),
-            func.sum(case((Sale.payment_status == 'unpaid', Sale.sale_amount), else_=0)).label('unpaid_amount'),
-            func.sum(Sale.sale_amount).label('total_amount')
-        ).filter(
-            Sale.sale_date >= start_date
-        ).group_by(
-            Sale.customer_name
-        ).having(
-            func.sum(Sale.sale_amount) > 0
-        ).order_by(
-            desc('total_amount')
-        ).limit(limit).all()
+        top_customers = customer_totals(start_date, limit)
         
         return jsonify({
             'top_customers': [{
                 'customer_name': customer.customer_name,
-                'total_spent': float(customer.total_spent),
+                'total_spent': to_rupees(customer.total_spent),
                 'purchase_count': int(customer.purchase_count),
                 'total_items': int(customer.total_items),
-                'avg_purchase': float(customer.avg_purchase)
+                'avg_purchase': to_rupees(customer.avg_purchase)
             } for customer in top_customers],
-            'payment_behavior': [{
-                'customer_name': customer.customer_name,
-                'paid_amount': float(customer.paid_amount),
-                'unpaid_amount': float(customer.unpaid_amount),
-                'total_amount': float(customer.total_amount),
-                'payment_rate': (customer.paid_amount / customer.total_amount * 100) if customer.total_amount > 0 else 0
-            } for customer in customer_payments],
-            'period_days': days
+            'payment_behavior': [
+                payment_entry(customer.customer_name, customer.paid_amount, customer.unpaid_amount, customer.total_spent)
+                for customer in top_customers if customer.total_spent > 0
+            ],
+            'period_days': days,
+            'approximate': False
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def segments_page(segment, limit, offset):
+    """Page of customer segments plus per-segment counts"""
+    customers = CustomerSegment.query
+    if segment is not None:
+        customers = customers.filter(CustomerSegment.segment == segment)
+    customers = customers.order_by(
+        CustomerSegment.monetary_paise.desc(), CustomerSegment.customer_name
+    ).offset(offset).limit(limit).all()
+
+    summary = db.session.query(
+        CustomerSegment.segment, func.count(), func.max(CustomerSegment.refreshed_at)
+    ).group_by(CustomerSegment.segment).all()
+    refreshed_at = max((row[2] for row in summary), default=None)
+
+    return {
+        'customers': [customer.to_dict() for customer in customers],
+        'segment_counts': {name: count for name, count, _ in summary},
+        'total_customers': sum(count for _, count, _ in summary),
+        'segment': segment,
+        'limit': limit,
+        'offset': offset,
+        'refreshed_at': refreshed_at.strftime('%Y-%m-%d %H:%M:%S') if refreshed_at else None
+    }
+
+@analytics_bp.route('/customer-segments', methods=['GET'])
+@conditional('segment')
+def get_customer_segments():
+    """Get RFM segments for all customers, refreshed in batch by segments.py"""
+    try:
+        segment = request.args.get('segment')
+        if segment is not None and segment not in SEGMENTS:
+            return jsonify({'error': f"segment must be one of: {', '.join(SEGMENTS)}"}), 400
+        limit = min(max(request.args.get('limit', 100, type=int), 0), 10000)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        # Keyed on the refresh counter: segments.py runs in its own process, out of reach of invalidate()
+        key = f'{current_change_version(SEGMENTS_COUNTER)}:{segment}:{limit}:{offset}'
+        page, _ = cache.get_or_compute('customer-segments', key, [], lambda: segments_page(segment, limit, offset))
+        return jsonify(page), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/pivot', methods=['GET'])
+@conditional('sale')
+def get_pivot():
+    """Get an ad-hoc pivot of sales with row, column and grand totals"""
+    try:
+        spec = parse_pivot(request.args)
+        return jsonify(run_pivot(spec)), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/stock-movement', methods=['GET'])
+@conditional('sale', 'stock', daily=True)
+@coalesced('sale', 'stock', daily=True)
 def get_stock_movement():
-    """Get stock movement analysis"""
+    """Get stock movement analysis from the incrementally maintained demand statistics"""
     try:
         days = request.args.get('days', 30, type=int)
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Products with sales in the period
-        stock_movement = db.session.query(
+        horizon = nearest_horizon(days)
+        today = business_today()
+
+        stock_rows = db.session.query(
             Stock.product_name,
             Stock.company_name,
-            Stock.quantity.label('current_stock'),
-            func.coalesce(func.sum(Sale.quantity_sold), 0).label('sold_quantity'),
-            func.count(Sale.id).label('sale_transactions')
+            Stock.quantity,
+            DemandStat
         ).outerjoin(
-            Sale, 
-            (Stock.product_name == Sale.product_name) & 
-            (Stock.company_name == Sale.company_name) &
-            (Sale.sale_date >= start_date)
-        ).group_by(
-            Stock.id, Stock.product_name, Stock.company_name, Stock.quantity
-        ).order_by(
-            desc('sold_quantity')
+            DemandStat, DemandStat.stock_id == Stock.id
         ).all()
-        
-        # Calculate stock velocity (sales per day)
+
+        # Actual units sold and transactions in the last `days` business days, today included
+        sold = product_sales_since(today - timedelta(days=max(days, 1) - 1))
+
         movement_data = []
-        for item in stock_movement:
-            velocity = item.sold_quantity / days if days > 0 else 0
-            days_until_stockout = item.current_stock / velocity if velocity > 0 else float('inf')
-            
+        for product_name, company_name, current_stock, stat in stock_rows:
+            velocity, deviation, transactions = demand_estimate(stat, horizon, today)
+            days_until_stockout = current_stock / velocity if velocity > 0 else None
+            sold_quantity, sale_transactions = sold.get((product_name, company_name), (0, 0))
+
             movement_data.append({
-                'product_name': item.product_name,
-                'company_name': item.company_name,
-                'current_stock': int(item.current_stock),
-                'sold_quantity': int(item.sold_quantity),
-                'sale_transactions': int(item.sale_transactions),
+                'product_name': product_name,
+                'company_name': company_name,
+                'current_stock': int(current_stock),
+                'sold_quantity': sold_quantity,
+                'sale_transactions': sale_transactions,
                 'velocity_per_day': round(velocity, 2),
-                'days_until_stockout': int(days_until_stockout) if days_until_stockout != float('inf') else None,
-                'stock_status': 'Critical' if item.current_stock <= 5 else 'Low' if item.current_stock <= 10 else 'Good'
+                'velocity_stddev': round(deviation, 2),
+                'days_until_stockout': int(days_until_stockout) if days_until_stockout is not None else None,
+                'last_sale_at': stat.last_sale_at.strftime('%Y-%m-%d %H:%M:%S') if stat and stat.last_sale_at else None,
+                'stock_status': 'Critical' if current_stock <= 5 else 'Low' if current_stock <= 10 else 'Good'
             })
-        
+
+        movement_data.sort(key=lambda item: item['velocity_per_day'], reverse=True)
+
         return jsonify({
             'stock_movement': movement_data,
             'period_days': days,
+            'horizon_days': horizon,
             'analysis_date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         }), 200
         
@@ -255,6 +393,7 @@ def get_stock_movement():
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/low-stock-alerts', methods=['GET'])
+@conditional('stock')
 def get_low_stock_alerts():
     """Get low stock alerts for sales persons"""
     try:
@@ -284,3 +423,33 @@ def get_low_stock_alerts():
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/reorder-suggestions', methods=['GET'])
+@conditional('sale', 'stock', daily=True)
+def get_reorder_suggestions():
+    """Get reorder points and suggested order quantities for every product"""
+    try:
+        history_days = min(max(request.args.get('history_days', 365, type=int), 7), 3 * 365)
+        lead_time_days = max(request.args.get('lead_time_days', 7, type=int), 1)
+        review_days = max(request.args.get('review_days', 7, type=int), 0)
+        service_level = min(max(request.args.get('service_level', 0.95, type=float), 0.5), 0.999)
+        method = request.args.get('method', 'seasonal')
+        if method not in ('seasonal', 'ewma'):
+            return jsonify({'error': 'method must be seasonal or ewma'}), 400
+
+        suggestions = reorder_suggestions(history_days, lead_time_days, review_days, service_level, method)
+        if request.args.get('only_needed', 'false').lower() == 'true':
+            suggestions = [item for item in suggestions if item['needs_reorder']]
+
+        return jsonify({
+            'suggestions': suggestions,
+            'total_reorders': sum(1 for item in suggestions if item['needs_reorder']),
+            'lead_time_days': lead_time_days,
+            'review_days': review_days,
+            'service_level': service_level,
+            'method': method,
+            'history_days': history_days
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -2,9 +2,27 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from flask_migrate import Migrate
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+import io
 import os
 from config import config
+from serializers import (
+    STOCK_FIELDS, SALE_FIELDS, columns, requested_fields, paginate, rows_response, build_payload, json_response
+)
+from sales_search import build_search_query, encode_cursor
+from ledger import record_movement
+from demand import record_sale_demand
+from business_time import business_today
+from money import to_paise, to_rupees
+from idempotency import idempotent, remember_response, take_claim, insert_claim, replay_claim
+from group_commit import sale_writer
+from cache import cache, cached_response
+from conditional import conditional
+from models import sale_business_days
+from search_index import (
+    stock_search_index, autocomplete_index, trigram_search_available, trigram_match, trigram_score
+)
 
 def create_app(config_name=None):
     app = Flask(__name__)
@@ -17,6 +35,9 @@ def create_app(config_name=None):
     from models import db, Stock, Sale, User
     from auth import auth_bp
     from analytics import analytics_bp
+    from sync import sync_bp
+    from ledger import ledger_bp
+    from exports import export_bp
 
     db.init_app(app)
     migrate = Migrate(app, db)
@@ -24,11 +45,15 @@ def create_app(config_name=None):
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    app.register_blueprint(ledger_bp, url_prefix='/api/inventory')
+    app.register_blueprint(export_bp, url_prefix='/api/export')
 
     # Configure CORS for GitHub Pages
     CORS(app, origins=app.config['CORS_ORIGINS'],
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-         allow_headers=['Content-Type', 'Authorization'])
+         allow_headers=['Content-Type', 'Authorization', 'Idempotency-Key'],
+         expose_headers=['Idempotent-Replayed', 'ETag'])
 
     return app, db, Stock, Sale
 
@@ -49,7 +74,11 @@ def home():
             "stock": "/api/stock",
             "sales": "/api/sales",
             "reports": "/api/reports",
-            "search": "/api/stock/search"
+            "search": "/api/stock/search",
+            "sales_search": "/api/sales/search",
+            "sync": "/api/sync",
+            "autocomplete": "/api/autocomplete",
+            "export": "/api/export"
         }
     })
 
@@ -57,11 +86,19 @@ def home():
 
 # Stock Management Endpoints
 @app.route('/api/stock', methods=['GET'])
+@conditional('stock')
+@cached_response('stock-list', 'stock')
 def get_stock():
-    stocks = Stock.query.all()
-    return jsonify([stock.to_dict() for stock in stocks])
+    try:
+        fields = requested_fields(STOCK_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = paginate(db.session.query(*columns(Stock, fields)), Stock).all()
+    return rows_response(fields, rows)
 
 @app.route('/api/stock', methods=['POST'])
+@idempotent
 def add_stock():
     data = request.get_json()
 
@@ -75,18 +112,23 @@ def add_stock():
         existing_stock.quantity += int(data['quantity'])
         existing_stock.date_added = datetime.utcnow()
         if 'unit_price' in data:
-            existing_stock.unit_price = float(data['unit_price'])
+            existing_stock.unit_price_paise = to_paise(data['unit_price'])
+        record_movement(existing_stock, 'receipt', int(data['quantity']))
     else:
         new_stock = Stock(
             product_name=data['product_name'],
             company_name=data['company_name'],
             quantity=int(data['quantity']),
-            unit_price=float(data.get('unit_price', 0.0))
+            unit_price_paise=to_paise(data.get('unit_price', 0))
         )
         db.session.add(new_stock)
+        record_movement(new_stock, 'receipt', new_stock.quantity)
 
+    response = jsonify({"message": "Stock added successfully"})
+    remember_response(response, 201)
     db.session.commit()
-    return jsonify({"message": "Stock added successfully"}), 201
+    cache.invalidate('stock')
+    return response, 201
 
 @app.route('/api/stock/<int:stock_id>', methods=['GET'])
 def get_stock_item(stock_id):
@@ -96,7 +138,7 @@ def get_stock_item(stock_id):
         'product_name': stock.product_name,
         'company_name': stock.company_name,
         'quantity': stock.quantity,
-        'unit_price': stock.unit_price
+        'unit_price': to_rupees(stock.unit_price_paise)
     })
 
 @app.route('/api/stock/<int:stock_id>', methods=['PUT'])
@@ -104,52 +146,89 @@ def update_stock(stock_id):
     stock = Stock.query.get_or_404(stock_id)
     data = request.get_json()
 
+    old_quantity = stock.quantity
     stock.product_name = data.get('product_name', stock.product_name)
     stock.company_name = data.get('company_name', stock.company_name)
     stock.quantity = int(data.get('quantity', stock.quantity))
 
     # Update unit_price if provided
     if 'unit_price' in data:
-        stock.unit_price = float(data.get('unit_price'))
+        stock.unit_price_paise = to_paise(data.get('unit_price'))
+
+    if stock.quantity != old_quantity:
+        record_movement(stock, 'adjustment', stock.quantity - old_quantity)
 
     db.session.commit()
+    cache.invalidate('stock')
     return jsonify({"message": "Stock updated successfully"})
 
 @app.route('/api/stock/<int:stock_id>', methods=['DELETE'])
 def delete_stock(stock_id):
     stock = Stock.query.get_or_404(stock_id)
+    record_movement(stock, 'delete', -stock.quantity)
     db.session.delete(stock)
     db.session.commit()
+    cache.invalidate('stock')
     return jsonify({"message": "Stock deleted successfully"})
 
+STOCK_FILTERS = {
+    'in-stock': (Stock.quantity > 0,),
+    'low-stock': (Stock.quantity > 0, Stock.quantity < 10),
+    'out-of-stock': (Stock.quantity == 0,),
+}
+
+def ranked_stock_ids(query, wanted, stock_filter):
+    """Best in-process index matches, fetching more until `wanted` of them pass the stock filter"""
+    fetch = wanted
+    while True:
+        ranked_ids = stock_search_index.search(query, fetch)
+        if not stock_filter or len(ranked_ids) < fetch:
+            return ranked_ids
+        matching = db.session.query(func.count(Stock.id)).filter(Stock.id.in_(ranked_ids), *stock_filter).scalar()
+        if matching >= wanted:
+            return ranked_ids
+        fetch *= 4
+
 @app.route('/api/stock/search', methods=['GET'])
+@conditional('stock')
+@cached_response('stock-search', 'stock')
 def search_stock():
     query = request.args.get('q', '').strip()
     filter_type = request.args.get('filter', 'all')
-    sort_by = request.args.get('sort', 'name')
+    sort_by = request.args.get('sort', 'relevance' if query else 'name')
+    top_k = app.config['SEARCH_TOP_K']
 
-    # Start with base query
-    stock_query = Stock.query
+    try:
+        fields = requested_fields(STOCK_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stock_filter = STOCK_FILTERS.get(filter_type, ())
 
-    # Apply text search
+    # Start with base query, selecting only the requested columns
+    stock_query = db.session.query(*columns(Stock, fields))
+
+    # Apply fuzzy text search: trigram indexes on PostgreSQL, in-process index elsewhere
+    relevance = None
     if query:
-        stock_query = stock_query.filter(
-            db.or_(
-                Stock.product_name.ilike(f'%{query}%'),
-                Stock.company_name.ilike(f'%{query}%')
-            )
-        )
+        if trigram_search_available():
+            stock_query = stock_query.filter(trigram_match(query))
+            relevance = trigram_score(query).desc()
+        else:
+            wanted = request.args.get('limit', top_k, type=int) + request.args.get('offset', 0, type=int)
+            ranked_ids = ranked_stock_ids(query, wanted, stock_filter)
+            if not ranked_ids:
+                return rows_response(fields, [])
+            stock_query = stock_query.filter(Stock.id.in_(ranked_ids))
+            relevance = case({stock_id: rank for rank, stock_id in enumerate(ranked_ids)}, value=Stock.id)
 
     # Apply filters
-    if filter_type == 'in-stock':
-        stock_query = stock_query.filter(Stock.quantity > 0)
-    elif filter_type == 'low-stock':
-        stock_query = stock_query.filter(Stock.quantity > 0, Stock.quantity < 10)
-    elif filter_type == 'out-of-stock':
-        stock_query = stock_query.filter(Stock.quantity == 0)
+    stock_query = stock_query.filter(*stock_filter)
 
     # Apply sorting
-    if sort_by == 'name':
+    if sort_by == 'relevance' and relevance is not None:
+        stock_query = stock_query.order_by(relevance)
+    elif sort_by == 'name':
         stock_query = stock_query.order_by(Stock.product_name)
     elif sort_by == 'company':
         stock_query = stock_query.order_by(Stock.company_name)
@@ -158,19 +237,67 @@ def search_stock():
     elif sort_by == 'date':
         stock_query = stock_query.order_by(Stock.date_added.desc())
 
-    stocks = stock_query.all()
-    return jsonify([stock.to_dict() for stock in stocks])
+    stock_query = paginate(stock_query, Stock)
+    if query and 'limit' not in request.args:
+        stock_query = stock_query.limit(top_k)
+
+    rows = stock_query.all()
+    return rows_response(fields, rows)
+
+@app.route('/api/autocomplete', methods=['GET'])
+def autocomplete():
+    kind = request.args.get('kind', 'product')
+    prefix = request.args.get('prefix', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+
+    if kind not in autocomplete_index.KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(autocomplete_index.KINDS)}"}), 400
+
+    return jsonify({
+        'kind': kind,
+        'prefix': prefix,
+        'suggestions': autocomplete_index.lookup(kind, prefix, limit)
+    })
 
 # Sales Management Endpoints
 @app.route('/api/sales', methods=['GET'])
+@conditional('sale')
 def get_sales():
-    sales = Sale.query.all()
-    return jsonify([sale.to_dict() for sale in sales])
+    rows = db.session.query(*columns(Sale, SALE_FIELDS)).all()
+    return rows_response(SALE_FIELDS, rows)
 
-@app.route('/api/sales', methods=['POST'])
-def record_sale():
-    data = request.get_json()
+@app.route('/api/sales/search', methods=['GET'])
+@conditional('sale')
+def search_sales():
+    try:
+        fields = requested_fields(SALE_FIELDS)
+        sales_query, sort_by, limit = build_search_query(request.args, fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = sales_query.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        sort_value, sale_id = rows[-1][-2:]
+        next_cursor = encode_cursor(sort_value, sale_id)
+
+    fmt = request.args.get('format', 'rows')
+    return json_response({
+        'sales': build_payload(fields, [row[:len(fields)] for row in rows], fmt),
+        'count': len(rows),
+        'sort': sort_by,
+        'has_more': has_more,
+        'next_cursor': next_cursor
+    })
 
+def apply_sale(data):
+    """Validate a sale and apply it to the session (sale row, stock deduction, ledger, demand) without committing.
+
+    Returns (payload, status); validation errors come back as a 400 payload before anything is written.
+    """
     # Check if enough stock is available
     stock = Stock.query.filter_by(
         product_name=data['product_name'],
@@ -178,15 +305,15 @@ def record_sale():
     ).first()
 
     if not stock:
-        return jsonify({"error": "Product not found in stock"}), 400
+        return {"error": "Product not found in stock"}, 400
 
     if stock.quantity < int(data['quantity_sold']):
-        return jsonify({"error": "Insufficient stock"}), 400
+        return {"error": "Insufficient stock"}, 400
 
-    # Calculate total amount from unit price and quantity
-    unit_price = float(data['unit_price'])
+    # Calculate total amount from unit price and quantity (exact, in paise)
+    unit_price_paise = to_paise(data['unit_price'])
     quantity_sold = int(data['quantity_sold'])
-    total_amount = unit_price * quantity_sold
+    total_amount_paise = unit_price_paise * quantity_sold
 
     # Get payment information
     payment_status = data.get('payment_status', 'unpaid')
@@ -199,55 +326,115 @@ def record_sale():
         company_name=data['company_name'],
         quantity_sold=quantity_sold,
         customer_name=data['customer_name'],
-        unit_price=unit_price,
-        sale_amount=total_amount,
+        unit_price_paise=unit_price_paise,
+        sale_amount_paise=total_amount_paise,
         payment_status=payment_status,
         payment_method=payment_method,
         payment_date=payment_date
     )
 
-    try:
-        # Update stock quantity
-        old_quantity = stock.quantity
-        stock.quantity -= int(data['quantity_sold'])
-        print(f"Stock update: {stock.product_name} - Old quantity: {old_quantity}, New quantity: {stock.quantity}")
-
-        # Add sale to session
-        db.session.add(new_sale)
+    # Update stock quantity
+    stock.quantity -= quantity_sold
 
-        # Commit both sale and stock update in single transaction
-        db.session.commit()
-        print(f"✅ Sale recorded and stock updated successfully - Sale ID: {new_sale.id}")
+    # Add sale to session and write the ledger entry against its id
+    db.session.add(new_sale)
+    db.session.flush()
+    record_movement(stock, 'sale', -quantity_sold, sale_id=new_sale.id)
+    record_sale_demand(stock.id, quantity_sold)
 
-    except Exception as e:
-        db.session.rollback()
-        print(f"❌ Error recording sale: {str(e)}")
-        return jsonify({"error": f"Failed to record sale: {str(e)}"}), 500
-
-    return jsonify({
+    return {
         "message": "Sale recorded successfully",
         "sale_id": new_sale.id,
         "customer_name": new_sale.customer_name,
         "product_name": new_sale.product_name,
         "company_name": new_sale.company_name,
         "quantity_sold": new_sale.quantity_sold,
-        "unit_price": new_sale.unit_price,
-        "sale_amount": new_sale.sale_amount,
+        "unit_price": to_rupees(new_sale.unit_price_paise),
+        "sale_amount": to_rupees(new_sale.sale_amount_paise),
         "payment_status": new_sale.payment_status,
         "payment_method": new_sale.payment_method
-    }), 201
+    }, 201
+
+def record_sale_grouped(data):
+    """Apply a sale on the group-commit writer, together with the request's Idempotency-Key"""
+    claim = take_claim()
+
+    def job():
+        record = insert_claim(claim) if claim else None
+        payload, status = apply_sale(data)
+        body = jsonify(payload).get_data()
+        if record is not None:
+            record.status_code = status
+            record.response_body = body
+        return body, status
+
+    try:
+        body, status = sale_writer.submit(job)
+        if status == 201:
+            cache.invalidate('sale', 'stock')
+    except Exception as e:
+        if claim and isinstance(e, IntegrityError):
+            # Another request with the same key committed first
+            return replay_claim(claim)
+        app.logger.error(f"Error recording sale: {str(e)}")
+        return jsonify({"error": f"Failed to record sale: {str(e)}"}), 500
+
+    return app.response_class(body, status=status, mimetype='application/json')
+
+@app.route('/api/sales', methods=['POST'])
+@idempotent
+def record_sale():
+    data = request.get_json()
+
+    if app.config['SALE_GROUP_COMMIT']:
+        return record_sale_grouped(data)
+
+    try:
+        payload, status = apply_sale(data)
+        response = jsonify(payload)
+        if status == 201:
+            # Commit sale, stock update, ledger, demand and the idempotency response in a single transaction
+            remember_response(response, status)
+            db.session.commit()
+            cache.invalidate('sale', 'stock')
+            app.logger.debug(f"Sale recorded and stock updated - Sale ID: {payload['sale_id']}")
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error recording sale: {str(e)}")
+        return jsonify({"error": f"Failed to record sale: {str(e)}"}), 500
+
+    return response, status
 
 # Get paid sales
 @app.route('/api/sales/paid', methods=['GET'])
+@conditional('sale')
 def get_paid_sales():
-    paid_sales = Sale.query.filter_by(payment_status='paid').order_by(Sale.sale_date.desc()).all()
-    return jsonify([sale.to_dict() for sale in paid_sales])
+    try:
+        fields = requested_fields(SALE_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    sales_query = db.session.query(*columns(Sale, fields)).filter(
+        Sale.payment_status == 'paid'
+    ).order_by(Sale.sale_date.desc())
+    rows = paginate(sales_query, Sale).all()
+    return rows_response(fields, rows)
 
 # Get unpaid sales
 @app.route('/api/sales/unpaid', methods=['GET'])
+@conditional('sale')
 def get_unpaid_sales():
-    unpaid_sales = Sale.query.filter_by(payment_status='unpaid').order_by(Sale.sale_date.desc()).all()
-    return jsonify([sale.to_dict() for sale in unpaid_sales])
+    try:
+        fields = requested_fields(SALE_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    sales_query = db.session.query(*columns(Sale, fields)).filter(
+        Sale.payment_status == 'unpaid'
+    ).order_by(Sale.sale_date.desc())
+    rows = paginate(sales_query, Sale).all()
+    return rows_response(fields, rows)
 
 # Update payment status
 @app.route('/api/sales/<int:sale_id>/payment', methods=['PUT'])
@@ -264,53 +451,59 @@ def update_payment_status(sale_id):
         sale.payment_date = None
 
     db.session.commit()
+    cache.invalidate('sale', f'sale:{sale_id}')
     return jsonify(sale.to_dict())
 
 # Get payment summary
 @app.route('/api/sales/payment-summary', methods=['GET'])
+@conditional('sale')
 def get_payment_summary():
-    paid_sales = Sale.query.filter_by(payment_status='paid').all()
-    unpaid_sales = Sale.query.filter_by(payment_status='unpaid').all()
-
-    paid_amount = sum(sale.sale_amount for sale in paid_sales)
-    unpaid_amount = sum(sale.sale_amount for sale in unpaid_sales)
+    totals = {
+        status: (count, int(amount or 0))
+        for status, count, amount in db.session.query(
+            Sale.payment_status, func.count(Sale.id), func.sum(Sale.sale_amount_paise)
+        ).filter(Sale.payment_status.in_(('paid', 'unpaid'))).group_by(Sale.payment_status)
+    }
+    paid_count, paid_amount = totals.get('paid', (0, 0))
+    unpaid_count, unpaid_amount = totals.get('unpaid', (0, 0))
     total_amount = paid_amount + unpaid_amount
 
     return jsonify({
-        'paid_count': len(paid_sales),
-        'unpaid_count': len(unpaid_sales),
-        'total_count': len(paid_sales) + len(unpaid_sales),
-        'paid_amount': paid_amount,
-        'unpaid_amount': unpaid_amount,
-        'total_amount': total_amount,
+        'paid_count': paid_count,
+        'unpaid_count': unpaid_count,
+        'total_count': paid_count + unpaid_count,
+        'paid_amount': to_rupees(paid_amount),
+        'unpaid_amount': to_rupees(unpaid_amount),
+        'total_amount': to_rupees(total_amount),
         'payment_percentage': (paid_amount / total_amount * 100) if total_amount > 0 else 0
     })
 
 @app.route('/api/sales/weekly', methods=['GET'])
+@conditional('sale', daily=True)
 def get_weekly_sales():
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=7)
+    # The last seven business days, today included
+    start_day = business_today() - timedelta(days=6)
 
-    sales = Sale.query.filter(
-        Sale.sale_date >= start_date,
-        Sale.sale_date <= end_date
+    rows = db.session.query(*columns(Sale, SALE_FIELDS)).filter(
+        sale_business_days(start_day)
     ).all()
 
-    return jsonify([sale.to_dict() for sale in sales])
+    return rows_response(SALE_FIELDS, rows)
 
 # Get today's sales
 @app.route('/api/sales/daily', methods=['GET'])
+@conditional('sale', daily=True)
 def get_daily_sales():
-    today = datetime.utcnow().date()
+    today = business_today()
 
-    # Get sales for today
+    # Get sales for today (business day in the shop's time zone)
     daily_sales = Sale.query.filter(
-        func.date(Sale.sale_date) == today
+        sale_business_days(today, today)
     ).order_by(Sale.sale_date.desc()).all()
 
     # Calculate daily totals
     total_sales = len(daily_sales)
-    total_revenue = sum(sale.sale_amount for sale in daily_sales)
+    total_revenue = sum(sale.sale_amount_paise for sale in daily_sales)
     paid_sales = [sale for sale in daily_sales if sale.payment_status == 'paid']
     unpaid_sales = [sale for sale in daily_sales if sale.payment_status == 'unpaid']
 
@@ -318,11 +511,11 @@ def get_daily_sales():
         'sales': [sale.to_dict() for sale in daily_sales],
         'summary': {
             'total_sales': total_sales,
-            'total_revenue': float(total_revenue),
+            'total_revenue': to_rupees(total_revenue),
             'paid_sales': len(paid_sales),
             'unpaid_sales': len(unpaid_sales),
-            'paid_amount': float(sum(sale.sale_amount for sale in paid_sales)),
-            'unpaid_amount': float(sum(sale.sale_amount for sale in unpaid_sales))
+            'paid_amount': to_rupees(sum(sale.sale_amount_paise for sale in paid_sales)),
+            'unpaid_amount': to_rupees(sum(sale.sale_amount_paise for sale in unpaid_sales))
         }
     })
 
@@ -359,32 +552,41 @@ def generate_date_report():
 def generate_receipt(sale_id):
     from pdf_generator import PDFGenerator
 
-    # Get sale data
-    sale = Sale.query.get_or_404(sale_id)
-
-    sale_data = {
-        'id': sale.id,
-        'product_name': sale.product_name,
-        'company_name': sale.company_name,
-        'quantity_sold': sale.quantity_sold,
-        'customer_name': sale.customer_name,
-        'unit_price': sale.unit_price,
-        'sale_amount': sale.sale_amount,
-        'payment_status': sale.payment_status,
-        'payment_method': sale.payment_method,
-        'payment_date': sale.payment_date.strftime('%Y-%m-%d %H:%M:%S') if sale.payment_date else None,
-        'sale_date': sale.sale_date.strftime('%Y-%m-%d %H:%M:%S')
-    }
+    def build_receipt():
+        # Get sale data
+        sale = Sale.query.get_or_404(sale_id)
+
+        sale_data = {
+            'id': sale.id,
+            'product_name': sale.product_name,
+            'company_name': sale.company_name,
+            'quantity_sold': sale.quantity_sold,
+            'customer_name': sale.customer_name,
+            'unit_price': to_rupees(sale.unit_price_paise),
+            'sale_amount': to_rupees(sale.sale_amount_paise),
+            'payment_status': sale.payment_status,
+            'payment_method': sale.payment_method,
+            'payment_date': sale.payment_date.strftime('%Y-%m-%d %H:%M:%S') if sale.payment_date else None,
+            'sale_date': sale.sale_date.strftime('%Y-%m-%d %H:%M:%S')
+        }
 
-    pdf_gen = PDFGenerator()
-    buffer = pdf_gen.generate_receipt(sale_data)
+        pdf_gen = PDFGenerator()
+        return pdf_gen.generate_receipt(sale_data).getvalue()
 
-    return send_file(
-        buffer,
+    # Receipts only change with the sale's payment status (update_payment_status)
+    pdf, outcome = cache.get_or_compute('receipt', str(sale_id), [f'sale:{sale_id}'], build_receipt)
+    response = send_file(
+        io.BytesIO(pdf),
         as_attachment=True,
         download_name=f'receipt_{sale_id}_{datetime.now().strftime("%Y%m%d")}.pdf',
         mimetype='application/pdf'
     )
+    response.headers['X-Cache'] = outcome
+    return response
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(cache.stats())
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
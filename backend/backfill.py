@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Batched online backfills for migrations
+
+A backfill walks a table in primary-key order, one batch of ids at a time.
+Each batch commits together with its checkpoint row in
+migration_checkpoint. Writes to the table are only held up for one batch,
+the pause between batches leaves room for normal traffic, and an
+interrupted run resumes after the last committed batch. Progress, rate and
+ETA are printed as it goes. Batch size and pause default to
+MIGRATION_BATCH_SIZE and MIGRATION_BATCH_SLEEP (seconds).
+
+Usage:
+    python backfill.py status           # list backfill checkpoints
+    python backfill.py reset <name>     # forget a checkpoint so that backfill runs again
+
+    # In a migration script:
+    from backfill import run_backfill, sql_batch
+    run_backfill(connection, 'sale.payment_status', 'sale',
+                 sql_batch("payment_status = 'unpaid'", "payment_status IS NULL"))
+"""
+
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import select, text
+from config import Config
+from models import MigrationCheckpoint
+
+checkpoints = MigrationCheckpoint.__table__
+
+def sql_batch(assignments, condition=None):
+    """Batch function running UPDATE <table> SET <assignments> [WHERE condition] over one id range"""
+    def apply(connection, table, low, high):
+        where = "id > :low AND id <= :high" + (f" AND ({condition})" if condition else '')
+        return connection.execute(
+            text(f"UPDATE {table} SET {assignments} WHERE {where}"), {'low': low, 'high': high}
+        ).rowcount
+    return apply
+
+def next_batch_end(connection, table, last_id, batch_size):
+    """Highest id among the next batch_size ids after last_id, or None past the end of the table"""
+    return connection.execute(text(
+        f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size) AS batch"
+    ), {'last_id': last_id, 'batch_size': batch_size}).scalar()
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def run_backfill(connection, name, table, apply_batch, batch_size=None, sleep=None):
+    """Run apply_batch(connection, table, low_id, high_id) over ids low_id < id <= high_id of `table`, batch by batch.
+
+    Resumes from checkpoint `name` and commits the connection after every
+    batch; returns the number of rows apply_batch reported changed.
+    """
+    batch_size = batch_size or Config.MIGRATION_BATCH_SIZE
+    sleep = Config.MIGRATION_BATCH_SLEEP if sleep is None else sleep
+
+    checkpoints.create(connection, checkfirst=True)
+    connection.commit()
+    checkpoint = connection.execute(select(checkpoints).where(checkpoints.c.name == name)).first()
+    if checkpoint is not None and checkpoint.finished_at is not None:
+        print(f"✅ {name} already backfilled ({checkpoint.rows_done} rows)")
+        return 0
+    if checkpoint is None:
+        connection.execute(checkpoints.insert().values(
+            name=name, table_name=table, last_id=0, rows_done=0, started_at=datetime.utcnow()
+        ))
+        connection.commit()
+        last_id = 0
+    else:
+        last_id = checkpoint.last_id
+        print(f"↪️ Resuming {name} after id {last_id}")
+
+    remaining = connection.execute(text(f"SELECT COUNT(*) FROM {table} WHERE id > :last_id"), {'last_id': last_id}).scalar()
+    started = time.perf_counter()
+    scanned = changed = batches = 0
+
+    while True:
+        high = next_batch_end(connection, table, last_id, batch_size)
+        if high is None:
+            break
+
+        count = apply_batch(connection, table, last_id, high)
+        connection.execute(checkpoints.update().where(checkpoints.c.name == name).values(
+            last_id=high, rows_done=checkpoints.c.rows_done + count, updated_at=datetime.utcnow()
+        ))
+        connection.commit()
+
+        last_id = high
+        changed += count
+        batches += 1
+        # Sales added since the count are covered too, the progress just stops at 100%
+        scanned = min(scanned + batch_size, remaining)
+        elapsed = time.perf_counter() - started
+        rate = scanned / elapsed if elapsed else 0
+        eta = (remaining - scanned) / rate if rate else 0
+        print(f"   - {name}: {scanned}/{remaining} rows ({scanned / max(remaining, 1):.0%}), "
+              f"{rate:.0f} rows/s, ETA {format_duration(eta)}   ", end='\r')
+        if sleep:
+            time.sleep(sleep)
+
+    connection.execute(checkpoints.update().where(checkpoints.c.name == name).values(finished_at=datetime.utcnow()))
+    connection.commit()
+    if batches:
+        print()
+    print(f"✅ {name}: {changed} rows updated in {format_duration(time.perf_counter() - started)}")
+    return changed
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        with database.engine.connect() as connection:
+            checkpoints.create(connection, checkfirst=True)
+            connection.commit()
+
+            if command == 'status':
+                for row in connection.execute(select(checkpoints).order_by(checkpoints.c.started_at)):
+                    state = f"done {row.finished_at:%Y-%m-%d %H:%M}" if row.finished_at else f"at id {row.last_id}"
+                    print(f"📋 {row.name} ({row.table_name}): {row.rows_done} rows, {state}")
+            elif command == 'reset' and len(sys.argv) > 2:
+                deleted = connection.execute(checkpoints.delete().where(checkpoints.c.name == sys.argv[2])).rowcount
+                connection.commit()
+                print(f"✅ Checkpoint {sys.argv[2]} reset" if deleted else f"❌ No checkpoint named {sys.argv[2]}")
+            else:
+                print(__doc__)
+                sys.exit(1)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for SRI LAKSHMI ENTERPRISES backend hot paths
+
+Usage:
+    python benchmark.py serialization --rows 100000
+    python benchmark.py explain-sales-search
+    python benchmark.py forecast --skus 10000 --days 1095
+    python benchmark.py top-products --sales 1000000 --seed
+    python benchmark.py weekly-report --sales 50000 --seed
+    python benchmark.py money-aggregates --rows 1000000
+    python benchmark.py group-commit --sales 2000 --clients 16
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+def timed(fn, repeat=3):
+    """Best wall-clock time of `repeat` runs, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def report(name, baseline, optimized):
+    print(f"{name}:")
+    print(f"   - baseline:  {baseline * 1000:9.1f} ms")
+    print(f"   - optimized: {optimized * 1000:9.1f} ms")
+    print(f"   - speedup:   {baseline / optimized:9.1f}x")
+
+def bench_serialization(args):
+    """to_dict + stdlib json vs column tuples + fast encoder"""
+    from models import Sale
+    from serializers import SALE_FIELDS, MONEY_FIELDS, build_payload, encode_json, orjson
+
+    now = datetime.utcnow()
+    rows = [
+        (i, f'Product {i % 500}', f'Company {i % 40}', i % 7 + 1, f'Customer {i % 3000}',
+         12550, 12550 * (i % 7 + 1), 'paid' if i % 3 else 'unpaid',
+         now if i % 3 else None, 'cash' if i % 3 else None, now - timedelta(minutes=i))
+        for i in range(args.rows)
+    ]
+    sales = [Sale(**{MONEY_FIELDS.get(field, field): value for field, value in zip(SALE_FIELDS, row)}) for row in rows]
+
+    def baseline():
+        json.dumps([sale.to_dict() for sale in sales])
+
+    def optimized():
+        encode_json(build_payload(SALE_FIELDS, rows))
+
+    def optimized_columns():
+        encode_json(build_payload(SALE_FIELDS, rows, 'columns'))
+
+    print(f"📊 Serializing {args.rows} sales (JSON backend: {'orjson' if orjson else 'stdlib json'})")
+    base = timed(baseline, args.repeat)
+    report('rows format', base, timed(optimized, args.repeat))
+    report('columns format', base, timed(optimized_columns, args.repeat))
+
+def bench_explain_sales_search(args):
+    """Check that the sales search filters are answered from the composite indexes"""
+    from werkzeug.datastructures import MultiDict
+    from app import app
+    from models import db
+    from sales_search import build_search_query, explain
+    from serializers import SALE_FIELDS
+
+    cases = [
+        ({'customer': 'Ravi'}, 'ix_sale_customer_date'),
+        ({'customer': 'Ravi', 'date_from': '2024-01-01', 'date_to': '2024-01-31'}, 'ix_sale_customer_date'),
+        ({'payment_status': 'unpaid'}, 'ix_sale_status_date'),
+        ({'payment_status': 'paid', 'date_from': '2024-01-01'}, 'ix_sale_status_date'),
+        ({'product': 'Urea', 'company': 'IFFCO'}, 'ix_sale_product_date'),
+        ({'date_from': '2024-01-01', 'date_to': '2024-01-07'}, 'ix_sale_date_covering'),
+    ]
+
+    failures = 0
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            # Small dev tables would otherwise always get a sequential scan
+            db.session.execute(db.text('SET enable_seqscan = off'))
+
+        for params, expected_index in cases:
+            query, _, _ = build_search_query(MultiDict(params), SALE_FIELDS)
+            plan = explain(query)
+            ok = expected_index in plan
+            failures += 0 if ok else 1
+            print(f"{'✅' if ok else '❌'} {params} -> expects {expected_index}")
+            if not ok or args.verbose:
+                print('   ' + plan.replace('\n', '\n   '))
+
+    print(f"📊 {len(cases) - failures}/{len(cases)} queries use the expected index")
+    if failures:
+        raise SystemExit(1)
+
+def bench_forecast(args):
+    """Batch reorder points vs a per-SKU Python loop over the same daily history"""
+    import numpy as np
+    from statistics import NormalDist
+    from forecasting import EWMA_SPAN, forecast_demand, order_quantities
+
+    rng = np.random.default_rng(42)
+    rates = rng.gamma(1.5, 4.0, size=(args.skus, 1))
+    matrix = rng.poisson(rates, size=(args.skus, args.days)).astype(np.float64)
+    on_hand = rng.integers(0, 200, size=args.skus).astype(np.float64)
+    lead_time, review = 7, 7
+    z = NormalDist().inv_cdf(0.95)
+    alpha = 2.0 / (EWMA_SPAN + 1)
+
+    def baseline():
+        # What a get_stock_movement-style loop per product looks like
+        for sku in range(args.skus):
+            history = matrix[sku].tolist()
+            rate, weight, total = 0.0, 1.0, 0.0
+            for value in reversed(history):
+                rate += weight * value
+                total += weight
+                weight *= 1 - alpha
+            rate /= total
+            recent = history[-90:]
+            mean = sum(recent) / len(recent)
+            sigma = (sum((value - mean) ** 2 for value in recent) / len(recent)) ** 0.5
+            reorder_point = rate * lead_time + z * sigma * lead_time ** 0.5
+            if on_hand[sku] <= reorder_point:
+                max(0, rate * (lead_time + review) + z * sigma * lead_time ** 0.5 - on_hand[sku])
+
+    def optimized():
+        forecast = forecast_demand(matrix, lead_time, review, 0.95, 'ewma')
+        order_quantities(forecast, on_hand)
+
+    print(f"📊 Reorder points for {args.skus} SKUs x {args.days} days")
+    report('ewma reorder points', timed(baseline, 1), timed(optimized, args.repeat))
+    seasonal = timed(lambda: forecast_demand(matrix, lead_time, review, 0.95, 'seasonal'), args.repeat)
+    print(f"seasonal-naive forecast: {seasonal * 1000:9.1f} ms")
+
+def seed_sales(count, days=365, batch_size=10000):
+    """Insert `count` synthetic sales spread over the last `days` days"""
+    import random
+    from models import db, Sale
+    from business_time import business_date
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    table = Sale.__table__
+    for offset in range(0, count, batch_size):
+        rows = []
+        for _ in range(min(batch_size, count - offset)):
+            quantity = rng.randint(1, 10)
+            price = rng.choice((12000, 26650, 35000, 135000))
+            paid = rng.random() < 0.7
+            sold_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+            rows.append({
+                'product_name': f'Product {int(rng.paretovariate(1.1)) % 2000}',
+                'company_name': f'Company {rng.randint(0, 39)}',
+                'quantity_sold': quantity,
+                'customer_name': f'Customer {int(rng.paretovariate(1.05)) % 20000}',
+                'unit_price_paise': price,
+                'sale_amount_paise': price * quantity,
+                'payment_status': 'paid' if paid else 'unpaid',
+                'payment_date': sold_at if paid else None,
+                'payment_method': 'cash' if paid else None,
+                'sale_date': sold_at,
+                'business_date': business_date(sold_at)
+            })
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        print(f"   - seeded {offset + len(rows)}/{count} sales", end='\r')
+    print()
+
+def bench_top_products(args):
+    """One ranked aggregation vs the former two GROUP BY queries per analytics endpoint"""
+    from sqlalchemy import case, desc, func
+    from app import app
+    from models import db, Sale
+    from analytics import top_products, customer_totals, window_start
+
+    def grouped(start_date, group_by, columns, order):
+        return db.session.query(*group_by, *columns).filter(
+            Sale.sale_date >= start_date
+        ).group_by(*group_by).order_by(desc(order)).limit(args.limit).all()
+
+    def baseline():
+        # The two queries each of top-selling-products and customer-analysis used to run
+        start_date = window_start(args.days)
+        products = (Sale.product_name, Sale.company_name)
+        product_totals = (
+            func.sum(Sale.quantity_sold).label('total_quantity'),
+            func.count(Sale.id).label('sale_count'),
+            func.sum(Sale.sale_amount_paise).label('total_revenue')
+        )
+        grouped(start_date, products, product_totals, 'total_quantity')
+        grouped(start_date, products, product_totals, 'total_revenue')
+        grouped(start_date, (Sale.customer_name,), (
+            func.sum(Sale.sale_amount_paise).label('total_spent'),
+            func.count(Sale.id),
+            func.sum(Sale.quantity_sold),
+            func.avg(Sale.sale_amount_paise)
+        ), 'total_spent')
+        grouped(start_date, (Sale.customer_name,), (
+            func.sum(case((Sale.payment_status == 'paid', Sale.sale_amount_paise), else_=0)),
+            func.sum(case((Sale.payment_status == 'unpaid', Sale.sale_amount_paise), else_=0)),
+            func.sum(Sale.sale_amount_paise).label('total_amount')
+        ), 'total_amount')
+
+    def optimized():
+        start_date = window_start(args.days)
+        top_products(start_date, args.limit)
+        customer_totals(start_date, args.limit)
+
+    with app.app_context():
+        if args.seed:
+            print(f"🌱 Seeding {args.sales} sales...")
+            seed_sales(args.sales)
+        total = db.session.query(func.count(Sale.id)).scalar()
+        print(f"📊 Top products and customers over {args.days} days of {total} sales")
+        report('top products + customers', timed(baseline, args.repeat), timed(optimized, args.repeat))
+
+def bench_weekly_report(args):
+    """Weekly report data from one ROLLUP query vs ORM objects grouped and totalled in Python"""
+    from sqlalchemy import func
+    from app import app
+    from models import db, Sale, sale_business_days
+    from business_time import business_today
+    from pdf_generator import PDFGenerator, weekly_report_rows
+
+    end_date = business_today()
+    start_date = end_date - timedelta(days=6)
+
+    def baseline():
+        # What generate_weekly_report_by_customer used to do before laying out tables
+        sales = Sale.query.filter(
+            sale_business_days(start_date, end_date)
+        ).order_by(Sale.customer_name, Sale.sale_date).all()
+        customer_sales = {}
+        for sale in sales:
+            customer_sales.setdefault(sale.customer_name, []).append(sale)
+        for customer_sale_list in customer_sales.values():
+            total_amount = paid_amount = unpaid_amount = 0
+            for sale in customer_sale_list:
+                total_amount += sale.sale_amount_paise
+                if sale.payment_status == 'paid':
+                    paid_amount += sale.sale_amount_paise
+                else:
+                    unpaid_amount += sale.sale_amount_paise
+        overall_total = sum(sale.sale_amount_paise for sale in sales)
+        overall_paid = sum(sale.sale_amount_paise for sale in sales if sale.payment_status == 'paid')
+        db.session.expunge_all()
+
+    def optimized():
+        weekly_report_rows(start_date, end_date, Sale.customer_name)
+
+    with app.app_context():
+        if args.seed:
+            print(f"🌱 Seeding {args.sales} sales over the last week...")
+            seed_sales(args.sales, days=7)
+        total = db.session.query(func.count(Sale.id)).filter(sale_business_days(start_date, end_date)).scalar()
+        print(f"📊 Weekly report by customer over {total} sales")
+        report('report data', timed(baseline, args.repeat), timed(optimized, args.repeat))
+        if args.pdf:
+            pdf_time = timed(lambda: PDFGenerator().generate_weekly_report_by_customer(), 1)
+            print(f"   - full PDF:  {pdf_time * 1000:9.1f} ms")
+
+def bench_money_aggregates(args):
+    """Grouped SUMs over integer paise vs the former float rupee columns, plus exactness"""
+    import random
+    from sqlalchemy import BigInteger, Column, Float, Integer, MetaData, String, Table, case, func, select
+    from app import app
+    from models import db
+
+    metadata = MetaData()
+    tables = {
+        'float rupees': Table('bench_money_float', metadata, Column('id', Integer, primary_key=True),
+                              Column('customer', String(100)), Column('status', String(20)), Column('amount', Float)),
+        'integer paise': Table('bench_money_paise', metadata, Column('id', Integer, primary_key=True),
+                               Column('customer', String(100)), Column('status', String(20)), Column('amount', BigInteger)),
+    }
+
+    def totals(table):
+        paid = func.sum(case((table.c.status == 'paid', table.c.amount), else_=0))
+        unpaid = func.sum(case((table.c.status == 'unpaid', table.c.amount), else_=0))
+        return db.session.execute(
+            select(table.c.customer, func.sum(table.c.amount), paid, unpaid).group_by(table.c.customer)
+        ).all()
+
+    with app.app_context():
+        metadata.drop_all(db.engine)
+        metadata.create_all(db.engine)
+        try:
+            rng = random.Random(42)
+            print(f"🌱 Inserting {args.rows} amounts into both tables...")
+            for offset in range(0, args.rows, 10000):
+                paise = [rng.randint(1, 500000) for _ in range(min(10000, args.rows - offset))]
+                rows = [{'customer': f'Customer {i % 2000}', 'status': 'paid' if i % 3 else 'unpaid'}
+                        for i in range(offset, offset + len(paise))]
+                db.session.execute(tables['float rupees'].insert(),
+                                   [dict(row, amount=amount / 100) for row, amount in zip(rows, paise)])
+                db.session.execute(tables['integer paise'].insert(),
+                                   [dict(row, amount=amount) for row, amount in zip(rows, paise)])
+                db.session.commit()
+
+            print(f"📊 SUM by customer with paid/unpaid split over {args.rows} rows")
+            base = timed(lambda: totals(tables['float rupees']), args.repeat)
+            report('grouped money sums', base, timed(lambda: totals(tables['integer paise']), args.repeat))
+
+            drift = sum(1 for _, total, paid, unpaid in totals(tables['float rupees']) if paid + unpaid != total)
+            exact = sum(1 for _, total, paid, unpaid in totals(tables['integer paise']) if paid + unpaid != total)
+            print(f"   - paid + unpaid != total: {drift} customers with floats, {exact} with paise")
+        finally:
+            db.session.rollback()
+            metadata.drop_all(db.engine)
+
+def bench_group_commit(args):
+    """Concurrent POST /api/sales with one commit per request vs the group-commit writer"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app import app
+    from models import db, Stock
+    from group_commit import sale_writer
+
+    sale = {'product_name': 'Benchmark Product', 'company_name': 'Benchmark Company',
+            'quantity_sold': 1, 'customer_name': 'Benchmark Customer', 'unit_price': 10}
+
+    with app.app_context():
+        if not Stock.query.filter_by(product_name=sale['product_name'], company_name=sale['company_name']).first():
+            db.session.add(Stock(product_name=sale['product_name'], company_name=sale['company_name'],
+                                 quantity=0, unit_price_paise=1000))
+        Stock.query.filter_by(product_name=sale['product_name']).update({'quantity': Stock.quantity + 2 * args.sales})
+        db.session.commit()
+
+    def post(_):
+        return app.test_client().post('/api/sales', json=sale).status_code
+
+    def run(group_commit):
+        app.config['SALE_GROUP_COMMIT'] = group_commit
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            statuses = list(pool.map(post, range(args.sales)))
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for status in statuses if status != 201)
+        print(f"   - {'group commit' if group_commit else 'per-request commit'}: "
+              f"{args.sales / elapsed:8.0f} sales/s ({failed} failed)")
+        return elapsed
+
+    print(f"📊 {args.sales} sales from {args.clients} concurrent clients")
+    base = run(False)
+    optimized = run(True)
+    report('recording sales', base, optimized)
+    if sale_writer.batches:
+        print(f"   - average batch: {sale_writer.jobs / sale_writer.batches:9.1f} sales")
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    serialization = subparsers.add_parser('serialization', help='List endpoint serialization')
+    serialization.add_argument('--rows', type=int, default=100000)
+    serialization.add_argument('--repeat', type=int, default=3)
+    serialization.set_defaults(func=bench_serialization)
+
+    explain_search = subparsers.add_parser('explain-sales-search', help='EXPLAIN the sales search queries')
+    explain_search.add_argument('--verbose', action='store_true')
+    explain_search.set_defaults(func=bench_explain_sales_search)
+
+    forecast = subparsers.add_parser('forecast', help='Vectorized reorder point computation')
+    forecast.add_argument('--skus', type=int, default=10000)
+    forecast.add_argument('--days', type=int, default=3 * 365)
+    forecast.add_argument('--repeat', type=int, default=3)
+    forecast.set_defaults(func=bench_forecast)
+
+    top = subparsers.add_parser('top-products', help='Exact top products and customers queries')
+    top.add_argument('--sales', type=int, default=1000000)
+    top.add_argument('--seed', action='store_true', help='Insert --sales synthetic sales first')
+    top.add_argument('--days', type=int, default=30)
+    top.add_argument('--limit', type=int, default=10)
+    top.add_argument('--repeat', type=int, default=3)
+    top.set_defaults(func=bench_top_products)
+
+    weekly = subparsers.add_parser('weekly-report', help='Weekly PDF report data query')
+    weekly.add_argument('--sales', type=int, default=50000)
+    weekly.add_argument('--seed', action='store_true', help='Insert --sales synthetic sales in the last week first')
+    weekly.add_argument('--repeat', type=int, default=3)
+    weekly.add_argument('--pdf', action='store_true', help='Also time rendering the whole PDF')
+    weekly.set_defaults(func=bench_weekly_report)
+
+    money = subparsers.add_parser('money-aggregates', help='Integer paise vs float money sums')
+    money.add_argument('--rows', type=int, default=1000000)
+    money.add_argument('--repeat', type=int, default=3)
+    money.set_defaults(func=bench_money_aggregates)
+
+    group = subparsers.add_parser('group-commit', help='Concurrent sale recording throughput')
+    group.add_argument('--sales', type=int, default=2000)
+    group.add_argument('--clients', type=int, default=16)
+    group.set_defaults(func=bench_group_commit)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
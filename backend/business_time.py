@@ -0,0 +1,29 @@
+"""
+Business day helpers.
+
+Timestamps are stored in UTC, but the shop's day runs in local time
+(BUSINESS_TIMEZONE, India Standard Time by default). Sale.business_date
+stores the local date of each sale so daily, weekly and monthly queries
+can compare dates directly against an index.
+"""
+
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from config import Config
+
+BUSINESS_TZ = ZoneInfo(Config.BUSINESS_TIMEZONE)
+
+def business_date(utc_datetime):
+    """Local business date of a naive UTC timestamp"""
+    return utc_datetime.replace(tzinfo=timezone.utc).astimezone(BUSINESS_TZ).date()
+
+def business_today():
+    return business_date(datetime.utcnow())
+
+def business_day_start(day):
+    """Naive UTC timestamp at which the business day `day` starts"""
+    local_midnight = datetime.combine(day, time.min, tzinfo=BUSINESS_TZ)
+    return local_midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+def business_days_ago(days):
+    return business_today() - timedelta(days=days)
@@ -0,0 +1,248 @@
+"""
+Read-through cache with write-driven invalidation
+
+Entries are stored together with the versions of the tags they depend on
+('stock', 'sale', 'sale:<id>'). Every write endpoint calls invalidate() with
+its tags after it has committed, which bumps those versions, so an entry
+computed before a write is never served after it. There is no TTL guessing:
+CACHE_TTL_SECONDS only bounds how long unused entries take up memory in Redis.
+Readers take the tag versions before they query the database, so a write
+that lands while an entry is being computed invalidates it too.
+
+Backends (CACHE_BACKEND):
+    lru     in-process least-recently-used store of CACHE_MAX_ENTRIES entries (default).
+            Tag versions live in the process, so use it with a single worker process.
+    redis   shared store on the Redis server at CACHE_REDIS_URL (needs the redis
+            package); invalidations reach every worker.
+    none    no caching.
+
+Hit, miss and stale (stored but invalidated) counts per namespace are served
+at /api/cache/stats.
+
+Usage:
+    from cache import cache, cached_response
+
+    pdf, status = cache.get_or_compute('receipt', str(sale_id), [f'sale:{sale_id}'], build_pdf)
+
+    @cached_response('stock-list', 'stock')   # GET view, keyed on path, query and Accept-Encoding
+    def get_stock(): ...
+
+    db.session.commit()
+    cache.invalidate('stock')                  # in the write endpoint, after the commit
+"""
+
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+from flask import current_app, request, make_response
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class NullBackend:
+    """Stores nothing"""
+    name = 'none'
+
+    def get(self, key):
+        return None
+
+    def set(self, key, item, ttl):
+        pass
+
+    def versions(self, tags):
+        return tuple(0 for _ in tags)
+
+    def bump(self, tags):
+        pass
+
+    def size(self):
+        return 0
+
+class LRUBackend:
+    """In-process least-recently-used store; tag versions are local to the process"""
+    name = 'lru'
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None:
+                self.entries.move_to_end(key)
+            return item
+
+    def set(self, key, item, ttl):
+        with self.lock:
+            self.entries[key] = item
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def versions(self, tags):
+        with self.lock:
+            return tuple(self.tags.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.tags[tag] = self.tags.get(tag, 0) + 1
+
+    def size(self):
+        return len(self.entries)
+
+class RedisBackend:
+    """Store on a Redis server shared by all worker processes"""
+    name = 'redis'
+    PREFIX = 'sle-cache:'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.client.get(f'{self.PREFIX}entry:{key}')
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, item, ttl):
+        self.client.set(f'{self.PREFIX}entry:{key}', pickle.dumps(item), ex=ttl)
+
+    def versions(self, tags):
+        keys = [f'{self.PREFIX}tag:{tag}' for tag in tags]
+        values = self.client.mget(keys)
+        for key, value in zip(keys, values):
+            if value is None:
+                # Start new (or evicted) tags at a fresh value so they cannot match
+                # the versions of entries stored before
+                self.client.set(key, time.time_ns(), nx=True)
+        if None in values:
+            values = self.client.mget(keys)
+        return tuple(int(value) for value in values)
+
+    def bump(self, tags):
+        pipeline = self.client.pipeline()
+        for tag in tags:
+            pipeline.incr(f'{self.PREFIX}tag:{tag}')
+        pipeline.execute()
+
+    def size(self):
+        return None
+
+class Cache:
+    """Tag-versioned read-through cache over the configured backend"""
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = None
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def get_backend(self):
+        if self.backend is None:
+            with self.lock:
+                if self.backend is None:
+                    config = current_app.config
+                    self.ttl = config.get('CACHE_TTL_SECONDS', 86400)
+                    kind = config.get('CACHE_BACKEND', 'lru')
+                    if kind == 'redis' and redis is None:
+                        print("⚠️ CACHE_BACKEND=redis but the redis package is not installed, using the in-process cache")
+                        kind = 'lru'
+                    if kind == 'redis':
+                        self.backend = RedisBackend(config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+                    elif kind == 'none':
+                        self.backend = NullBackend()
+                    else:
+                        self.backend = LRUBackend(config.get('CACHE_MAX_ENTRIES', 1024))
+        return self.backend
+
+    def count(self, namespace, outcome):
+        with self.lock:
+            self.counts[(namespace, outcome)] += 1
+
+    def versions(self, tags):
+        """Current versions of tags; take them before reading what will be stored under them"""
+        return self.get_backend().versions(tuple(tags))
+
+    def lookup(self, namespace, key, versions):
+        """(value, stored_at, current) of a stored entry, or None; current is False once a tag moved past `versions`"""
+        item = self.get_backend().get(f'{namespace}:{key}')
+        if item is None:
+            return None
+        value, stored_versions, stored_at = item
+        return value, stored_at, stored_versions == versions
+
+    def store(self, namespace, key, value, versions):
+        self.get_backend().set(f'{namespace}:{key}', (value, versions, time.time()), self.ttl)
+
+    def get_or_compute(self, namespace, key, tags, compute, cacheable=None):
+        """Stored value while none of its tags changed, else compute() and store it; returns (value, 'hit'|'miss')"""
+        versions = self.versions(tags)
+        found = self.lookup(namespace, key, versions)
+        if found is not None and found[2]:
+            self.count(namespace, 'hit')
+            return found[0], 'hit'
+
+        self.count(namespace, 'stale' if found is not None else 'miss')
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.store(namespace, key, value, versions)
+        return value, 'miss'
+
+    def invalidate(self, *tags):
+        """Drop every entry that depends on one of the tags (call after the write has committed)"""
+        self.get_backend().bump(tags)
+        with self.lock:
+            for tag in tags:
+                self.counts[('invalidations', tag)] += 1
+
+    def stats(self):
+        backend = self.get_backend()
+        with self.lock:
+            counts = dict(self.counts)
+        namespaces = {}
+        for (namespace, outcome), value in counts.items():
+            if namespace != 'invalidations':
+                namespaces.setdefault(namespace, {'hit': 0, 'miss': 0, 'stale': 0})[outcome] = value
+        for entry in namespaces.values():
+            lookups = entry['hit'] + entry['miss'] + entry['stale']
+            entry['hit_rate'] = round(entry['hit'] / lookups, 3) if lookups else None
+        return {
+            'backend': backend.name,
+            'entries': backend.size(),
+            'namespaces': namespaces,
+            'invalidations': {tag: value for (namespace, tag), value in counts.items() if namespace == 'invalidations'}
+        }
+
+cache = Cache()
+
+def response_key():
+    """Path, query parameters in any order and Accept-Encoding (responses may be compressed)"""
+    params = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+    return f"{request.path}?{params}|{request.headers.get('Accept-Encoding', '')}"
+
+def cached_response(namespace, *tags):
+    """Cache a GET view's successful responses until one of the tags is invalidated"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            def compute():
+                response = make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, response.mimetype, response.headers.get('Content-Encoding')
+
+            (body, status, mimetype, encoding), outcome = cache.get_or_compute(
+                namespace, response_key(), tags, compute, cacheable=lambda value: value[1] == 200
+            )
+            response = current_app.response_class(body, status=status, mimetype=mimetype)
+            response.headers['Vary'] = 'Accept-Encoding'
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.headers['X-Cache'] = outcome
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,123 @@
+"""
+Request coalescing (single-flight) with stale-while-revalidate
+
+For expensive read endpoints that several dashboards ask for at once.
+Requests for the same route with the same query parameters (in any order)
+share one computation: the first runs the view, the others wait for its
+response instead of running the same queries again. Successful responses are
+kept in the cache (cache.py) and served until one of the view's tags is
+invalidated by a write. After that the old response is still served straight
+away for up to ANALYTICS_STALE_SECONDS while one background request
+recomputes it, so a slow database never holds up a dashboard that has been
+rendered before (0 turns that off). Views whose windows move with the
+calendar (daily=True) are also keyed on the business date, so nothing
+computed before midnight is served after it. Responses are marked with an
+X-Cache header (miss, shared, hit or stale) and an Age header.
+"""
+
+import threading
+import time
+from functools import wraps
+from flask import request, current_app, make_response
+from cache import cache
+from business_time import business_today
+
+NAMESPACE = 'coalesced'
+
+class Flight:
+    """One running computation of a response, waited on by identical requests"""
+    __slots__ = ('done', 'entry')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+_lock = threading.Lock()
+_flights = {}
+
+def request_key(daily=False):
+    """Route and query parameters, independent of parameter order (daily: and the business date)"""
+    params = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+    key = f'{request.endpoint}?{params}'
+    return f'{key}@{business_today().isoformat()}' if daily else key
+
+def join(key):
+    """(flight, leader): the running flight for key, or a new one that the caller has to run"""
+    with _lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = Flight()
+        return flight, True
+
+def run(flight, key, tags, view, args, kwargs):
+    """Run the view for a flight, store a successful response and hand the result to waiting requests"""
+    try:
+        versions = cache.versions(tags)
+        response = make_response(view(*args, **kwargs))
+        flight.entry = (response.get_data(), response.status_code, response.mimetype), time.time()
+        if response.status_code == 200:
+            cache.store(NAMESPACE, key, flight.entry[0], versions)
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+    return flight.entry
+
+def revalidate(key, tags, view, args, kwargs):
+    """Recompute a stale response in the background, unless that is already happening"""
+    flight, leader = join(key)
+    if not leader:
+        return
+
+    app = current_app._get_current_object()
+    environ = dict(request.environ)
+
+    def refresh():
+        with app.request_context(environ):
+            try:
+                run(flight, key, tags, view, args, kwargs)
+            except Exception as e:
+                print(f"❌ Background refresh of {key} failed: {str(e)}")
+
+    threading.Thread(target=refresh, name=f'revalidate-{key}', daemon=True).start()
+
+def respond(entry, cache_status):
+    (body, status, mimetype), computed_at = entry
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    response.headers['X-Cache'] = cache_status
+    response.headers['Age'] = str(max(0, int(time.time() - computed_at)))
+    return response
+
+def coalesced(*tags, daily=False):
+    """Share one computation between identical concurrent requests, cached until a write invalidates one of the tags"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            stale = current_app.config.get('ANALYTICS_STALE_SECONDS', 120)
+            key = request_key(daily)
+
+            found = cache.lookup(NAMESPACE, key, cache.versions(tags))
+            if found is not None:
+                value, stored_at, current = found
+                if current:
+                    cache.count(NAMESPACE, 'hit')
+                    return respond((value, stored_at), 'hit')
+                cache.count(NAMESPACE, 'stale')
+                if time.time() - stored_at <= stale:
+                    revalidate(key, tags, view, args, kwargs)
+                    return respond((value, stored_at), 'stale')
+            else:
+                cache.count(NAMESPACE, 'miss')
+
+            flight, leader = join(key)
+            if leader:
+                return respond(run(flight, key, tags, view, args, kwargs), 'miss')
+
+            flight.done.wait()
+            if flight.entry is None:
+                # The shared computation raised, so this request runs on its own
+                return view(*args, **kwargs)
+            return respond(flight.entry, 'shared')
+        return wrapper
+    return decorator
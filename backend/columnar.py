@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Columnar snapshot of Sale and Stock for offline analytics
+
+A snapshot is a directory holding one raw little-endian file per column
+(<table>.<column>.bin) and a manifest.json with each column's NumPy dtype
+and row count. Product, company and customer names are dictionary-encoded
+into int32 codes shared by both tables, amounts are integer paise, and
+dates are datetime64. Loading memory-maps every column, so arrays come
+back zero-copy without parsing anything.
+
+Sales are appended one complete business day at a time: an update only
+reads the days after the last one written (today is left for the next
+run), so existing column files are never rewritten. Payment status is
+captured when a day is appended; rebuild to pick up later payments. Stock
+is small and written to a new generation of files on every update, and a
+rebuild writes sales and dictionaries as a new generation too. The manifest
+is switched to the new files last and the generation before is kept, so a
+reader that loaded the previous manifest still finds matching files.
+Updates take a lock file in the directory, so only one runs at a time.
+
+Usage:
+    python columnar.py update [directory]     # append new days (run nightly from cron)
+    python columnar.py rebuild [directory]    # rewrite from scratch
+
+    # In a notebook:
+    from columnar import load_snapshot, load_frame
+    tables, dictionaries = load_snapshot('snapshots')
+    sales = load_frame('snapshots', 'sales')    # pandas, with categorical names
+"""
+
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Backend modules are imported inside the functions that need them, so a
+# notebook can load snapshots with just NumPy (and pandas for load_frame).
+
+FORMAT_VERSION = 1
+BATCH_SIZE = 50000
+DICTIONARIES = ('product', 'company', 'customer')
+
+SALE_COLUMNS = {
+    'id': '<i8',
+    'sale_date': '<M8[s]',
+    'business_date': '<M8[D]',
+    'product': '<i4',
+    'company': '<i4',
+    'customer': '<i4',
+    'quantity': '<i4',
+    'unit_price_paise': '<i8',
+    'amount_paise': '<i8',
+    'paid': '|b1'
+}
+STOCK_COLUMNS = {
+    'id': '<i8',
+    'product': '<i4',
+    'company': '<i4',
+    'quantity': '<i4',
+    'unit_price_paise': '<i8'
+}
+
+def column_path(directory, table, column, generation=0):
+    if generation:
+        return os.path.join(directory, f'{table}.{generation}.{column}.bin')
+    return os.path.join(directory, f'{table}.{column}.bin')
+
+def dictionary_path(directory, kind, generation=0):
+    if generation:
+        return os.path.join(directory, f'{kind}.{generation}.dict.json')
+    return os.path.join(directory, f'{kind}.dict.json')
+
+def file_generation(name):
+    """Generation of a column or dictionary file name (0 for the unnumbered names)"""
+    parts = name.split('.')
+    return int(parts[1]) if len(parts) > 3 and parts[1].isdigit() else 0
+
+def read_manifest(directory):
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+def write_json(path, data):
+    """Write JSON atomically so readers never see a half-written file"""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(data, output)
+    os.replace(temporary, path)
+
+@contextmanager
+def update_lock(directory):
+    """Hold the directory's lock file; raises BlockingIOError while another update holds it"""
+    with open(os.path.join(directory, '.lock'), 'a+b') as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise BlockingIOError(f'A snapshot update is already running in {directory}')
+        yield
+
+class Dictionaries:
+    """Append-only string dictionaries; a name keeps its code for the life of the snapshot"""
+
+    def __init__(self, directory, generation=0):
+        self.directory = directory
+        self.generation = generation
+        self.values = {}
+        self.codes = {}
+        for kind in DICTIONARIES:
+            path = dictionary_path(directory, kind, generation)
+            values = []
+            if os.path.exists(path):
+                with open(path) as dictionary_file:
+                    values = json.load(dictionary_file)
+            self.values[kind] = values
+            self.codes[kind] = {value: code for code, value in enumerate(values)}
+
+    def encode(self, kind, names):
+        codes = self.codes[kind]
+        values = self.values[kind]
+        encoded = np.empty(len(names), dtype=np.int32)
+        for i, name in enumerate(names):
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(values)
+                values.append(name)
+            encoded[i] = code
+        return encoded
+
+    def save(self):
+        for kind in DICTIONARIES:
+            write_json(dictionary_path(self.directory, kind, self.generation), self.values[kind])
+
+def truncate_columns(directory, table, columns, rows, generation=0):
+    """Drop bytes past the manifest's row count, left behind by an interrupted append"""
+    for column, dtype in columns.items():
+        path = column_path(directory, table, column, generation)
+        size = rows * np.dtype(dtype).itemsize
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        elif os.path.getsize(path) != size:
+            os.truncate(path, size)
+
+def append_sales(directory, dictionaries, first_day, last_day, generation=0):
+    """Append sales of business days first_day..last_day to the column files; returns the row count"""
+    from models import db, Sale, sale_business_days
+    from sqlalchemy import select
+
+    statement = select(
+        Sale.id, Sale.sale_date, Sale.business_date, Sale.product_name, Sale.company_name,
+        Sale.customer_name, Sale.quantity_sold, Sale.unit_price_paise, Sale.sale_amount_paise, Sale.payment_status
+    ).where(
+        sale_business_days(first_day, last_day)
+    ).order_by(Sale.business_date, Sale.id).execution_options(yield_per=BATCH_SIZE)
+
+    files = {column: open(column_path(directory, 'sales', column, generation), 'ab') for column in SALE_COLUMNS}
+    appended = 0
+    try:
+        for rows in db.session.execute(statement).partitions():
+            ids, sale_dates, days, products, companies, customers, quantities, prices, amounts, statuses = zip(*rows)
+            batch = {
+                'id': np.array(ids, dtype=np.int64),
+                'sale_date': np.array(sale_dates, dtype='datetime64[s]'),
+                'business_date': np.array(days, dtype='datetime64[D]'),
+                'product': dictionaries.encode('product', products),
+                'company': dictionaries.encode('company', companies),
+                'customer': dictionaries.encode('customer', customers),
+                'quantity': np.array(quantities, dtype=np.int32),
+                'unit_price_paise': np.array(prices, dtype=np.int64),
+                'amount_paise': np.array(amounts, dtype=np.int64),
+                'paid': np.array([status == 'paid' for status in statuses], dtype=np.bool_)
+            }
+            for column, dtype in SALE_COLUMNS.items():
+                files[column].write(batch[column].astype(dtype, copy=False).tobytes())
+            appended += len(rows)
+    finally:
+        for column_file in files.values():
+            column_file.close()
+    return appended
+
+def write_stock(directory, dictionaries, generation):
+    """Write the stock columns from the current Stock table as files of `generation`; returns the row count"""
+    from models import db, Stock
+
+    rows = db.session.query(
+        Stock.id, Stock.product_name, Stock.company_name, Stock.quantity, Stock.unit_price_paise
+    ).order_by(Stock.id).all()
+    ids, products, companies, quantities, prices = zip(*rows) if rows else ((),) * 5
+    columns = {
+        'id': np.array(ids, dtype=np.int64),
+        'product': dictionaries.encode('product', products),
+        'company': dictionaries.encode('company', companies),
+        'quantity': np.array(quantities, dtype=np.int32),
+        'unit_price_paise': np.array([price or 0 for price in prices], dtype=np.int64)
+    }
+    for column, dtype in STOCK_COLUMNS.items():
+        path = column_path(directory, 'stock', column, generation)
+        with open(path + '.tmp', 'wb') as column_file:
+            column_file.write(columns[column].astype(dtype, copy=False).tobytes())
+        os.replace(path + '.tmp', path)
+    return len(rows)
+
+def remove_old_files(directory, names, generation):
+    """Delete the files of `names` (tables or dictionaries) older than the generation before `generation`"""
+    for name in os.listdir(directory):
+        parts = name.split('.')
+        if parts[0] not in names or parts[-1] not in ('bin', 'json'):
+            continue
+        if file_generation(name) < generation - 1:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass    # Still mapped by a reader on Windows; the next update retries
+
+def update_snapshot(directory, rebuild=False):
+    """Append complete business days since the last update (or rebuild) and rewrite stock"""
+    os.makedirs(directory, exist_ok=True)
+    with update_lock(directory):
+        return _update_snapshot(directory, rebuild)
+
+def _update_snapshot(directory, rebuild):
+    from models import db, Sale
+    from sqlalchemy import func
+    from business_time import business_today
+
+    previous = read_manifest(directory)
+    manifest = None if rebuild else previous
+    if manifest is None:
+        if previous is None:
+            # Nothing can be reading leftovers that no manifest points at
+            for name in os.listdir(directory):
+                if name.endswith(('.bin', '.json')):
+                    os.remove(os.path.join(directory, name))
+            generation, stock_generation = 0, 0
+        else:
+            # Rebuild next to the files the current manifest points at
+            generation = previous['tables']['sales'].get('generation', 0) + 1
+            stock_generation = previous['tables']['stock'].get('generation', 0)
+            for name in os.listdir(directory):
+                if name.split('.')[0] in ('sales',) + DICTIONARIES and file_generation(name) == generation:
+                    os.remove(os.path.join(directory, name))    # An interrupted rebuild
+        manifest = {
+            'format': FORMAT_VERSION,
+            'dictionaries': {
+                kind: os.path.basename(dictionary_path(directory, kind, generation)) for kind in DICTIONARIES
+            },
+            'tables': {
+                'sales': {'rows': 0, 'through_day': None, 'generation': generation, 'columns': SALE_COLUMNS},
+                'stock': {'rows': 0, 'generation': stock_generation, 'columns': STOCK_COLUMNS}
+            }
+        }
+
+    sales = manifest['tables']['sales']
+    generation = sales.get('generation', 0)
+    dictionaries = Dictionaries(directory, generation)
+    truncate_columns(directory, 'sales', SALE_COLUMNS, sales['rows'], generation)
+
+    last_day = business_today() - timedelta(days=1)
+    if sales['through_day'] is not None:
+        first_day = datetime.strptime(sales['through_day'], '%Y-%m-%d').date() + timedelta(days=1)
+    else:
+        first_day = db.session.query(func.min(Sale.business_date)).scalar()
+
+    appended = 0
+    if first_day is not None and first_day <= last_day:
+        appended = append_sales(directory, dictionaries, first_day, last_day, generation)
+        sales['through_day'] = last_day.isoformat()
+    sales['rows'] += appended
+
+    stock = manifest['tables']['stock']
+    stock['generation'] = stock.get('generation', 0) + 1
+    stock['rows'] = write_stock(directory, dictionaries, stock['generation'])
+    manifest['updated_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    # Dictionaries first: the manifest only ever points at codes and files that exist
+    dictionaries.save()
+    write_json(os.path.join(directory, 'manifest.json'), manifest)
+    remove_old_files(directory, ('sales',) + DICTIONARIES, generation)
+    remove_old_files(directory, ('stock',), stock['generation'])
+    return manifest, appended
+
+def load_snapshot(directory):
+    """({table: {column: memory-mapped array}}, {kind: names array}); arrays are read-only views of the files"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f'No columnar snapshot in {directory}')
+
+    tables = {}
+    for table, spec in manifest['tables'].items():
+        rows = spec['rows']
+        tables[table] = {
+            column: np.memmap(column_path(directory, table, column, spec.get('generation', 0)),
+                              dtype=dtype, mode='r', shape=(rows,))
+            if rows else np.empty(0, dtype=dtype)
+            for column, dtype in spec['columns'].items()
+        }
+
+    dictionaries = {}
+    for kind, filename in manifest['dictionaries'].items():
+        with open(os.path.join(directory, filename)) as dictionary_file:
+            dictionaries[kind] = np.array(json.load(dictionary_file), dtype=object)
+    return tables, dictionaries
+
+def load_frame(directory, table):
+    """pandas DataFrame of a snapshot table with names as categoricals (needs pandas)"""
+    import pandas as pd
+
+    tables, dictionaries = load_snapshot(directory)
+    data = {}
+    for column, values in tables[table].items():
+        if column in dictionaries:
+            data[column] = pd.Categorical.from_codes(values, categories=dictionaries[column])
+        else:
+            data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'update'
+    app, database, StockModel, SaleModel = create_app()
+    directory = sys.argv[2] if len(sys.argv) > 2 else app.config['SNAPSHOT_DIR']
+
+    with app.app_context():
+        if command in ('update', 'rebuild'):
+            print(f"🔄 {'Rebuilding' if command == 'rebuild' else 'Updating'} columnar snapshot in {directory}...")
+            try:
+                manifest, appended = update_snapshot(directory, rebuild=command == 'rebuild')
+            except BlockingIOError as e:
+                print(f"❌ {str(e)}")
+                sys.exit(1)
+            tables = manifest['tables']
+            print(f"✅ {appended} sales appended ({tables['sales']['rows']} total through "
+                  f"{tables['sales']['through_day']}), {tables['stock']['rows']} stock items")
+        else:
+            print(__doc__)
+            sys.exit(1)
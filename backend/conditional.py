@@ -0,0 +1,71 @@
+"""
+Conditional GET with ETags from table versions
+
+Every write to stock or sale stamps a change version (see sync.py), so the
+highest change_version of a table says whether anything in it changed. The
+ETag of a response is built from those versions (read with one indexed query)
+plus a short hash of the path, query parameters, Accept-Encoding and, for
+endpoints whose windows move with the calendar, the business date. The body
+is never hashed: a request whose If-None-Match still matches gets a 304
+before the view runs a query or serializes anything. Responses carry
+Cache-Control: no-cache so browsers revalidate every time instead of
+needing ?t=<timestamp> cache-busting.
+"""
+
+import hashlib
+from functools import wraps
+from flask import current_app, make_response, request
+from sqlalchemy import func, select
+from models import db, Stock, Sale, StockTombstone, ChangeCounter
+from business_time import business_today
+from sync import SALE_ARCHIVE_COUNTER, SEGMENTS_COUNTER
+
+# Table -> queries whose results together change whenever the table's rows do
+TABLE_VERSIONS = {
+    'stock': (
+        select(func.max(Stock.change_version)),
+        select(func.max(StockTombstone.change_version)),
+    ),
+    'sale': (
+        select(func.max(Sale.change_version)),
+        select(ChangeCounter.value).where(ChangeCounter.name == SALE_ARCHIVE_COUNTER),
+    ),
+    'segment': (
+        select(ChangeCounter.value).where(ChangeCounter.name == SEGMENTS_COUNTER),
+    ),
+}
+
+def table_versions(tables):
+    """Current versions of the tables, in one round trip"""
+    versions = [query.scalar_subquery() for table in tables for query in TABLE_VERSIONS[table]]
+    return tuple(version or 0 for version in db.session.execute(select(*versions)).one())
+
+def request_etag(tables, daily=False):
+    """Strong ETag for the current request: table versions plus a hash of what selects the representation"""
+    variant = [request.path, *sorted(f'{name}={value}' for name, value in request.args.items(multi=True)),
+               request.headers.get('Accept-Encoding', '')]
+    if daily:
+        variant.append(business_today().isoformat())
+    digest = hashlib.sha1('\n'.join(variant).encode('utf-8')).hexdigest()[:12]
+    return f"{'.'.join(str(version) for version in table_versions(tables))}-{digest}"
+
+def conditional(*tables, daily=False):
+    """Answer If-None-Match with 304 while none of the tables changed (daily: and the business date is the same)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = request_etag(tables, daily)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                # A stale or shared response (coalesce.py) may predate the versions in the ETag
+                if response.status_code != 200 or response.headers.get('X-Cache') in ('stale', 'shared'):
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
@@ -11,13 +11,61 @@ class Config:
     POSTGRES_PORT = os.getenv('POSTGRES_PORT', '5432')
     POSTGRES_DB = os.getenv('POSTGRES_DB', 'sri_lakshmi_db')
     
-    # SQLAlchemy Configuration
-    SQLALCHEMY_DATABASE_URI = f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
+    # SQLAlchemy Configuration (DATABASE_URL overrides, e.g. sqlite:///dev.db for local development)
+    SQLALCHEMY_DATABASE_URI = os.getenv(
+        'DATABASE_URL',
+        f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}'
+    )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Flask Configuration
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
     DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+
+    # Business day Configuration (sales are dated in this time zone)
+    BUSINESS_TIMEZONE = os.getenv('BUSINESS_TIMEZONE', 'Asia/Kolkata')
+
+    # Migration backfill Configuration (rows per batch and pause between batches, see backfill.py)
+    MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 5000))
+    MIGRATION_BATCH_SLEEP = float(os.getenv('MIGRATION_BATCH_SLEEP', 0.05))
+
+    # Money columns Configuration (keep writing the float rupee columns of the previous release
+    # until migrate_money_paise.py contract drops them; set to false before running contract)
+    MONEY_LEGACY_COLUMNS = os.getenv('MONEY_LEGACY_COLUMNS', 'True').lower() == 'true'
+
+    # Group commit Configuration (sales applied by one writer thread in batches, see group_commit.py)
+    SALE_GROUP_COMMIT = os.getenv('SALE_GROUP_COMMIT', 'False').lower() == 'true'
+    SALE_GROUP_COMMIT_MAX_BATCH = int(os.getenv('SALE_GROUP_COMMIT_MAX_BATCH', 50))
+    SALE_GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv('SALE_GROUP_COMMIT_MAX_WAIT_MS', 5))
+
+    # Idempotency-Key Configuration (how long keys are replayed and how often expired ones are purged)
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    IDEMPOTENCY_PURGE_SECONDS = float(os.getenv('IDEMPOTENCY_PURGE_SECONDS', 300))
+
+    # Sale partitioning Configuration (PostgreSQL, see partitions.py)
+    SALE_PARTITION_MONTHS_AHEAD = int(os.getenv('SALE_PARTITION_MONTHS_AHEAD', 3))
+    SALE_ARCHIVE_DIR = os.getenv('SALE_ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), 'archive'))
+
+    # Columnar snapshot Configuration (see columnar.py)
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'snapshots'))
+
+    # Search Configuration
+    SEARCH_TOP_K = int(os.getenv('SEARCH_TOP_K', 50))
+    SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', 2))
+    AUTOCOMPLETE_MAX_CUSTOMERS = int(os.getenv('AUTOCOMPLETE_MAX_CUSTOMERS', 50000))
+
+    # Cache Configuration (backend 'lru', 'redis' or 'none'; entries are invalidated by writes, see cache.py)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'lru')
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', 86400))
+
+    # Analytics response Configuration (how old a response may be to be served while it is refreshed, see coalesce.py)
+    ANALYTICS_STALE_SECONDS = float(os.getenv('ANALYTICS_STALE_SECONDS', 120))
+
+    # Approximate top-K (heavy hitters) Configuration
+    HEAVY_HITTERS_DAYS = int(os.getenv('HEAVY_HITTERS_DAYS', 90))
+    HEAVY_HITTERS_CAPACITY = int(os.getenv('HEAVY_HITTERS_CAPACITY', 200))
     
     # CORS Configuration for GitHub Pages
     CORS_ORIGINS = [
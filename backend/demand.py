@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Incremental per-SKU demand statistics
+
+Each sale adds to its SKU's running total for the current day. When a new
+day starts, the finished day (and any days without sales) is folded into
+exponentially weighted mean/variance of daily quantity and a weighted mean
+of daily transactions, once per horizon. Days without sales decay the
+statistics in closed form, so a read folds any gap since the last sale in
+constant time and velocity for any horizon is O(1) per SKU. Estimates count
+today's sales so far as one more day. The SKU's row is locked while a sale
+updates it, so concurrent sales of one SKU never lose each other's counts.
+
+Usage:
+    python demand.py rebuild    # recompute every SKU from the sales history
+"""
+
+import math
+import sys
+from datetime import datetime
+from models import db, Stock, Sale, DemandStat
+from sqlalchemy import func
+from business_time import business_date, business_today
+from sync import UPSERT_INSERT
+
+HORIZONS = (7, 30, 90)
+
+STAT_FIELDS = [f'{prefix}_{horizon}' for horizon in HORIZONS for prefix in ('qty_mean', 'qty_var', 'txn_mean')]
+
+def _alpha(horizon):
+    return 2.0 / (horizon + 1)
+
+def _fold(state, quantity, transactions, empty_days=0):
+    """Fold one finished day, then `empty_days` days without sales, into every horizon"""
+    for horizon in HORIZONS:
+        alpha = _alpha(horizon)
+        mean = state[f'qty_mean_{horizon}']
+        var = state[f'qty_var_{horizon}']
+        txn = state[f'txn_mean_{horizon}']
+
+        diff = quantity - mean
+        increment = alpha * diff
+        mean += increment
+        var = (1 - alpha) * (var + diff * increment)
+        txn += alpha * (transactions - txn)
+
+        # n zero days in closed form: the mean and transactions decay by (1-a)^n and
+        # the variance to (1-a)^n * (var + mean^2 * (1 - (1-a)^n))
+        decay = (1 - alpha) ** empty_days
+        var = decay * (var + mean * mean * (1 - decay))
+        mean *= decay
+        txn *= decay
+
+        state[f'qty_mean_{horizon}'] = mean
+        state[f'qty_var_{horizon}'] = var
+        state[f'txn_mean_{horizon}'] = txn
+
+def _state(stat):
+    return {field: getattr(stat, field) or 0.0 for field in STAT_FIELDS}
+
+def _new_stat(stock_id, day):
+    return DemandStat(stock_id=stock_id, current_day=day, day_quantity=0, day_transactions=0,
+                      **dict.fromkeys(STAT_FIELDS, 0.0))
+
+def _locked_stat(stock_id, day):
+    """The SKU's statistics row, created if missing and locked until the transaction ends"""
+    def load():
+        return db.session.get(DemandStat, stock_id, with_for_update=True, populate_existing=True)
+
+    stat = load()
+    if stat is None:
+        # Concurrent first sales of a SKU: one insert wins, the others wait for it and lock its row
+        table = DemandStat.__table__
+        db.session.execute(
+            UPSERT_INSERT[db.session.get_bind().dialect.name](table).values(
+                stock_id=stock_id, current_day=day, day_quantity=0, day_transactions=0,
+                **dict.fromkeys(STAT_FIELDS, 0.0)
+            ).on_conflict_do_nothing(index_elements=[table.c.stock_id])
+        )
+        stat = load()
+    return stat
+
+def _advance(stat, state, day):
+    """Fold the accumulated day and the gap up to (not including) `day`"""
+    if stat.current_day is None or day <= stat.current_day:
+        return False
+    gap = (day - stat.current_day).days - 1
+    _fold(state, stat.day_quantity or 0, stat.day_transactions or 0, gap)
+    return True
+
+def record_sale_demand(stock_id, quantity, sold_at=None):
+    """Update the SKU's demand statistics for a sale, inside the current transaction"""
+    sold_at = sold_at or datetime.utcnow()
+    day = business_date(sold_at)
+
+    stat = _locked_stat(stock_id, day)
+    state = _state(stat)
+    if _advance(stat, state, day):
+        for key, value in state.items():
+            setattr(stat, key, value)
+        stat.current_day = day
+        stat.day_quantity = 0
+        stat.day_transactions = 0
+
+    stat.day_quantity = (stat.day_quantity or 0) + quantity
+    stat.day_transactions = (stat.day_transactions or 0) + 1
+    stat.last_sale_at = sold_at
+    return stat
+
+def demand_estimate(stat, horizon, today=None):
+    """(velocity per day, standard deviation per day, transactions per day), counting today's sales so far"""
+    if stat is None:
+        return 0.0, 0.0, 0.0
+    today = today or business_today()
+    state = _state(stat)
+    _advance(stat, state, today)
+    if stat.current_day == today:
+        _fold(state, stat.day_quantity or 0, stat.day_transactions or 0)
+    return (
+        state[f'qty_mean_{horizon}'],
+        math.sqrt(max(state[f'qty_var_{horizon}'], 0.0)),
+        state[f'txn_mean_{horizon}']
+    )
+
+def nearest_horizon(days):
+    return min(HORIZONS, key=lambda horizon: abs(horizon - days))
+
+def rebuild():
+    """Recompute every SKU's statistics from daily sale totals in one grouped query"""
+    stock_ids = {
+        (product_name, company_name): stock_id
+        for stock_id, product_name, company_name in db.session.query(Stock.id, Stock.product_name, Stock.company_name)
+    }
+    daily = db.session.query(
+        Sale.product_name,
+        Sale.company_name,
+        Sale.business_date,
+        func.sum(Sale.quantity_sold),
+        func.count(Sale.id),
+        func.max(Sale.sale_date)
+    ).group_by(
+        Sale.product_name, Sale.company_name, Sale.business_date
+    ).order_by(
+        Sale.product_name, Sale.company_name, Sale.business_date
+    )
+
+    DemandStat.query.delete()
+    stats = {}
+    for product_name, company_name, day, quantity, transactions, last_sale_at in daily:
+        stock_id = stock_ids.get((product_name, company_name))
+        if stock_id is None:
+            continue
+
+        stat = stats.get(stock_id)
+        if stat is None:
+            stat = _new_stat(stock_id, day)
+            stats[stock_id] = stat
+            db.session.add(stat)
+
+        state = _state(stat)
+        if _advance(stat, state, day):
+            for key, value in state.items():
+                setattr(stat, key, value)
+            stat.current_day = day
+        stat.day_quantity = int(quantity)
+        stat.day_transactions = int(transactions)
+        stat.last_sale_at = last_sale_at
+
+    db.session.commit()
+    return len(stats)
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'rebuild'
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if command == 'rebuild':
+            print("🔄 Rebuilding demand statistics from sales history...")
+            count = rebuild()
+            print(f"✅ Demand statistics rebuilt for {count} SKUs")
+        else:
+            print(__doc__)
+            sys.exit(1)
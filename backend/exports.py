@@ -0,0 +1,154 @@
+"""
+Streaming exports of sales and stock for accounting, and the columnar
+snapshot used for offline analytics (see columnar.py).
+
+Rows are read in batches through a server-side cursor (yield_per, which
+turns on stream_results on PostgreSQL) and written out as CSV or NDJSON as
+they arrive, optionally gzip-compressed on the fly, so memory use stays
+flat however many rows are exported.
+"""
+
+import csv
+import io
+import os
+import time
+import zlib
+from datetime import datetime
+from flask import Blueprint, Response, current_app, request, jsonify, send_from_directory, stream_with_context
+from models import db, Sale, Stock
+from serializers import STOCK_FIELDS, SALE_FIELDS, columns, requested_fields, rows_to_columns, build_payload, encode_json
+from sales_search import parse_date
+from sqlalchemy import select
+from columnar import read_manifest, update_snapshot
+
+export_bp = Blueprint('export', __name__)
+
+BATCH_SIZE = 5000
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def encode_batch(fields, rows, fmt):
+    """CSV or NDJSON bytes for a batch of row tuples"""
+    if fmt == 'ndjson':
+        return b''.join(encode_json(item) + b'\n' for item in build_payload(fields, rows))
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(zip(*rows_to_columns(fields, rows)))
+    return buffer.getvalue().encode('utf-8')
+
+def stream_rows(name, fields, statement, fmt, gzip_output):
+    """Generator of encoded (and optionally gzipped) chunks, logging throughput when done"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_output else None
+    started = time.perf_counter()
+    count = 0
+
+    def output(chunk):
+        return compressor.compress(chunk) if compressor else chunk
+
+    if fmt == 'csv':
+        header = io.StringIO()
+        csv.writer(header).writerow(fields)
+        yield output(header.getvalue().encode('utf-8'))
+
+    result = db.session.execute(statement.execution_options(yield_per=BATCH_SIZE))
+    for rows in result.partitions():
+        count += len(rows)
+        chunk = output(encode_batch(fields, rows, fmt))
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+    elapsed = time.perf_counter() - started
+    print(f"📤 Exported {count} {name} rows in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/s)")
+
+def export_response(name, fields, statement):
+    """Streaming attachment response for ?format=csv|ndjson and ?compress=gzip"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(FORMATS)}"}), 400
+    gzip_output = request.args.get('compress') == 'gzip'
+
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d')}.{fmt}" + ('.gz' if gzip_output else '')
+    response = Response(
+        stream_with_context(stream_rows(name, fields, statement, fmt, gzip_output)),
+        mimetype='application/gzip' if gzip_output else FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Let proxies pass chunks through instead of buffering the whole export
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@export_bp.route('/sales', methods=['GET'])
+def export_sales():
+    """Stream sales filtered by date range, customer, product or payment status"""
+    try:
+        fields = requested_fields(SALE_FIELDS)
+        statement = select(*columns(Sale, fields))
+
+        if request.args.get('date_from'):
+            statement = statement.where(Sale.sale_date >= parse_date(request.args['date_from']))
+        if request.args.get('date_to'):
+            statement = statement.where(Sale.sale_date < parse_date(request.args['date_to'], end_of_day=True))
+        if request.args.get('customer'):
+            statement = statement.where(Sale.customer_name == request.args['customer'])
+        if request.args.get('product'):
+            statement = statement.where(Sale.product_name == request.args['product'])
+        if request.args.get('company'):
+            statement = statement.where(Sale.company_name == request.args['company'])
+        if request.args.get('payment_status'):
+            statement = statement.where(Sale.payment_status == request.args['payment_status'])
+
+        return export_response('sales', fields, statement.order_by(Sale.sale_date, Sale.id))
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/stock', methods=['GET'])
+def export_stock():
+    """Stream stock items, optionally filtered by product or company"""
+    try:
+        fields = requested_fields(STOCK_FIELDS)
+        statement = select(*columns(Stock, fields))
+
+        if request.args.get('product'):
+            statement = statement.where(Stock.product_name == request.args['product'])
+        if request.args.get('company'):
+            statement = statement.where(Stock.company_name == request.args['company'])
+
+        return export_response('stock', fields, statement.order_by(Stock.id))
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/snapshot', methods=['GET'])
+def get_snapshot_manifest():
+    """Get the columnar snapshot manifest (tables, column dtypes and row counts)"""
+    manifest = read_manifest(current_app.config['SNAPSHOT_DIR'])
+    if manifest is None:
+        return jsonify({'error': 'No snapshot yet, POST /api/export/snapshot to create one'}), 404
+    return jsonify(manifest), 200
+
+@export_bp.route('/snapshot', methods=['POST'])
+def create_snapshot():
+    """Append new business days to the columnar snapshot (?rebuild=true rewrites it)"""
+    try:
+        rebuild = request.args.get('rebuild', 'false').lower() == 'true'
+        manifest, appended = update_snapshot(current_app.config['SNAPSHOT_DIR'], rebuild=rebuild)
+        return jsonify({'message': 'Snapshot updated', 'appended_sales': appended, 'manifest': manifest}), 200
+
+    except BlockingIOError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/snapshot/files/<path:filename>', methods=['GET'])
+def download_snapshot_file(filename):
+    """Download one snapshot file (manifest, dictionary or column)"""
+    if os.path.basename(filename) != filename or not filename.endswith(('.bin', '.json')):
+        return jsonify({'error': 'Unknown snapshot file'}), 404
+    return send_from_directory(current_app.config['SNAPSHOT_DIR'], filename, as_attachment=True)
@@ -0,0 +1,156 @@
+"""
+Vectorized demand forecasting and reorder points for every SKU at once.
+
+Daily quantities for all SKUs are loaded with one grouped query (from the
+daily rollup when it has been built) into a SKU x day NumPy matrix. EWMA and
+seasonal-naive forecasts, safety stock and reorder points are then computed
+for all SKUs with array operations instead of a Python loop per product.
+"""
+
+from datetime import datetime, timedelta
+from statistics import NormalDist
+import numpy as np
+from models import db, Stock, Sale, SaleDailyRollup
+from sqlalchemy import func
+from rollup import rollup_version, sale_day, parse_day
+from business_time import business_today
+
+EWMA_SPAN = 28
+SEASON_LENGTH = 7
+SEASON_WEEKS = 4
+
+_cache = {}
+
+def load_daily_matrix(history_days, today=None):
+    """Stock rows and a (SKUs x days) matrix of quantity sold per day, oldest day first"""
+    today = today or business_today()
+    start = today - timedelta(days=history_days)
+
+    stocks = db.session.query(
+        Stock.id, Stock.product_name, Stock.company_name, Stock.quantity
+    ).order_by(Stock.id).all()
+    sku_index = {(stock.product_name, stock.company_name): i for i, stock in enumerate(stocks)}
+
+    if rollup_version() is not None:
+        daily = db.session.query(
+            SaleDailyRollup.product_name,
+            SaleDailyRollup.company_name,
+            SaleDailyRollup.day,
+            func.sum(SaleDailyRollup.quantity)
+        ).filter(
+            SaleDailyRollup.day >= start, SaleDailyRollup.day < today
+        ).group_by(
+            SaleDailyRollup.product_name, SaleDailyRollup.company_name, SaleDailyRollup.day
+        )
+    else:
+        day = sale_day()
+        daily = db.session.query(
+            Sale.product_name, Sale.company_name, day, func.sum(Sale.quantity_sold)
+        ).filter(
+            day >= start, day < today
+        ).group_by(Sale.product_name, Sale.company_name, day)
+
+    rows, cols, values = [], [], []
+    for product_name, company_name, day_value, quantity in daily:
+        index = sku_index.get((product_name, company_name))
+        if index is None:
+            continue
+        rows.append(index)
+        cols.append((parse_day(day_value) - start).days)
+        values.append(quantity or 0)
+
+    matrix = np.zeros((len(stocks), history_days), dtype=np.float64)
+    if rows:
+        np.add.at(matrix, (np.array(rows), np.array(cols)), np.array(values, dtype=np.float64))
+    return stocks, matrix
+
+def ewma(matrix, span=EWMA_SPAN):
+    """Exponentially weighted mean of each row, most recent day weighted highest"""
+    alpha = 2.0 / (span + 1)
+    days = matrix.shape[1]
+    weights = (1 - alpha) ** np.arange(days - 1, -1, -1)
+    return matrix @ weights / weights.sum() if days else np.zeros(matrix.shape[0])
+
+def seasonal_naive(matrix, horizon):
+    """Demand over the next `horizon` days from the average weekday profile of the last weeks"""
+    weeks = min(SEASON_WEEKS, matrix.shape[1] // SEASON_LENGTH)
+    if weeks == 0:
+        return ewma(matrix) * horizon
+    recent = matrix[:, -weeks * SEASON_LENGTH:].reshape(matrix.shape[0], weeks, SEASON_LENGTH)
+    profile = recent.mean(axis=1)
+    # The window is a whole number of weeks ending yesterday, so profile[:, 0]
+    # falls on the same weekday as today, the first day being forecast
+    repeats = -(-horizon // SEASON_LENGTH)
+    return np.tile(profile, repeats)[:, :horizon].sum(axis=1)
+
+def forecast_demand(matrix, lead_time_days=7, review_days=7, service_level=0.95, method='seasonal'):
+    """Forecast demand, safety stock and reorder points for every SKU (row) of the matrix"""
+    z = NormalDist().inv_cdf(service_level)
+    cover_days = lead_time_days + review_days
+
+    daily_rate = ewma(matrix)
+    if method == 'ewma':
+        lead_demand = daily_rate * lead_time_days
+        cover_demand = daily_rate * cover_days
+    else:
+        lead_demand = seasonal_naive(matrix, lead_time_days)
+        cover_demand = seasonal_naive(matrix, cover_days)
+
+    window = matrix[:, -90:]
+    sigma = window.std(axis=1) if window.shape[1] else np.zeros(matrix.shape[0])
+    safety_stock = z * sigma * np.sqrt(lead_time_days)
+
+    return {
+        'daily_rate': daily_rate,
+        'lead_time_demand': lead_demand,
+        'cover_demand': cover_demand,
+        'safety_stock': safety_stock,
+        'reorder_point': lead_demand + safety_stock
+    }
+
+def order_quantities(forecast, on_hand):
+    """Units to order so stock covers lead time plus review period; zero above the reorder point"""
+    quantity = np.maximum(0, np.ceil(forecast['cover_demand'] + forecast['safety_stock'] - on_hand))
+    return np.where(on_hand <= forecast['reorder_point'], quantity, 0)
+
+def reorder_suggestions(history_days=365, lead_time_days=7, review_days=7,
+                        service_level=0.95, method='seasonal'):
+    """Reorder suggestions for every SKU; forecasts are cached until the rollup advances"""
+    key = (history_days, lead_time_days, review_days, service_level, method,
+           rollup_version(), business_today())
+    cached = _cache.get(key)
+    if cached is None:
+        stocks, matrix = load_daily_matrix(history_days)
+        cached = ({stock.id: i for i, stock in enumerate(stocks)},
+                  forecast_demand(matrix, lead_time_days, review_days, service_level, method))
+        _cache.clear()
+        _cache[key] = cached
+    positions, forecast = cached
+
+    # On-hand quantities move with every sale, so they are always read fresh
+    stocks = db.session.query(
+        Stock.id, Stock.product_name, Stock.company_name, Stock.quantity
+    ).order_by(Stock.id).all()
+    rows = np.array([positions.get(stock.id, -1) for stock in stocks], dtype=np.int64)
+    known = rows >= 0
+    current = {name: np.where(known, values[np.maximum(rows, 0)], 0.0) if len(values) else np.zeros(len(stocks))
+               for name, values in forecast.items()}
+    on_hand = np.array([stock.quantity for stock in stocks], dtype=np.float64)
+    to_order = order_quantities(current, on_hand)
+
+    suggestions = []
+    for i, stock in enumerate(stocks):
+        suggestions.append({
+            'stock_id': stock.id,
+            'product_name': stock.product_name,
+            'company_name': stock.company_name,
+            'current_stock': int(stock.quantity),
+            'daily_forecast': round(float(current['daily_rate'][i]), 2),
+            'lead_time_demand': round(float(current['lead_time_demand'][i]), 2),
+            'safety_stock': round(float(current['safety_stock'][i]), 2),
+            'reorder_point': round(float(current['reorder_point'][i]), 2),
+            'suggested_order_quantity': int(to_order[i]),
+            'needs_reorder': bool(to_order[i] > 0)
+        })
+    suggestions.sort(key=lambda item: (not item['needs_reorder'], -item['suggested_order_quantity']))
+    return suggestions
@@ -0,0 +1,108 @@
+"""
+Group commit for bursts of concurrent writes
+
+With SALE_GROUP_COMMIT on, sale requests hand their work to one writer thread
+per process instead of committing on their own. The writer takes up to
+SALE_GROUP_COMMIT_MAX_BATCH queued jobs, waiting at most
+SALE_GROUP_COMMIT_MAX_WAIT_MS for more after the first, runs each job in its
+own savepoint and commits the batch once: one commit (and fsync) for the
+whole batch instead of one per sale. A job that fails rolls back only its
+savepoint and gets its own error; a failed commit fails every job of the
+batch. Requests only get their reply after the commit, so a 201 still means
+the sale is durable.
+"""
+
+import queue
+import threading
+import time
+from flask import current_app
+from models import db
+
+class PendingJob:
+    """A queued job and, once its batch is committed, its result or error"""
+    __slots__ = ('job', 'done', 'result', 'error')
+
+    def __init__(self, job):
+        self.job = job
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class GroupCommitWriter:
+    """Single writer thread applying queued jobs in batches, one savepoint per job and one commit per batch"""
+
+    def __init__(self, name, max_batch_setting, max_wait_setting):
+        self.name = name
+        self.max_batch_setting = max_batch_setting
+        self.max_wait_setting = max_wait_setting
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+
+    def submit(self, job):
+        """Run job() in the writer's session; returns its result once the batch holding it has committed"""
+        self.start(current_app._get_current_object())
+        pending = PendingJob(job)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def start(self, app):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, args=(app,), name=self.name, daemon=True)
+                self.thread.start()
+
+    def collect(self, max_batch, max_wait):
+        """Block for the first job, then gather more until the batch is full or max_wait has passed"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch:
+            try:
+                timeout = deadline - time.monotonic()
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, app):
+        max_batch = app.config.get(self.max_batch_setting, 50)
+        max_wait = app.config.get(self.max_wait_setting, 5) / 1000
+        while True:
+            batch = self.collect(max_batch, max_wait)
+            try:
+                with app.app_context():
+                    self.apply(batch)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = pending.error or e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def apply(self, batch):
+        for pending in batch:
+            try:
+                with db.session.begin_nested():
+                    pending.result = pending.job()
+            except Exception as e:
+                pending.error = e
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Group commit of {len(batch)} jobs failed: {str(e)}")
+            for pending in batch:
+                pending.error = pending.error or e
+                pending.result = None
+            return
+
+        self.batches += 1
+        self.jobs += len(batch)
+
+sale_writer = GroupCommitWriter('sale-writer', 'SALE_GROUP_COMMIT_MAX_BATCH', 'SALE_GROUP_COMMIT_MAX_WAIT_MS')
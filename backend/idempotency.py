@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Idempotency keys for write endpoints
+
+A client that may retry POST /api/stock or POST /api/sales sends an
+Idempotency-Key header (any unique string, e.g. a UUID per submitted form).
+The first request with a key is applied and its response stored; retries with
+the same key get the stored response back (with Idempotent-Replayed: true)
+instead of adding or deducting stock a second time. The key row and the
+response (see remember_response) are written in the same transaction as the
+sale or stock change, so a write that rolls back leaves the key free for the
+retry and a committed write always has its response to replay.
+
+Keys are stored as a truncated SHA-256 of method, path and key, expire after
+IDEMPOTENCY_KEY_TTL_HOURS and are purged in the background of normal requests
+at most every IDEMPOTENCY_PURGE_SECONDS.
+
+Usage:
+    python idempotency.py purge     # delete all expired keys now
+"""
+
+import hashlib
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import g, request, jsonify, make_response, current_app
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+PURGE_BATCH_SIZE = 1000
+
+_purge_lock = threading.Lock()
+_next_purge = 0
+
+def digest(data):
+    """16-byte SHA-256 prefix; plenty to tell keys apart and half the index size of the full hash"""
+    return hashlib.sha256(data).digest()[:16]
+
+def purge_expired(now=None):
+    """Delete expired keys in batches, returns the number deleted"""
+    now = now or datetime.utcnow()
+    deleted = 0
+    while True:
+        batch = select(IdempotencyKey.key_hash).where(
+            IdempotencyKey.expires_at <= now
+        ).limit(PURGE_BATCH_SIZE).scalar_subquery()
+        count = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key_hash.in_(batch))).rowcount
+        db.session.commit()
+        deleted += count
+        if count < PURGE_BATCH_SIZE:
+            return deleted
+
+def purge_if_due():
+    """Purge expired keys when this process has not done so for IDEMPOTENCY_PURGE_SECONDS"""
+    global _next_purge
+    if time.monotonic() < _next_purge or not _purge_lock.acquire(blocking=False):
+        return
+    try:
+        _next_purge = time.monotonic() + current_app.config.get('IDEMPOTENCY_PURGE_SECONDS', 300)
+        purge_expired()
+    finally:
+        _purge_lock.release()
+
+def replay(record, request_hash):
+    """Stored response for a key that was already used"""
+    if record is None or record.status_code is None:
+        response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+    if record.request_hash != request_hash:
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+
+    response = current_app.response_class(record.response_body, status=record.status_code, mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+def remember_response(response, status):
+    """Put the response on the current request's key before the view commits its write; no-op without a key"""
+    record = g.get('idempotency_record')
+    if record is not None:
+        record.status_code = status
+        record.response_body = response.get_data()
+
+def take_claim():
+    """Take the current request's key out of its session, for a write committed by another session (see group_commit.py)
+
+    Returns the key's column values to pass to insert_claim, or None without an Idempotency-Key.
+    """
+    record = g.pop('idempotency_record', None)
+    if record is None:
+        return None
+    claim = {
+        'key_hash': record.key_hash, 'request_hash': record.request_hash,
+        'created_at': record.created_at, 'expires_at': record.expires_at
+    }
+    db.session.rollback()
+    return claim
+
+def insert_claim(claim):
+    """Insert a taken key in the current session; raises IntegrityError when it has been used meanwhile"""
+    record = IdempotencyKey(**claim)
+    db.session.add(record)
+    db.session.flush()
+    return record
+
+def replay_claim(claim):
+    """Stored response for a taken key that turned out to be used already"""
+    return replay(db.session.get(IdempotencyKey, claim['key_hash']), claim['request_hash'])
+
+def idempotent(view):
+    """Replay the stored response when a request repeats an Idempotency-Key; no-op without the header"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+
+        purge_if_due()
+        now = datetime.utcnow()
+        key_hash = digest(f"{request.method} {request.path}\n{key}".encode('utf-8'))
+        request_hash = digest(request.get_data())
+
+        record = db.session.get(IdempotencyKey, key_hash)
+        if record is not None and record.expires_at <= now:
+            db.session.delete(record)
+            db.session.commit()
+            record = None
+        if record is not None:
+            return replay(record, request_hash)
+
+        # Claim the key inside the transaction of the write itself. A concurrent
+        # request with the same key waits here until that transaction ends.
+        record = IdempotencyKey(
+            key_hash=key_hash, request_hash=request_hash, created_at=now,
+            expires_at=now + timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+        )
+        db.session.add(record)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return replay(db.session.get(IdempotencyKey, key_hash), request_hash)
+        g.idempotency_record = record
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if g.pop('idempotency_record', None) is None:
+            # The view moved the key into the transaction that did the write (take_claim)
+            return response
+        if response.status_code >= 500:
+            # Failed writes roll back, so a retry should run again rather than replay the error
+            db.session.rollback()
+            return response
+        if record.status_code is not None:
+            # Stored by remember_response and committed with the write
+            return response
+
+        # Responses that did not write anything (validation errors) are stored on their own
+        try:
+            # Re-added in case the view rolled back before returning an error response
+            db.session.add(record)
+            record.status_code = response.status_code
+            record.response_body = response.get_data()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        return response
+    return wrapper
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if command == 'purge':
+            database.create_all()
+            print(f"✅ Purged {purge_expired()} expired idempotency keys")
+        else:
+            print(__doc__)
+            sys.exit(1)
@@ -8,6 +8,8 @@ import os
 import sys
 from app import create_app
 from models import db, Stock, Sale
+from ledger import record_movement
+from migrate_payment_columns import backfill_payment_status
 
 def init_database():
     """Initialize the database with tables"""
@@ -20,14 +22,9 @@ def init_database():
         database.create_all()
         print("✅ Database tables created successfully!")
 
-        # Update existing sales records to have payment status if they don't have it
-        existing_sales = SaleModel.query.filter(SaleModel.payment_status.is_(None)).all()
-        if existing_sales:
-            print(f"🔄 Updating {len(existing_sales)} existing sales with payment status...")
-            for sale in existing_sales:
-                sale.payment_status = 'unpaid'  # Default to unpaid for existing records
-            database.session.commit()
-            print("✅ Updated existing sales records!")
+        # Existing sales without a payment status default to unpaid, updated in batches
+        with database.engine.connect() as connection:
+            backfill_payment_status(connection, 'init_db.sale.payment_status')
 
         # Check if we have any existing data
         stock_count = StockModel.query.count()
@@ -61,6 +58,7 @@ def add_sample_data(db, Stock, Sale):
     for stock_data in sample_stocks:
         stock = Stock(**stock_data)
         db.session.add(stock)
+        record_movement(stock, 'receipt', stock.quantity)
     
     db.session.commit()
     print(f"✅ Added {len(sample_stocks)} sample stock items")
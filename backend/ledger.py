@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Append-only stock movement ledger with point-in-time inventory
+
+Every change to Stock.quantity writes a StockMovement in the same
+transaction. Periodic snapshots fold the ledger up to a point in time, so
+"inventory as of T" only replays the movements between the nearest earlier
+snapshot and T.
+
+Usage:
+    python ledger.py snapshot     # take a snapshot (run from cron, e.g. nightly)
+    python ledger.py reconcile    # compare Stock.quantity against the ledger
+"""
+
+import sys
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify
+from models import db, Stock, StockMovement, InventorySnapshot, InventorySnapshotItem
+
+ledger_bp = Blueprint('ledger', __name__)
+
+# Snapshots stop a little in the past so movements from transactions that
+# are still in flight cannot land before an already taken snapshot.
+SNAPSHOT_LAG = timedelta(minutes=5)
+
+def record_movement(stock, movement_type, quantity_change, sale_id=None):
+    """Add a ledger entry for a stock quantity change to the current transaction"""
+    if stock.id is None:
+        db.session.flush()
+    db.session.add(StockMovement(
+        stock_id=stock.id,
+        product_name=stock.product_name,
+        company_name=stock.company_name,
+        movement_type=movement_type,
+        quantity_change=quantity_change,
+        quantity_after=stock.quantity if movement_type != 'delete' else 0,
+        sale_id=sale_id
+    ))
+
+def inventory_as_of(at):
+    """On-hand quantities keyed by stock id as of `at`: nearest snapshot plus later movements"""
+    snapshot = InventorySnapshot.query.filter(
+        InventorySnapshot.taken_at <= at
+    ).order_by(InventorySnapshot.taken_at.desc()).first()
+
+    inventory = {}
+    movements = StockMovement.query.filter(StockMovement.created_at <= at)
+    if snapshot is not None:
+        for item in InventorySnapshotItem.query.filter_by(snapshot_id=snapshot.id):
+            inventory[item.stock_id] = {
+                'stock_id': item.stock_id,
+                'product_name': item.product_name,
+                'company_name': item.company_name,
+                'quantity': item.quantity
+            }
+        movements = movements.filter(StockMovement.created_at > snapshot.taken_at)
+
+    for movement in movements.order_by(StockMovement.created_at, StockMovement.id):
+        if movement.movement_type == 'delete':
+            inventory.pop(movement.stock_id, None)
+            continue
+        entry = inventory.setdefault(movement.stock_id, {
+            'stock_id': movement.stock_id,
+            'product_name': movement.product_name,
+            'company_name': movement.company_name,
+            'quantity': 0
+        })
+        entry['product_name'] = movement.product_name
+        entry['company_name'] = movement.company_name
+        entry['quantity'] += movement.quantity_change
+
+    return inventory, snapshot
+
+def take_snapshot(at=None):
+    """Fold the ledger up to `at` (at most a few minutes ago) into a new snapshot"""
+    latest = datetime.utcnow() - SNAPSHOT_LAG
+    at = min(at, latest) if at else latest
+    inventory, _ = inventory_as_of(at)
+
+    snapshot = InventorySnapshot(taken_at=at)
+    db.session.add(snapshot)
+    db.session.flush()
+    db.session.bulk_insert_mappings(InventorySnapshotItem, [
+        dict(entry, snapshot_id=snapshot.id) for entry in inventory.values()
+    ])
+    db.session.commit()
+    return snapshot, len(inventory)
+
+def take_opening_snapshot():
+    """Snapshot of the current Stock table, used to start the ledger on an existing database"""
+    snapshot = InventorySnapshot(taken_at=datetime.utcnow())
+    db.session.add(snapshot)
+    db.session.flush()
+    db.session.bulk_insert_mappings(InventorySnapshotItem, [{
+        'snapshot_id': snapshot.id,
+        'stock_id': stock.id,
+        'product_name': stock.product_name,
+        'company_name': stock.company_name,
+        'quantity': stock.quantity
+    } for stock in Stock.query.all()])
+    db.session.commit()
+    return snapshot
+
+def reconcile():
+    """Stock rows whose quantity disagrees with the ledger"""
+    inventory, _ = inventory_as_of(datetime.utcnow() + timedelta(seconds=1))
+    mismatches = []
+    seen = set()
+    for stock in Stock.query.all():
+        seen.add(stock.id)
+        ledger_quantity = inventory.get(stock.id, {}).get('quantity', 0)
+        if ledger_quantity != stock.quantity:
+            mismatches.append({
+                'stock_id': stock.id,
+                'product_name': stock.product_name,
+                'company_name': stock.company_name,
+                'stock_quantity': stock.quantity,
+                'ledger_quantity': ledger_quantity,
+                'difference': stock.quantity - ledger_quantity
+            })
+    for stock_id, entry in inventory.items():
+        if stock_id not in seen and entry['quantity'] != 0:
+            mismatches.append({
+                'stock_id': stock_id,
+                'product_name': entry['product_name'],
+                'company_name': entry['company_name'],
+                'stock_quantity': None,
+                'ledger_quantity': entry['quantity'],
+                'difference': -entry['quantity']
+            })
+    return mismatches, len(seen)
+
+@ledger_bp.route('/as-of', methods=['GET'])
+def get_inventory_as_of():
+    """Get on-hand inventory at a point in time (?at=YYYY-MM-DD or ISO timestamp)"""
+    try:
+        at_param = request.args.get('at')
+        if not at_param:
+            return jsonify({'error': 'at is required'}), 400
+        at = datetime.fromisoformat(at_param)
+        if len(at_param) == 10:
+            # A bare date means the end of that day
+            at += timedelta(days=1) - timedelta(microseconds=1)
+
+        inventory, snapshot = inventory_as_of(at)
+        items = sorted(inventory.values(), key=lambda entry: (entry['product_name'], entry['company_name']))
+        return jsonify({
+            'as_of': at.strftime('%Y-%m-%d %H:%M:%S'),
+            'snapshot_taken_at': snapshot.taken_at.strftime('%Y-%m-%d %H:%M:%S') if snapshot else None,
+            'items': items,
+            'total_items': len(items),
+            'total_quantity': sum(entry['quantity'] for entry in items)
+        }), 200
+
+    except ValueError:
+        return jsonify({'error': 'at must be a date (YYYY-MM-DD) or ISO timestamp'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ledger_bp.route('/movements', methods=['GET'])
+def get_movements():
+    """Get ledger entries for a stock item, newest first"""
+    try:
+        stock_id = request.args.get('stock_id', type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+
+        movements = StockMovement.query
+        if stock_id is not None:
+            movements = movements.filter_by(stock_id=stock_id)
+        movements = movements.order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).limit(limit)
+
+        return jsonify({'movements': [movement.to_dict() for movement in movements]}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ledger_bp.route('/snapshots', methods=['POST'])
+def create_snapshot():
+    """Take an inventory snapshot of the ledger"""
+    try:
+        snapshot, item_count = take_snapshot()
+        return jsonify({
+            'message': 'Snapshot taken',
+            'snapshot_id': snapshot.id,
+            'taken_at': snapshot.taken_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'items': item_count
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@ledger_bp.route('/reconcile', methods=['GET'])
+def get_reconciliation():
+    """Compare Stock.quantity against the ledger"""
+    try:
+        mismatches, checked = reconcile()
+        return jsonify({
+            'consistent': not mismatches,
+            'checked_items': checked,
+            'mismatches': mismatches
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'snapshot'
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if command == 'snapshot':
+            snapshot, item_count = take_snapshot()
+            print(f"📸 Snapshot {snapshot.id} taken at {snapshot.taken_at} with {item_count} items")
+        elif command == 'reconcile':
+            mismatches, checked = reconcile()
+            print(f"🔍 Checked {checked} stock items")
+            for mismatch in mismatches:
+                print(f"❌ {mismatch['product_name']} ({mismatch['company_name']}): "
+                      f"stock={mismatch['stock_quantity']} ledger={mismatch['ledger_quantity']}")
+            if mismatches:
+                sys.exit(1)
+            print("✅ Stock quantities match the ledger")
+        else:
+            print(__doc__)
+            sys.exit(1)
@@ -16,6 +16,7 @@ load_dotenv()
 
 from app import create_app
 from models import db, Sale
+from backfill import run_backfill, sql_batch
 
 def migrate_add_unit_price():
     """Add unit_price column to existing sales records"""
@@ -36,31 +37,24 @@ def migrate_add_unit_price():
                 print("✅ unit_price column already exists")
                 return
             
-            # Add the unit_price column
-            print("📝 Adding unit_price column to sales table...")
             with db_instance.engine.connect() as connection:
+                # Add the unit_price column
+                print("📝 Adding unit_price column to sales table...")
                 connection.execute(db_instance.text('ALTER TABLE sale ADD COLUMN unit_price FLOAT'))
                 connection.commit()
-            
-            # Update existing records with calculated unit_price
-            print("🔄 Updating existing sales records...")
-            sales = Sale.query.all()
-            
-            for sale in sales:
-                if sale.quantity_sold > 0:
-                    # Calculate unit price from existing sale_amount and quantity
-                    calculated_unit_price = sale.sale_amount / sale.quantity_sold
-                    sale.unit_price = round(calculated_unit_price, 2)
-                else:
-                    # Default to 0 if quantity is 0 (shouldn't happen)
-                    sale.unit_price = 0.0
-            
-            # Commit the changes
-            db_instance.session.commit()
+
+                # Calculate unit price from existing sale_amount and quantity, in batches
+                # (0 if quantity is 0, which shouldn't happen)
+                print("🔄 Updating existing sales records...")
+                updated = run_backfill(connection, 'sale.unit_price', 'sale', sql_batch(
+                    "unit_price = CASE WHEN quantity_sold > 0 "
+                    "THEN ROUND(CAST(sale_amount AS NUMERIC) / quantity_sold, 2) ELSE 0 END",
+                    "unit_price IS NULL"
+                ))
             
             print(f"✅ Migration completed successfully!")
             print(f"   - Added unit_price column")
-            print(f"   - Updated {len(sales)} existing sales records")
+            print(f"   - Updated {updated} existing sales records")
             
         except Exception as e:
             print(f"❌ Migration failed: {str(e)}")
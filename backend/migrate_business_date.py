@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Business Dates
+Adds the indexed business_date column to sale, backfills it from sale_date in
+the BUSINESS_TIMEZONE, then rebuilds the day-based aggregates on it
+"""
+
+import os
+import sys
+from app import create_app
+from business_time import business_date
+from config import Config
+from models import Sale
+from sqlalchemy import inspect, select, text
+from backfill import run_backfill
+
+def date_sales(connection, table, low, high):
+    """Backfill batch: business dates of the undated sales with ids in (low, high]"""
+    # Converted in Python so the result matches new inserts on every database
+    rows = connection.execute(
+        select(Sale.id, Sale.sale_date).where(
+            Sale.id > low, Sale.id <= high, Sale.business_date.is_(None), Sale.sale_date.isnot(None)
+        )
+    ).all()
+    if rows:
+        connection.execute(text(
+            "UPDATE sale SET business_date = :business_date WHERE id = :id"
+        ), [{'id': sale_id, 'business_date': business_date(sale_date)} for sale_id, sale_date in rows])
+    return len(rows)
+
+def migrate_database():
+    """Add and backfill Sale.business_date"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        print(f"🔄 Migrating database for business dates ({Config.BUSINESS_TIMEZONE})...")
+
+        database.create_all()
+        inspector = inspect(database.engine)
+        connection = database.engine.connect()
+
+        try:
+            columns = [col['name'] for col in inspector.get_columns('sale')]
+            if 'business_date' not in columns:
+                print("➕ Adding business_date column to sale...")
+                connection.execute(text("ALTER TABLE sale ADD COLUMN business_date DATE"))
+                connection.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_sale_business_date ON sale (business_date)"
+                ))
+                connection.commit()
+                print("✅ Added business_date column to sale")
+            else:
+                print("✅ business_date column already exists on sale")
+
+            print("🔄 Backfilling business dates...")
+            run_backfill(connection, 'sale.business_date', 'sale', date_sales)
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+        # Day buckets of the rollup and demand statistics move to the business date
+        from rollup import refresh_rollup, rollup_version
+        from demand import rebuild
+        if rollup_version() is not None:
+            day_count = refresh_rollup(full=True)
+            print(f"✅ Daily sales rollup rebuilt for {day_count} days")
+        count = rebuild()
+        print(f"✅ Demand statistics rebuilt for {count} SKUs")
+        print("🎉 Database migration completed successfully!")
+
+if __name__ == '__main__':
+    migrate_database()
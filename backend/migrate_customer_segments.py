@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Customer Segments
+Creates the customer_segment table and computes the first RFM segmentation
+"""
+
+import os
+import sys
+from app import create_app
+from segments import refresh_segments
+
+def migrate_database():
+    """Create and fill the customer RFM segments"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        print("🔄 Migrating database for customer segments...")
+
+        try:
+            database.create_all()
+            print("✅ customer_segment table ready")
+
+            count = refresh_segments()
+            print(f"✅ Segments computed for {count} customers")
+            print("🎉 Database migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            database.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_database()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Demand Statistics
+Creates the demand_stat table and fills it from the existing sales history
+"""
+
+import os
+import sys
+from app import create_app
+from demand import rebuild
+
+def migrate_database():
+    """Create and backfill per-SKU demand statistics"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        print("🔄 Migrating database for demand statistics...")
+
+        try:
+            database.create_all()
+            print("✅ demand_stat table ready")
+
+            count = rebuild()
+            print(f"✅ Demand statistics computed for {count} SKUs")
+            print("🎉 Database migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            database.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_database()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Integer Money Columns
+Moves the float rupee columns (stock.unit_price, sale.unit_price,
+sale.sale_amount, sale_daily_rollup.amount and customer_segment.monetary)
+to integer paise columns (*_paise) without downtime, in three steps:
+
+    expand      before deploying the paise code: add the *_paise columns next to
+                the float ones and fill them in batches. On PostgreSQL a trigger
+                keeps them in step with workers still writing only floats.
+    recheck     once no worker of the previous release is left: convert again
+                every row whose paise value does not match its float (run it as
+                often as you like).
+    contract    in a later release, after deploying with MONEY_LEGACY_COLUMNS=false
+                everywhere: recheck, drop the trigger and the float columns.
+
+While MONEY_LEGACY_COLUMNS is on (the default) the app writes both, so workers
+of either release can run side by side. Values are converted in Python with
+money.to_paise, so they round exactly like the app does on every database.
+
+Usage:
+    python migrate_money_paise.py expand
+    python migrate_money_paise.py recheck
+    python migrate_money_paise.py contract
+"""
+
+import sys
+from app import create_app
+from config import Config
+from models import Sale, CustomerSegment
+from money import to_paise
+from sqlalchemy import inspect, text
+from backfill import run_backfill, checkpoints
+
+# (table, float rupee column, integer paise column, nullable)
+MONEY_COLUMNS = [
+    ('stock', 'unit_price', 'unit_price_paise', True),
+    ('sale', 'unit_price', 'unit_price_paise', False),
+    ('sale', 'sale_amount', 'sale_amount_paise', False),
+    ('sale_daily_rollup', 'amount', 'amount_paise', False),
+    ('customer_segment', 'monetary', 'monetary_paise', False),
+]
+
+# Tables keyed by something other than id, converted in one statement per table
+KEYS = {'customer_segment': 'customer_name'}
+
+def table_columns(connection):
+    """{table: [column, ...]} of the money tables that exist"""
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    return {
+        table: [col['name'] for col in inspector.get_columns(table)]
+        for table in {table for table, _, _, _ in MONEY_COLUMNS} if table in tables
+    }
+
+def convert_batch(old, new, recheck):
+    """Batch function setting `new` to to_paise(`old`) where it is missing (or, rechecking, different)"""
+    def apply(connection, table, low, high):
+        key = KEYS.get(table, 'id')
+        where = f"{old} IS NOT NULL" + (f" AND id > :low AND id <= :high" if low is not None else '')
+        if not recheck:
+            where += f" AND {new} IS NULL"
+        rows = connection.execute(
+            text(f"SELECT {key}, {old}, {new} FROM {table} WHERE {where}"), {'low': low, 'high': high}
+        ).all()
+        changes = [
+            {'key': row[0], 'paise': to_paise(row[1])}
+            for row in rows if to_paise(row[1]) != row[2]
+        ]
+        if changes:
+            connection.execute(text(f"UPDATE {table} SET {new} = :paise WHERE {key} = :key"), changes)
+        return len(changes)
+    return apply
+
+def convert(connection, table, old, new, recheck=False):
+    """Convert one column in batches; a recheck always starts from the beginning"""
+    name = f"{table}.{new}" + ('.recheck' if recheck else '')
+    if table in KEYS:
+        count = convert_batch(old, new, recheck)(connection, table, None, None)
+        connection.commit()
+        print(f"✅ {name}: {count} rows updated")
+        return count
+    if recheck:
+        # Finished rechecks run again; an interrupted one resumes
+        connection.execute(checkpoints.delete().where(
+            checkpoints.c.name == name, checkpoints.c.finished_at.isnot(None)
+        ))
+        connection.commit()
+    return run_backfill(connection, name, table, convert_batch(old, new, recheck))
+
+def sync_trigger_sql(table, pairs):
+    """PostgreSQL trigger filling paise from floats written by the previous release"""
+    statements = []
+    for old, new in pairs:
+        statements.append(f"""
+            IF TG_OP = 'INSERT' THEN
+                IF NEW.{new} IS NULL AND NEW.{old} IS NOT NULL THEN
+                    NEW.{new} := ROUND(NEW.{old}::numeric * 100);
+                END IF;
+            ELSIF NEW.{old} IS DISTINCT FROM OLD.{old} AND NEW.{new} IS NOT DISTINCT FROM OLD.{new} THEN
+                NEW.{new} := ROUND(NEW.{old}::numeric * 100);
+            END IF;""")
+    return [
+        f"""CREATE OR REPLACE FUNCTION {table}_money_paise_sync() RETURNS trigger AS $$
+            BEGIN{''.join(statements)}
+                RETURN NEW;
+            END $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS {table}_money_paise_sync ON {table}",
+        f"CREATE TRIGGER {table}_money_paise_sync BEFORE INSERT OR UPDATE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {table}_money_paise_sync()",
+    ]
+
+def expand(database, connection):
+    postgresql = database.engine.dialect.name == 'postgresql'
+    tables = table_columns(connection)
+
+    pending = {}
+    for table, old, new, _ in MONEY_COLUMNS:
+        columns = tables.get(table)
+        if columns is None or old not in columns:
+            continue
+        if new not in columns:
+            print(f"➕ Adding {new} column to {table}...")
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {new} BIGINT"))
+            connection.commit()
+        pending.setdefault(table, []).append((old, new))
+
+    if postgresql:
+        for table, pairs in pending.items():
+            print(f"🔗 Installing paise sync trigger on {table}...")
+            for statement in sync_trigger_sql(table, pairs):
+                connection.execute(text(statement))
+        connection.commit()
+
+    for table, pairs in pending.items():
+        for old, new in pairs:
+            print(f"🔄 Converting {table}.{old} to {new}...")
+            convert(connection, table, old, new)
+
+    if not pending:
+        print("✅ No float money columns left")
+
+def recheck(database, connection):
+    tables = table_columns(connection)
+    mismatched = 0
+    for table, old, new, _ in MONEY_COLUMNS:
+        columns = tables.get(table, [])
+        if old in columns and new in columns:
+            print(f"🔍 Rechecking {table}.{new} against {old}...")
+            mismatched += convert(connection, table, old, new, recheck=True)
+    return mismatched
+
+def contract(database, connection):
+    if Config.MONEY_LEGACY_COLUMNS:
+        print("❌ MONEY_LEGACY_COLUMNS is on: deploy every worker with MONEY_LEGACY_COLUMNS=false, then run contract")
+        sys.exit(1)
+
+    postgresql = database.engine.dialect.name == 'postgresql'
+    recheck(database, connection)
+    tables = table_columns(connection)
+
+    for table, old, new, nullable in MONEY_COLUMNS:
+        columns = tables.get(table, [])
+        if old not in columns:
+            continue
+        if postgresql:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_money_paise_sync ON {table}"))
+            connection.execute(text(f"DROP FUNCTION IF EXISTS {table}_money_paise_sync()"))
+            if not nullable:
+                connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {new} SET NOT NULL"))
+        # Indexes on the float column keep their names for the paise column (SQLite refuses
+        # to drop an indexed column; PostgreSQL would drop ix_sale_date_covering with it)
+        for index in inspect(connection).get_indexes(table):
+            if old in index['column_names'] or old in index.get('include_columns', []):
+                connection.execute(text(f"DROP INDEX {index['name']}"))
+        connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {old}"))
+        connection.commit()
+        print(f"🗑️ {table}.{old} dropped")
+
+    for index in list(Sale.__table__.indexes) + list(CustomerSegment.__table__.indexes):
+        index.create(connection, checkfirst=True)
+    connection.commit()
+    print("✅ Indexes on the paise columns created")
+
+def migrate_database(command):
+    """Run one step of the move to integer paise"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        database.create_all()
+        connection = database.engine.connect()
+        try:
+            print(f"🔄 Money columns to integer paise: {command}...")
+            {'expand': expand, 'recheck': recheck, 'contract': contract}[command](database, connection)
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        print("🎉 Database migration completed successfully!")
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ('expand', 'recheck', 'contract'):
+        print(__doc__)
+        sys.exit(1)
+    migrate_database(command)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Sale Partitioning (PostgreSQL only, optional)
+Converts the sale table into a table range-partitioned by month on sale_date.
+The existing table is kept as sale_unpartitioned until it is dropped by hand.
+Run it during a maintenance window: sales written while it runs are not copied.
+"""
+
+import os
+import sys
+from datetime import date
+from app import create_app
+from models import Sale
+from partitions import DEFAULT_PARTITION, ensure_partitions, is_partitioned, month_start
+from sqlalchemy import text
+
+def migrate_database():
+    """Move sales into a monthly partitioned sale table"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if database.engine.dialect.name != 'postgresql':
+            print("❌ Sale partitioning needs PostgreSQL")
+            sys.exit(1)
+
+        print("🔄 Migrating sale to a monthly partitioned table...")
+        connection = database.engine.connect()
+
+        try:
+            if is_partitioned(connection):
+                print("✅ sale is already partitioned")
+                return
+
+            # Free the table, constraint and index names for the new table
+            connection.execute(text("ALTER TABLE sale RENAME TO sale_unpartitioned"))
+            for (name,) in connection.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'sale_unpartitioned'"
+            )).all():
+                connection.execute(text(f"ALTER INDEX {name} RENAME TO {name}_unpartitioned"))
+
+            connection.execute(text(
+                "UPDATE sale_unpartitioned SET sale_date = now() AT TIME ZONE 'utc' WHERE sale_date IS NULL"
+            ))
+            connection.execute(text(
+                "CREATE TABLE sale (LIKE sale_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (sale_date)"
+            ))
+            # The partition key has to be part of the primary key
+            connection.execute(text("ALTER TABLE sale ALTER COLUMN sale_date SET NOT NULL"))
+            connection.execute(text("ALTER TABLE sale ADD PRIMARY KEY (id, sale_date)"))
+
+            first_sale = connection.execute(text("SELECT MIN(sale_date) FROM sale_unpartitioned")).scalar()
+            names = ensure_partitions(
+                connection, app.config['SALE_PARTITION_MONTHS_AHEAD'],
+                month_start(first_sale.date() if first_sale else date.today())
+            )
+            connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF sale DEFAULT"))
+            print(f"➕ Created {len(names)} monthly partitions ({names[0]} to {names[-1]}) and {DEFAULT_PARTITION}")
+
+            # Indexes on the parent are created on every partition
+            for index in Sale.__table__.indexes:
+                columns = ', '.join(column.name for column in index.columns)
+                include = index.dialect_options['postgresql']['include']
+                include = f" INCLUDE ({', '.join(include)})" if include else ''
+                print(f"➕ {index.name} ({columns}){include}")
+                connection.execute(text(f"CREATE INDEX {index.name} ON sale ({columns}){include}"))
+
+            print("🔄 Copying sales into partitions...")
+            copied = connection.execute(text("INSERT INTO sale SELECT * FROM sale_unpartitioned")).rowcount
+
+            # New sales keep drawing ids from the same sequence
+            sequence = connection.execute(text("SELECT pg_get_serial_sequence('sale_unpartitioned', 'id')")).scalar()
+            if sequence:
+                connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY sale.id"))
+
+            connection.commit()
+            print(f"🎉 Database migration completed successfully! {copied} sales copied")
+            print("🧹 Drop sale_unpartitioned once the new table has been checked")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+if __name__ == '__main__':
+    migrate_database()
@@ -9,6 +9,12 @@ import sys
 from app import create_app
 from models import db
 from sqlalchemy import text
+from backfill import run_backfill, sql_batch
+
+def backfill_payment_status(connection, checkpoint):
+    """Set sales without a payment status to unpaid in batches, under the caller's own checkpoint name"""
+    return run_backfill(connection, checkpoint, 'sale',
+                        sql_batch("payment_status = 'unpaid'", "payment_status IS NULL"))
 
 def migrate_database():
     """Add payment tracking columns to existing database"""
@@ -38,16 +44,13 @@ def migrate_database():
                     ALTER TABLE sale
                     ADD COLUMN payment_status VARCHAR(20) DEFAULT 'unpaid'
                 """))
-
-                # Update existing records to 'unpaid'
-                connection.execute(text("""
-                    UPDATE sale
-                    SET payment_status = 'unpaid'
-                    WHERE payment_status IS NULL
-                """))
+                connection.commit()
                 print("✅ Added payment_status column")
             else:
                 print("✅ payment_status column already exists")
+
+            # Update existing records to 'unpaid' in batches (commits as it goes)
+            backfill_payment_status(connection, 'migrate_payment_columns.sale.payment_status')
             
             # Add payment_date column if it doesn't exist
             if 'payment_date' not in existing_columns:
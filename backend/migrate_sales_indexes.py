@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Sales Search
+Creates the composite indexes used by /api/sales/search and the covering
+sale_date index used by the analytics windows on an existing sale table
+"""
+
+import os
+import sys
+from app import create_app
+from models import Sale
+
+# Indexes replaced by a model index that serves the same lookups
+SUPERSEDED_INDEXES = ['ix_sale_sale_date']
+
+def migrate_database():
+    """Create the sale indexes declared on the model, without blocking writes on PostgreSQL"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        print("🔄 Creating sales search indexes...")
+        is_postgres = database.engine.dialect.name == 'postgresql'
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with database.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            for index in Sale.__table__.indexes:
+                columns = ', '.join(column.name for column in index.columns)
+                concurrently = 'CONCURRENTLY ' if is_postgres else ''
+                include = index.dialect_options['postgresql']['include']
+                include = f" INCLUDE ({', '.join(include)})" if include and is_postgres else ''
+                print(f"➕ {index.name} ({columns}){include}")
+                connection.exec_driver_sql(
+                    f"CREATE INDEX {concurrently}IF NOT EXISTS {index.name} ON sale ({columns}){include}"
+                )
+
+            for name in SUPERSEDED_INDEXES:
+                print(f"➖ {name}")
+                connection.exec_driver_sql(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+        print("🎉 Sales search indexes created successfully!")
+
+if __name__ == '__main__':
+    migrate_database()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Product Search
+Enables pg_trgm and creates GIN trigram indexes on stock product and company names
+"""
+
+import os
+import sys
+from app import create_app
+from sqlalchemy import text
+
+def migrate_database():
+    """Create trigram search indexes (PostgreSQL only)"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if database.engine.dialect.name != 'postgresql':
+            print("ℹ️  Not a PostgreSQL database - search uses the in-process trigram index instead")
+            return
+
+        print("🔄 Creating trigram search indexes...")
+        connection = database.engine.connect()
+
+        try:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_stock_product_name_trgm
+                ON stock USING gin (product_name gin_trgm_ops)
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_stock_company_name_trgm
+                ON stock USING gin (company_name gin_trgm_ops)
+            """))
+            connection.commit()
+            print("🎉 Trigram search indexes created successfully!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+if __name__ == '__main__':
+    migrate_database()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for the Stock Movement Ledger
+Creates the ledger and snapshot tables and records an opening snapshot of
+current stock so the ledger reconciles from day one
+"""
+
+import os
+import sys
+from app import create_app
+from models import InventorySnapshot
+from ledger import take_opening_snapshot, reconcile
+
+def migrate_database():
+    """Create ledger tables and the opening snapshot"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        print("🔄 Migrating database for the stock movement ledger...")
+
+        try:
+            database.create_all()
+            print("✅ stock_movement, inventory_snapshot and inventory_snapshot_item tables ready")
+
+            if InventorySnapshot.query.count() == 0:
+                snapshot = take_opening_snapshot()
+                print(f"📸 Opening snapshot taken at {snapshot.taken_at} "
+                      f"with {StockModel.query.count()} stock items")
+            else:
+                print("✅ Ledger already has snapshots")
+
+            mismatches, checked = reconcile()
+            print(f"🔍 Reconciliation: {checked} items checked, {len(mismatches)} mismatches")
+            print("🎉 Database migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            database.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_database()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script for Delta Sync
+Adds change_version columns to stock and sale, creates the tombstone and
+counter tables, and backfills versions for existing rows
+"""
+
+import os
+import sys
+from app import create_app
+from sqlalchemy import inspect, text
+
+def migrate_database():
+    """Add change version tracking to an existing database"""
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        print("🔄 Migrating database for delta sync...")
+
+        # New tables (stock_tombstone, change_counter)
+        database.create_all()
+
+        inspector = inspect(database.engine)
+        connection = database.engine.connect()
+
+        try:
+            for table in ('stock', 'sale'):
+                columns = [col['name'] for col in inspector.get_columns(table)]
+                if 'change_version' not in columns:
+                    print(f"➕ Adding change_version column to {table}...")
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN change_version BIGINT"))
+                    connection.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{table}_change_version ON {table} (change_version)"
+                    ))
+                    print(f"✅ Added change_version column to {table}")
+                else:
+                    print(f"✅ change_version column already exists on {table}")
+
+            # Backfill: stock gets versions 1..max(stock.id), sales follow after it
+            max_stock_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM stock")).scalar()
+            max_sale_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM sale")).scalar()
+
+            print("🔄 Backfilling change versions...")
+            connection.execute(text(
+                "UPDATE stock SET change_version = id WHERE change_version IS NULL"
+            ))
+            connection.execute(text(
+                "UPDATE sale SET change_version = id + :offset WHERE change_version IS NULL"
+            ), {'offset': max_stock_id})
+
+            # Move the counter past every version handed out so far
+            max_version = connection.execute(text("""
+                SELECT MAX(v) FROM (
+                    SELECT COALESCE(MAX(change_version), 0) AS v FROM stock
+                    UNION ALL SELECT COALESCE(MAX(change_version), 0) FROM sale
+                    UNION ALL SELECT COALESCE(MAX(change_version), 0) FROM stock_tombstone
+                ) versions
+            """)).scalar()
+            max_version = max(max_version or 0, max_stock_id + max_sale_id)
+
+            connection.execute(text(
+                "UPDATE change_counter SET value = :value WHERE name = 'global' AND value < :value"
+            ), {'value': max_version})
+            exists = connection.execute(text(
+                "SELECT COUNT(*) FROM change_counter WHERE name = 'global'"
+            )).scalar()
+            if not exists:
+                connection.execute(text(
+                    "INSERT INTO change_counter (name, value) VALUES ('global', :value)"
+                ), {'value': max_version})
+
+            connection.commit()
+            print("🎉 Database migration completed successfully!")
+            print(f"📊 Change counter is now at version {max_version}")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+if __name__ == '__main__':
+    migrate_database()
@@ -1,5 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import and_, event
+from business_time import business_date, business_day_start
+from money import to_rupees
+from config import Config
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -9,8 +13,11 @@ class Stock(db.Model):
     product_name = db.Column(db.String(100), nullable=False)
     company_name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=0)
-    unit_price = db.Column(db.Float, nullable=True, default=0.0)
+    unit_price_paise = db.Column(db.BigInteger, nullable=True, default=0)  # Integer paise, see money.py
+    if Config.MONEY_LEGACY_COLUMNS:
+        unit_price = db.Column(db.Float, nullable=True)  # Float rupees, mirrored until migrate_money_paise.py contract
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    change_version = db.Column(db.BigInteger, nullable=True, index=True)  # Stamped on every write, see sync.py
     
     def to_dict(self):
         return {
@@ -18,22 +25,37 @@ class Stock(db.Model):
             'product_name': self.product_name,
             'company_name': self.company_name,
             'quantity': self.quantity,
-            'unit_price': self.unit_price,
+            'unit_price': to_rupees(self.unit_price_paise),
             'date_added': self.date_added.strftime('%Y-%m-%d %H:%M:%S')
         }
 
 class Sale(db.Model):
+    __table_args__ = (
+        # Covers the columns summed by the analytics windows, so they are index-only scans on PostgreSQL
+        db.Index('ix_sale_date_covering', 'sale_date', postgresql_include=[
+            'product_name', 'company_name', 'customer_name', 'quantity_sold', 'sale_amount_paise', 'payment_status'
+        ]),
+        db.Index('ix_sale_customer_date', 'customer_name', 'sale_date'),
+        db.Index('ix_sale_status_date', 'payment_status', 'sale_date'),
+        db.Index('ix_sale_product_date', 'product_name', 'company_name', 'sale_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(100), nullable=False)
     company_name = db.Column(db.String(100), nullable=False)
     quantity_sold = db.Column(db.Integer, nullable=False)
     customer_name = db.Column(db.String(100), nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    sale_amount = db.Column(db.Float, nullable=False)
+    unit_price_paise = db.Column(db.BigInteger, nullable=False)  # Integer paise, see money.py
+    sale_amount_paise = db.Column(db.BigInteger, nullable=False)
+    if Config.MONEY_LEGACY_COLUMNS:
+        unit_price = db.Column(db.Float, nullable=True)  # Legacy float rupees, like Stock.unit_price
+        sale_amount = db.Column(db.Float, nullable=True)
     payment_status = db.Column(db.String(20), nullable=False, default='unpaid')  # 'paid' or 'unpaid'
     payment_date = db.Column(db.DateTime, nullable=True)  # When payment was received
     payment_method = db.Column(db.String(50), nullable=True)  # cash, card, upi, etc.
     sale_date = db.Column(db.DateTime, default=datetime.utcnow)
+    business_date = db.Column(db.Date, nullable=True, index=True)  # Local date of sale_date, see business_time.py
+    change_version = db.Column(db.BigInteger, nullable=True, index=True)  # Stamped on every write, see sync.py
     
     def to_dict(self):
         return {
@@ -42,14 +64,235 @@ class Sale(db.Model):
             'company_name': self.company_name,
             'quantity_sold': self.quantity_sold,
             'customer_name': self.customer_name,
-            'unit_price': self.unit_price,
-            'sale_amount': self.sale_amount,
+            'unit_price': to_rupees(self.unit_price_paise),
+            'sale_amount': to_rupees(self.sale_amount_paise),
             'payment_status': self.payment_status,
             'payment_date': self.payment_date.strftime('%Y-%m-%d %H:%M:%S') if self.payment_date else None,
             'payment_method': self.payment_method,
             'sale_date': self.sale_date.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+def sale_business_days(first_day, last_day=None):
+    """Filter for sales on business days first_day..last_day (inclusive, open-ended when None).
+
+    The redundant sale_date bounds let PostgreSQL prune a partitioned sale table, see partitions.py.
+    """
+    conditions = [Sale.business_date >= first_day, Sale.sale_date >= business_day_start(first_day)]
+    if last_day is not None:
+        conditions += [
+            Sale.business_date <= last_day,
+            Sale.sale_date < business_day_start(last_day + timedelta(days=1))
+        ]
+    return and_(*conditions)
+
+@event.listens_for(Sale, 'before_insert')
+def set_business_date(mapper, connection, sale):
+    if sale.sale_date is None:
+        sale.sale_date = datetime.utcnow()
+    if sale.business_date is None:
+        sale.business_date = business_date(sale.sale_date)
+
+# (model, float rupee attribute, integer paise attribute) still written for the previous release
+LEGACY_MONEY = [(Stock, 'unit_price', 'unit_price_paise'), (Sale, 'unit_price', 'unit_price_paise'),
+                (Sale, 'sale_amount', 'sale_amount_paise')] if Config.MONEY_LEGACY_COLUMNS else []
+
+def mirror_legacy_money(mapper, connection, target):
+    """Copy paise into the float rupee columns that workers of the previous release still read"""
+    for model, legacy, paise in LEGACY_MONEY:
+        if isinstance(target, model):
+            setattr(target, legacy, to_rupees(getattr(target, paise)))
+
+for model in {model for model, _, _ in LEGACY_MONEY}:
+    event.listen(model, 'before_insert', mirror_legacy_money)
+    event.listen(model, 'before_update', mirror_legacy_money)
+
+class StockTombstone(db.Model):
+    """Record of a deleted stock item so offline terminals can drop it on sync"""
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, nullable=False)
+    product_name = db.Column(db.String(100), nullable=False)
+    company_name = db.Column(db.String(100), nullable=False)
+    change_version = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.stock_id,
+            'product_name': self.product_name,
+            'company_name': self.company_name,
+            'change_version': self.change_version,
+            'deleted_at': self.deleted_at.strftime('%Y-%m-%d %H:%M:%S') if self.deleted_at else None
+        }
+
+class SaleArchiveTombstone(db.Model):
+    """Record of an archived sale partition so offline terminals drop its sales on sync, see partitions.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    partition_name = db.Column(db.String(50), nullable=False)
+    sale_date_from = db.Column(db.DateTime, nullable=False)  # Sales with sale_date in [from, to) are gone
+    sale_date_to = db.Column(db.DateTime, nullable=False)
+    change_version = db.Column(db.BigInteger, nullable=False, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'partition': self.partition_name,
+            'sale_date_from': self.sale_date_from.strftime('%Y-%m-%d %H:%M:%S'),
+            'sale_date_to': self.sale_date_to.strftime('%Y-%m-%d %H:%M:%S'),
+            'change_version': self.change_version,
+            'archived_at': self.archived_at.strftime('%Y-%m-%d %H:%M:%S') if self.archived_at else None
+        }
+
+class ChangeCounter(db.Model):
+    """Single-row counter that hands out monotonically increasing change versions"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class StockMovement(db.Model):
+    """Append-only ledger entry for every change to a stock quantity"""
+    __table_args__ = (
+        db.Index('ix_stock_movement_stock_created', 'stock_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, nullable=False)  # No FK: history outlives deleted stock
+    product_name = db.Column(db.String(100), nullable=False)
+    company_name = db.Column(db.String(100), nullable=False)
+    movement_type = db.Column(db.String(20), nullable=False)  # 'receipt', 'sale', 'adjustment' or 'delete'
+    quantity_change = db.Column(db.Integer, nullable=False)
+    quantity_after = db.Column(db.Integer, nullable=False)
+    sale_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'stock_id': self.stock_id,
+            'product_name': self.product_name,
+            'company_name': self.company_name,
+            'movement_type': self.movement_type,
+            'quantity_change': self.quantity_change,
+            'quantity_after': self.quantity_after,
+            'sale_id': self.sale_id,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+class InventorySnapshot(db.Model):
+    """On-hand quantities of every SKU at a point in time, derived from the ledger"""
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    items = db.relationship('InventorySnapshotItem', backref='snapshot', lazy=True,
+                            cascade='all, delete-orphan')
+
+class InventorySnapshotItem(db.Model):
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('inventory_snapshot.id'), primary_key=True)
+    stock_id = db.Column(db.Integer, primary_key=True)
+    product_name = db.Column(db.String(100), nullable=False)
+    company_name = db.Column(db.String(100), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+class DemandStat(db.Model):
+    """Per-SKU demand statistics maintained incrementally as sales are recorded, see demand.py"""
+    stock_id = db.Column(db.Integer, primary_key=True)
+    current_day = db.Column(db.Date, nullable=True)  # Day whose totals are still accumulating
+    day_quantity = db.Column(db.Integer, nullable=False, default=0)
+    day_transactions = db.Column(db.Integer, nullable=False, default=0)
+    # Exponentially weighted daily quantity (mean, variance) and transactions per horizon
+    qty_mean_7 = db.Column(db.Float, nullable=False, default=0.0)
+    qty_var_7 = db.Column(db.Float, nullable=False, default=0.0)
+    txn_mean_7 = db.Column(db.Float, nullable=False, default=0.0)
+    qty_mean_30 = db.Column(db.Float, nullable=False, default=0.0)
+    qty_var_30 = db.Column(db.Float, nullable=False, default=0.0)
+    txn_mean_30 = db.Column(db.Float, nullable=False, default=0.0)
+    qty_mean_90 = db.Column(db.Float, nullable=False, default=0.0)
+    qty_var_90 = db.Column(db.Float, nullable=False, default=0.0)
+    txn_mean_90 = db.Column(db.Float, nullable=False, default=0.0)
+    last_sale_at = db.Column(db.DateTime, nullable=True)
+
+class SaleDailyRollup(db.Model):
+    """Sales pre-aggregated per day, product, customer and payment status, see rollup.py"""
+    __table_args__ = (
+        db.Index('ix_rollup_day', 'day'),
+        db.Index('ix_rollup_product_day', 'product_name', 'company_name', 'day'),
+        db.Index('ix_rollup_customer_day', 'customer_name', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    product_name = db.Column(db.String(100), nullable=False)
+    company_name = db.Column(db.String(100), nullable=False)
+    customer_name = db.Column(db.String(100), nullable=False)
+    payment_status = db.Column(db.String(20), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    amount_paise = db.Column(db.BigInteger, nullable=False, default=0)
+    if Config.MONEY_LEGACY_COLUMNS:
+        amount = db.Column(db.Float, nullable=True)  # Legacy float rupees, like Stock.unit_price
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupState(db.Model):
+    """Change version a rollup has been brought up to"""
+    name = db.Column(db.String(50), primary_key=True)
+    change_version = db.Column(db.BigInteger, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+
+class MigrationCheckpoint(db.Model):
+    """Progress of a batched migration backfill, so an interrupted run resumes where it stopped (see backfill.py)"""
+    name = db.Column(db.String(100), primary_key=True)
+    table_name = db.Column(db.String(100), nullable=False)
+    last_id = db.Column(db.BigInteger, nullable=False, default=0)  # Highest id of the last committed batch
+    rows_done = db.Column(db.BigInteger, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class IdempotencyKey(db.Model):
+    """Response to a write sent with an Idempotency-Key header, replayed when the client retries (see idempotency.py)"""
+    __table_args__ = (
+        db.Index('ix_idempotency_key_expires_at', 'expires_at'),
+    )
+
+    key_hash = db.Column(db.LargeBinary(16), primary_key=True)  # Truncated SHA-256 of method, path and key
+    request_hash = db.Column(db.LargeBinary(16), nullable=False)  # Truncated SHA-256 of the request body
+    status_code = db.Column(db.SmallInteger, nullable=True)  # NULL until the first request has finished
+    response_body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class CustomerSegment(db.Model):
+    """Recency/frequency/monetary scores per customer, refreshed in batch by segments.py"""
+    __table_args__ = (
+        db.Index('ix_customer_segment_segment_monetary', 'segment', 'monetary_paise'),
+        db.Index('ix_customer_segment_monetary', 'monetary_paise'),
+    )
+
+    customer_name = db.Column(db.String(100), primary_key=True)
+    last_purchase_at = db.Column(db.DateTime, nullable=False)
+    recency_days = db.Column(db.Integer, nullable=False)
+    frequency = db.Column(db.Integer, nullable=False)
+    monetary_paise = db.Column(db.BigInteger, nullable=False)
+    if Config.MONEY_LEGACY_COLUMNS:
+        monetary = db.Column(db.Float, nullable=True)  # Legacy float rupees, like Stock.unit_price
+    r_score = db.Column(db.SmallInteger, nullable=False)  # 1 (worst) to 5 (best) quintiles
+    f_score = db.Column(db.SmallInteger, nullable=False)
+    m_score = db.Column(db.SmallInteger, nullable=False)
+    segment = db.Column(db.String(30), nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'customer_name': self.customer_name,
+            'last_purchase_at': self.last_purchase_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'recency_days': self.recency_days,
+            'frequency': self.frequency,
+            'monetary': to_rupees(self.monetary_paise),
+            'r_score': self.r_score,
+            'f_score': self.f_score,
+            'm_score': self.m_score,
+            'rfm_score': f'{self.r_score}{self.f_score}{self.m_score}',
+            'segment': self.segment
+        }
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
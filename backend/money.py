@@ -0,0 +1,27 @@
+"""
+Money helpers
+
+Prices and amounts are stored as integer paise (1 rupee = 100 paise), so
+sums, subtotals and paid/unpaid splits are exact integer arithmetic in the
+database. The API, exports and reports keep speaking rupees: convert at the
+edges with these helpers.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+def to_paise(rupees):
+    """Integer paise for a rupee amount (number or numeric string), rounded half up"""
+    if rupees is None:
+        return None
+    return int((Decimal(str(rupees)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_rupees(paise):
+    """Rupees as a float for JSON; also takes the Decimal sums PostgreSQL returns"""
+    if paise is None:
+        return None
+    return float(paise) / 100
+
+def format_rupees(paise):
+    """'Rs.1234.50' straight from paise, without going through floats"""
+    rupees, remainder = divmod(abs(int(paise or 0)), 100)
+    return f"Rs.{'-' if paise and paise < 0 else ''}{rupees}.{remainder:02d}"
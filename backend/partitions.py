@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Monthly partitions of the sale table (PostgreSQL)
+
+After migrate_partition_sales.py the sale table is range-partitioned on
+sale_date, one partition per month (sale_pYYYYMM) plus a default partition
+that should stay empty. Queries bound sale_date (see sale_business_days in
+models.py), so PostgreSQL only scans the partitions they need.
+
+Usage:
+    python partitions.py list
+    python partitions.py create [months_ahead]      # run monthly from cron
+    python partitions.py archive <months_to_keep> [--keep-table]
+        # detach partitions older than that, dump each to a gzip CSV in
+        # SALE_ARCHIVE_DIR and drop it (--keep-table leaves it detached)
+
+Each archived partition leaves a sale_archive_tombstone row with its
+sale_date range, served by /api/sync as archived_sales so offline terminals
+drop those sales too. Archiving removes sales without writing any, so
+afterwards the daily rollup is recomputed for the archived months, customer
+segments are refreshed and the 'sale' cache tag is invalidated. The heavy-hitters sketches reload on
+their own once they see the archive counter move. With the default in-process
+cache (CACHE_BACKEND=lru) that invalidation cannot reach the app servers:
+restart them after an archive, or run with CACHE_BACKEND=redis.
+"""
+
+import gzip
+import os
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, text
+from models import SaleArchiveTombstone
+from business_time import business_today
+from sync import allocate_change_versions, SALE_ARCHIVE_COUNTER
+from rollup import rebuild_day_range
+from segments import refresh_segments
+from cache import cache
+
+DEFAULT_PARTITION = 'sale_default'
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f'sale_p{month:%Y%m}'
+
+def is_partitioned(connection):
+    """Whether the sale table is a PostgreSQL partitioned table"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('sale'))"
+    )).scalar()
+
+def list_partitions(connection):
+    """[(name, bounds, estimated rows)] of the partitions attached to sale"""
+    return connection.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples::bigint
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'sale'::regclass
+        ORDER BY child.relname
+    """)).all()
+
+def create_partition(connection, month):
+    """Create the partition for the month starting at `month` if it does not exist"""
+    name = partition_name(month)
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF sale "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+    return name
+
+def ensure_partitions(connection, months_ahead, first_month=None):
+    """Create monthly partitions from `first_month` (default: this month) to `months_ahead` months ahead"""
+    current = month_start(business_today())
+    # Partitions split on sale_date (UTC), which can still be in the previous month
+    month = first_month or min(current, month_start(datetime.utcnow().date()))
+    names = []
+    while month <= add_months(current, months_ahead):
+        names.append(create_partition(connection, month))
+        month = add_months(month, 1)
+    return names
+
+def archive_partitions(connection, months_to_keep, archive_dir, drop=True):
+    """Detach, dump and drop monthly partitions that ended before the retention window"""
+    cutoff = add_months(month_start(business_today()), -months_to_keep)
+    os.makedirs(archive_dir, exist_ok=True)
+    SaleArchiveTombstone.__table__.create(connection, checkfirst=True)
+
+    archived = []
+    for name, _, _ in list_partitions(connection):
+        if name == DEFAULT_PARTITION or not name.startswith('sale_p'):
+            continue
+        month = date(int(name[6:10]), int(name[10:12]), 1)
+        if add_months(month, 1) > cutoff:
+            continue
+
+        connection.execute(text(f"ALTER TABLE sale DETACH PARTITION {name}"))
+        path = os.path.join(archive_dir, f'{name}.csv.gz')
+        cursor = connection.connection.cursor()
+        with gzip.open(path, 'wb') as archive:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+        if drop:
+            connection.execute(text(f"DROP TABLE {name}"))
+        # The sale rows are gone without new change versions, see conditional.py; sync
+        # clients learn about it from a tombstone for the partition's sale_date range
+        allocate_change_versions(connection, 1, SALE_ARCHIVE_COUNTER)
+        connection.execute(insert(SaleArchiveTombstone.__table__).values(
+            partition_name=name,
+            sale_date_from=datetime.combine(month, datetime.min.time()),
+            sale_date_to=datetime.combine(add_months(month, 1), datetime.min.time()),
+            change_version=allocate_change_versions(connection, 1),
+            archived_at=datetime.utcnow()
+        ))
+        # Commit per partition so a failure later on keeps the finished archives consistent
+        connection.commit()
+        archived.append((name, path, os.path.getsize(path)))
+    return archived
+
+def refresh_after_archive(archived):
+    """Bring the rollup, segments and cache in line with the sales of the archived partitions being gone"""
+    months = [date(int(name[6:10]), int(name[10:12]), 1) for name, _, _ in archived]
+    # Partitions split on sale_date, rollup days are business days: cover a day either side
+    days = rebuild_day_range(min(months) - timedelta(days=1), add_months(max(months), 1))
+    customers = refresh_segments()
+    cache.invalidate('sale')
+    return days, customers
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        with database.engine.connect() as connection:
+            if not is_partitioned(connection):
+                print("❌ The sale table is not partitioned (PostgreSQL only, see migrate_partition_sales.py)")
+                sys.exit(1)
+
+            if command == 'list':
+                for name, bounds, rows in list_partitions(connection):
+                    print(f"📦 {name}: {bounds} (~{max(rows, 0)} rows)")
+            elif command == 'create':
+                months_ahead = int(sys.argv[2]) if len(sys.argv) > 2 else app.config['SALE_PARTITION_MONTHS_AHEAD']
+                names = ensure_partitions(connection, months_ahead)
+                connection.commit()
+                print(f"✅ Partitions ready through {names[-1]}")
+                default_rows = connection.execute(text(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION}")).scalar()
+                if default_rows:
+                    print(f"⚠️ {default_rows} sales are in {DEFAULT_PARTITION}; their months need partitions")
+            elif command == 'archive' and len(sys.argv) > 2:
+                archived = archive_partitions(
+                    connection, int(sys.argv[2]), app.config['SALE_ARCHIVE_DIR'],
+                    drop='--keep-table' not in sys.argv
+                )
+                for name, path, size in archived:
+                    print(f"🗄️ {name} archived to {path} ({size / 1024:.0f} KB)")
+                if archived:
+                    days, customers = refresh_after_archive(archived)
+                    print(f"🔄 Rollup recomputed for {days} days, segments for {customers} customers")
+                print(f"✅ Archived {len(archived)} partitions")
+            else:
+                print(__doc__)
+                sys.exit(1)
@@ -4,10 +4,56 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from datetime import datetime, timedelta
-from models import Sale, db
+from models import Sale, db, sale_business_days
+from business_time import business_today
+from money import format_rupees
+from sqlalchemy import case, func, literal, null, select, tuple_, union_all
 import io
 import os
 
+# Columns of each sale line in the weekly reports
+REPORT_COLUMNS = (
+    Sale.id, Sale.sale_date, Sale.business_date, Sale.customer_name, Sale.product_name, Sale.company_name,
+    Sale.quantity_sold, Sale.unit_price_paise, Sale.sale_amount_paise, Sale.payment_status, Sale.payment_method
+)
+
+def weekly_report_rows(start_date, end_date, group_column):
+    """Sales of business days start_date..end_date with subtotals per group_column, in report order
+
+    One ROLLUP query returns each group's sales (level 0) followed by the
+    group subtotal (level 1), and the grand total (level 2) last; every row
+    carries its total and paid amounts in paise.
+    """
+    window = sale_business_days(start_date, end_date)
+    paid_amount = case((Sale.payment_status == 'paid', Sale.sale_amount_paise), else_=0)
+    total = func.sum(Sale.sale_amount_paise).label('total')
+    paid = func.sum(paid_amount).label('paid')
+
+    if db.engine.dialect.name == 'postgresql':
+        grand = func.grouping(group_column)
+        level = grand + func.grouping(Sale.id)
+        query = select(
+            group_column.label('group_key'), *REPORT_COLUMNS, grand.label('grand'), level.label('level'), total, paid
+        ).where(window).group_by(
+            func.rollup(group_column, tuple_(*REPORT_COLUMNS))
+        ).order_by(grand, group_column, level, Sale.sale_date, Sale.customer_name, Sale.id)
+    else:
+        # No ROLLUP: the same three levels as a UNION ALL
+        blank = [null().label(column.key) for column in REPORT_COLUMNS]
+        union = union_all(
+            select(group_column.label('group_key'), *REPORT_COLUMNS, literal(0).label('grand'), literal(0).label('level'),
+                   Sale.sale_amount_paise.label('total'), paid_amount.label('paid')).where(window),
+            select(group_column.label('group_key'), *blank, literal(0).label('grand'), literal(1).label('level'),
+                   total, paid).where(window).group_by(group_column),
+            select(null().label('group_key'), *blank, literal(1).label('grand'), literal(2).label('level'),
+                   total, paid).where(window)
+        )
+        columns = union.selected_columns
+        query = union.order_by(columns.grand, columns.group_key, columns.level,
+                               columns.sale_date, columns.customer_name, columns.id)
+
+    return db.session.execute(query).all()
+
 class PDFGenerator:
     def __init__(self):
         self.styles = getSampleStyleSheet()
@@ -22,263 +68,139 @@ class PDFGenerator:
         
     def generate_weekly_report_by_customer(self):
         """Generate PDF report grouped by customer name"""
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72,
-                              topMargin=72, bottomMargin=18)
-        
-        # Get weekly sales data
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=7)
-        
-        sales = Sale.query.filter(
-            Sale.sale_date >= start_date,
-            Sale.sale_date <= end_date
-        ).order_by(Sale.customer_name, Sale.sale_date).all()
-        
-        # Build PDF content
-        story = []
-        
-        # Title
-        title = Paragraph("SRI LAKSHMI ENTERPRISES", self.title_style)
-        subtitle = Paragraph(f"Weekly Sales Report by Customer<br/>({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')})", 
-                            self.styles['Heading2'])
-        story.append(title)
-        story.append(subtitle)
-        story.append(Spacer(1, 20))
-        
-        # Group sales by customer
-        customer_sales = {}
-        for sale in sales:
-            if sale.customer_name not in customer_sales:
-                customer_sales[sale.customer_name] = []
-            customer_sales[sale.customer_name].append(sale)
-        
-        # Create tables for each customer
-        for customer_name, customer_sale_list in customer_sales.items():
-            # Customer header
-            customer_header = Paragraph(f"Customer: {customer_name}", self.styles['Heading3'])
-            story.append(customer_header)
-            story.append(Spacer(1, 10))
-            
-            # Table data with payment status
-            data = [['Date', 'Product Name', 'Company', 'Qty', 'Unit Price', 'Amount (Rs.)', 'Payment Status']]
-            total_amount = 0
-            paid_amount = 0
-            unpaid_amount = 0
-
-            for sale in customer_sale_list:
-                payment_status = "✓ PAID" if sale.payment_status == 'paid' else "⚠ UNPAID"
-                payment_method = f" ({sale.payment_method.upper()})" if sale.payment_method else ""
-
-                data.append([
-                    sale.sale_date.strftime('%Y-%m-%d'),
-                    sale.product_name,
-                    sale.company_name,
-                    str(sale.quantity_sold),
-                    f"Rs.{sale.unit_price:.2f}",
-                    f"Rs.{sale.sale_amount:.2f}",
-                    payment_status + payment_method
-                ])
-
-                total_amount += sale.sale_amount
-                if sale.payment_status == 'paid':
-                    paid_amount += sale.sale_amount
-                else:
-                    unpaid_amount += sale.sale_amount
-
-            # Add summary rows
-            data.append(['', '', '', '', '', 'Total:', f"Rs.{total_amount:.2f}"])
-            data.append(['', '', '', '', '', 'Paid:', f"Rs.{paid_amount:.2f}"])
-            data.append(['', '', '', '', '', 'Unpaid:', f"Rs.{unpaid_amount:.2f}"])
-
-            # Create table with payment status column
-            table = Table(data, colWidths=[0.8*inch, 1.5*inch, 1*inch, 0.5*inch, 0.8*inch, 1*inch, 1.4*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -4), colors.beige),
-                ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
-                ('FONTNAME', (0, -3), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 9)
-            ]))
-            
-            story.append(table)
-            story.append(Spacer(1, 20))
-
-        # Add overall payment summary
-        if sales:
-            story.append(Spacer(1, 30))
-            summary_header = Paragraph("📊 Weekly Payment Summary", self.styles['Heading2'])
-            story.append(summary_header)
-            story.append(Spacer(1, 15))
-
-            # Calculate overall totals
-            overall_total = sum(sale.sale_amount for sale in sales)
-            overall_paid = sum(sale.sale_amount for sale in sales if sale.payment_status == 'paid')
-            overall_unpaid = overall_total - overall_paid
-            payment_rate = (overall_paid / overall_total * 100) if overall_total > 0 else 0
-
-            summary_data = [
-                ['Metric', 'Amount', 'Percentage'],
-                ['Total Sales', f"Rs.{overall_total:.2f}", '100%'],
-                ['Paid Amount', f"Rs.{overall_paid:.2f}", f"{payment_rate:.1f}%"],
-                ['Unpaid Amount', f"Rs.{overall_unpaid:.2f}", f"{100-payment_rate:.1f}%"]
-            ]
-
-            summary_table = Table(summary_data, colWidths=[2*inch, 2*inch, 2*inch])
-            summary_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-
-            story.append(summary_table)
-
-        doc.build(story)
-        buffer.seek(0)
-        return buffer
+        # Last seven business days, today included
+        end_date = business_today()
+        start_date = end_date - timedelta(days=6)
+        rows = weekly_report_rows(start_date, end_date, Sale.customer_name)
+
+        return self._build_weekly_report(
+            f"Weekly Sales Report by Customer<br/>({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')})",
+            rows,
+            group_header=lambda customer_name: f"Customer: {customer_name}",
+            first_column=('Date', lambda row: row.business_date.strftime('%Y-%m-%d')),
+            col_widths=[0.8*inch, 1.5*inch, 1*inch, 0.5*inch, 0.8*inch, 1*inch, 1.4*inch]
+        )
     
     def generate_weekly_report_by_date(self):
         """Generate PDF report grouped by date"""
+        # Last seven business days, today included
+        end_date = business_today()
+        start_date = end_date - timedelta(days=6)
+        rows = weekly_report_rows(start_date, end_date, Sale.business_date)
+
+        return self._build_weekly_report(
+            f"Weekly Sales Report by Date<br/>({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')})",
+            rows,
+            group_header=lambda day: f"Date: {day.strftime('%Y-%m-%d')}",
+            first_column=('Customer Name', lambda row: row.customer_name),
+            col_widths=[1*inch, 1.4*inch, 1*inch, 0.5*inch, 0.8*inch, 1*inch, 1.3*inch]
+        )
+
+    def _build_weekly_report(self, subtitle_text, rows, group_header, first_column, col_widths):
+        """Lay out weekly_report_rows: one table per group with its subtotals, then the payment summary"""
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72,
                               topMargin=72, bottomMargin=18)
         
-        # Get weekly sales data
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=7)
-        
-        sales = Sale.query.filter(
-            Sale.sale_date >= start_date,
-            Sale.sale_date <= end_date
-        ).order_by(Sale.sale_date, Sale.customer_name).all()
-        
         # Build PDF content
         story = []
         
         # Title
         title = Paragraph("SRI LAKSHMI ENTERPRISES", self.title_style)
-        subtitle = Paragraph(f"Weekly Sales Report by Date<br/>({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')})", 
-                            self.styles['Heading2'])
+        subtitle = Paragraph(subtitle_text, self.styles['Heading2'])
         story.append(title)
         story.append(subtitle)
         story.append(Spacer(1, 20))
-        
-        # Group sales by date
-        date_sales = {}
-        for sale in sales:
-            date_key = sale.sale_date.strftime('%Y-%m-%d')
-            if date_key not in date_sales:
-                date_sales[date_key] = []
-            date_sales[date_key].append(sale)
-        
-        # Create tables for each date
-        for date_key, date_sale_list in sorted(date_sales.items()):
-            # Date header
-            date_header = Paragraph(f"Date: {date_key}", self.styles['Heading3'])
-            story.append(date_header)
-            story.append(Spacer(1, 10))
-            
-            # Table data with payment status
-            data = [['Customer Name', 'Product Name', 'Company', 'Qty', 'Unit Price', 'Amount (Rs.)', 'Payment Status']]
-            total_amount = 0
-            paid_amount = 0
-            unpaid_amount = 0
-
-            for sale in date_sale_list:
-                payment_status = "✓ PAID" if sale.payment_status == 'paid' else "⚠ UNPAID"
-                payment_method = f" ({sale.payment_method.upper()})" if sale.payment_method else ""
+
+        first_header, first_value = first_column
+        data = None
+        for row in rows:
+            if row.level == 0:
+                if data is None:
+                    # Group header
+                    story.append(Paragraph(group_header(row.group_key), self.styles['Heading3']))
+                    story.append(Spacer(1, 10))
+
+                    # Table data with payment status
+                    data = [[first_header, 'Product Name', 'Company', 'Qty', 'Unit Price', 'Amount (Rs.)', 'Payment Status']]
+
+                payment_status = "✓ PAID" if row.payment_status == 'paid' else "⚠ UNPAID"
+                payment_method = f" ({row.payment_method.upper()})" if row.payment_method else ""
 
                 data.append([
-                    sale.customer_name,
-                    sale.product_name,
-                    sale.company_name,
-                    str(sale.quantity_sold),
-                    f"Rs.{sale.unit_price:.2f}",
-                    f"Rs.{sale.sale_amount:.2f}",
+                    first_value(row),
+                    row.product_name,
+                    row.company_name,
+                    str(row.quantity_sold),
+                    format_rupees(row.unit_price_paise),
+                    format_rupees(row.sale_amount_paise),
                     payment_status + payment_method
                 ])
 
-                total_amount += sale.sale_amount
-                if sale.payment_status == 'paid':
-                    paid_amount += sale.sale_amount
-                else:
-                    unpaid_amount += sale.sale_amount
-
-            # Add summary rows
-            data.append(['', '', '', '', '', 'Total:', f"Rs.{total_amount:.2f}"])
-            data.append(['', '', '', '', '', 'Paid:', f"Rs.{paid_amount:.2f}"])
-            data.append(['', '', '', '', '', 'Unpaid:', f"Rs.{unpaid_amount:.2f}"])
-
-            # Create table with payment status column
-            table = Table(data, colWidths=[1*inch, 1.4*inch, 1*inch, 0.5*inch, 0.8*inch, 1*inch, 1.3*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -4), colors.beige),
-                ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
-                ('FONTNAME', (0, -3), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 9)
-            ]))
-            
-            story.append(table)
-            story.append(Spacer(1, 20))
-
-        # Add overall payment summary
-        if sales:
-            story.append(Spacer(1, 30))
-            summary_header = Paragraph("📊 Weekly Payment Summary", self.styles['Heading2'])
-            story.append(summary_header)
-            story.append(Spacer(1, 15))
-
-            # Calculate overall totals
-            overall_total = sum(sale.sale_amount for sale in sales)
-            overall_paid = sum(sale.sale_amount for sale in sales if sale.payment_status == 'paid')
-            overall_unpaid = overall_total - overall_paid
-            payment_rate = (overall_paid / overall_total * 100) if overall_total > 0 else 0
-
-            summary_data = [
-                ['Metric', 'Amount', 'Percentage'],
-                ['Total Sales', f"Rs.{overall_total:.2f}", '100%'],
-                ['Paid Amount', f"Rs.{overall_paid:.2f}", f"{payment_rate:.1f}%"],
-                ['Unpaid Amount', f"Rs.{overall_unpaid:.2f}", f"{100-payment_rate:.1f}%"]
-            ]
-
-            summary_table = Table(summary_data, colWidths=[2*inch, 2*inch, 2*inch])
-            summary_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-
-            story.append(summary_table)
+            elif row.level == 1:
+                # Add summary rows from the group subtotal
+                data.append(['', '', '', '', '', 'Total:', format_rupees(row.total)])
+                data.append(['', '', '', '', '', 'Paid:', format_rupees(row.paid)])
+                data.append(['', '', '', '', '', 'Unpaid:', format_rupees(row.total - row.paid)])
+
+                # Create table with payment status column
+                table = Table(data, colWidths=col_widths)
+                table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 10),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -4), colors.beige),
+                    ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
+                    ('FONTNAME', (0, -3), (-1, -1), 'Helvetica-Bold'),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                    ('FONTSIZE', (0, 1), (-1, -1), 9)
+                ]))
+
+                story.append(table)
+                story.append(Spacer(1, 20))
+                data = None
+
+            elif row.total is not None:
+                # Add overall payment summary from the grand total (NULL when the week has no sales)
+                story.append(Spacer(1, 30))
+                summary_header = Paragraph("📊 Weekly Payment Summary", self.styles['Heading2'])
+                story.append(summary_header)
+                story.append(Spacer(1, 15))
+
+                overall_total = row.total
+                overall_paid = row.paid
+                overall_unpaid = overall_total - overall_paid
+                payment_rate = (overall_paid / overall_total * 100) if overall_total > 0 else 0
+
+                summary_data = [
+                    ['Metric', 'Amount', 'Percentage'],
+                    ['Total Sales', format_rupees(overall_total), '100%'],
+                    ['Paid Amount', format_rupees(overall_paid), f"{payment_rate:.1f}%"],
+                    ['Unpaid Amount', format_rupees(overall_unpaid), f"{100-payment_rate:.1f}%"]
+                ]
+
+                summary_table = Table(summary_data, colWidths=[2*inch, 2*inch, 2*inch])
+                summary_table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 12),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
+                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Bold'),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+                ]))
+
+                story.append(summary_table)
 
         doc.build(story)
         buffer.seek(0)
         return buffer
-
+    
     def generate_receipt(self, sale_data):
         """Generate PDF receipt for a single sale"""
         buffer = io.BytesIO()
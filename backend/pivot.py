@@ -0,0 +1,251 @@
+"""
+Ad-hoc pivot reports compiled to a single SQL query.
+
+A pivot names row and column dimensions, measures and filters from fixed
+whitelists. It compiles to one GROUP BY GROUPING SETS query on PostgreSQL
+(a UNION ALL of the same grouping sets elsewhere) that returns the cells,
+row subtotals, column subtotals and the grand total together. When the
+daily rollup holds every requested dimension, days it is current for are
+read from it and only the days with sales written since its last refresh
+from the sales table. Results are cached (cache.py) by normalized query
+until a sale write or archive invalidates the 'sale' tag.
+"""
+
+from models import db, Sale, SaleDailyRollup, sale_business_days
+from sqlalchemy import Float, cast, func, literal, literal_column, null, select, tuple_, union_all
+from rollup import stale_days
+from sales_search import parse_date
+from money import to_rupees
+from cache import cache
+
+DIMENSIONS = ('customer', 'product', 'company', 'payment_status', 'payment_method', 'day', 'week', 'month')
+DATE_DIMENSIONS = ('day', 'week', 'month')
+MEASURES = ('sum(sale_amount)', 'sum(quantity_sold)', 'count', 'avg(sale_amount)')
+MONEY_MEASURES = {'sum(sale_amount)', 'avg(sale_amount)'}
+
+# Dimensions the daily rollup does not keep
+SALES_ONLY_DIMENSIONS = {'payment_method'}
+
+MAX_DIMENSIONS = 4
+MAX_RESULT_ROWS = 50000
+
+def parse_pivot(args):
+    """Validate request args into a normalized pivot spec; raises ValueError"""
+    def names(param, allowed, default=None):
+        raw = args.get(param, default or '')
+        values = [value.strip() for value in raw.split(',') if value.strip()]
+        unknown = [value for value in values if value not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown {param}: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+        return tuple(values)
+
+    rows = names('rows', DIMENSIONS)
+    cols = names('cols', DIMENSIONS)
+    measures = names('measure', MEASURES, 'sum(sale_amount)')
+    if len(set(rows + cols)) != len(rows + cols):
+        raise ValueError('A dimension can only be used once')
+    if len(rows + cols) > MAX_DIMENSIONS:
+        raise ValueError(f'At most {MAX_DIMENSIONS} dimensions')
+
+    # filter=customer:Ravi (repeatable), several values separated by |
+    filters = {}
+    for raw in args.getlist('filter'):
+        dimension, _, values = raw.partition(':')
+        if dimension not in DIMENSIONS or dimension in DATE_DIMENSIONS or not values:
+            raise ValueError('filter must look like dimension:value (use date_from/date_to for dates)')
+        filters[dimension] = tuple(sorted(set(filters.get(dimension, ())) | set(values.split('|'))))
+
+    date_from = parse_date(args['date_from']).date() if args.get('date_from') else None
+    date_to = parse_date(args['date_to']).date() if args.get('date_to') else None
+
+    return {
+        'rows': rows,
+        'cols': cols,
+        'measures': measures,
+        'filters': tuple(sorted(filters.items())),
+        'date_from': date_from,
+        'date_to': date_to
+    }
+
+def data_version():
+    """Highest sale change version: every sale insert or payment update raises it"""
+    return db.session.query(func.max(Sale.change_version)).scalar() or 0
+
+def date_label(column, unit, dialect):
+    """Day, week (Monday) or month of a date column as a YYYY-MM-DD / YYYY-MM string"""
+    if dialect == 'postgresql':
+        if unit == 'week':
+            column = func.date_trunc(literal_column("'week'"), column)
+        return func.to_char(column, literal_column("'YYYY-MM'" if unit == 'month' else "'YYYY-MM-DD'"))
+    if unit == 'week':
+        return func.date(column, literal_column("'-6 days'"), literal_column("'weekday 1'"))
+    return func.strftime(literal_column("'%Y-%m'" if unit == 'month' else "'%Y-%m-%d'"), column)
+
+def base_query(spec, source, dialect, days=None):
+    """Filtered rows with one labelled column per dimension and the measure inputs.
+
+    `days` are the days written since the rollup's last refresh: left out of the
+    rollup rows and the only days read from sales (None reads every day).
+    """
+    if source == 'rollup':
+        model = SaleDailyRollup
+        fields = {
+            'customer': model.customer_name,
+            'product': model.product_name,
+            'company': model.company_name,
+            'payment_status': model.payment_status
+        }
+        day = model.day
+        inputs = [model.amount_paise.label('amount'), model.quantity.label('quantity'), model.sale_count.label('sales')]
+    else:
+        model = Sale
+        fields = {
+            'customer': model.customer_name,
+            'product': model.product_name,
+            'company': model.company_name,
+            'payment_status': model.payment_status,
+            'payment_method': model.payment_method
+        }
+        day = model.business_date
+        inputs = [model.sale_amount_paise.label('amount'), model.quantity_sold.label('quantity'), literal(1).label('sales')]
+
+    dimensions = [
+        (date_label(day, name, dialect) if name in DATE_DIMENSIONS else fields[name]).label(name)
+        for name in spec['rows'] + spec['cols']
+    ]
+    query = select(*dimensions, *inputs)
+
+    for name, values in spec['filters']:
+        query = query.where(fields[name].in_(values))
+    if source == 'rollup':
+        if spec['date_from']:
+            query = query.where(day >= spec['date_from'])
+        if spec['date_to']:
+            query = query.where(day <= spec['date_to'])
+        if days:
+            query = query.where(day.notin_(days))
+        return query
+
+    if spec['date_from']:
+        query = query.where(sale_business_days(spec['date_from'], spec['date_to']))
+    elif spec['date_to']:
+        query = query.where(day <= spec['date_to'])
+    if days is not None:
+        query = query.where(sale_business_days(days[0], days[-1]), day.in_(days))
+    return query
+
+def base_rows(spec, dialect):
+    """(subquery of the rows to aggregate, source name)"""
+    names = set(spec['rows'] + spec['cols']) | {name for name, _ in spec['filters']}
+    stale = None if SALES_ONLY_DIMENSIONS & names else stale_days()
+    if stale is None:
+        return base_query(spec, 'sales', dialect).subquery('base'), 'sales'
+    if spec['date_from']:
+        stale = [day for day in stale if day >= spec['date_from']]
+    if spec['date_to']:
+        stale = [day for day in stale if day <= spec['date_to']]
+    if not stale:
+        return base_query(spec, 'rollup', dialect).subquery('base'), 'rollup'
+    return union_all(
+        base_query(spec, 'rollup', dialect, stale), base_query(spec, 'sales', dialect, stale)
+    ).subquery('base'), 'rollup+sales'
+
+def measure_columns(base, measures):
+    amount = func.sum(base.c.amount)
+    sales = func.sum(base.c.sales)
+    expressions = {
+        'sum(sale_amount)': amount,
+        'sum(quantity_sold)': func.sum(base.c.quantity),
+        'count': sales,
+        # Integer division on PostgreSQL otherwise
+        'avg(sale_amount)': cast(amount, Float) / func.nullif(sales, 0)
+    }
+    return [expressions[measure].label(f'm{i}') for i, measure in enumerate(measures)]
+
+def grouping_sets(spec):
+    """(cells, row subtotals, column subtotals, grand total) as dimension tuples, without duplicates"""
+    rows, cols = spec['rows'], spec['cols']
+    sets = []
+    for dimensions in (rows + cols, rows, cols, ()):
+        if dimensions not in sets:
+            sets.append(dimensions)
+    return sets
+
+def pivot_query(spec, base, dialect):
+    """One statement returning (dimensions..., grouping mask, measures...) for every grouping set"""
+    dimensions = list(spec['rows'] + spec['cols'])
+    measures = measure_columns(base, spec['measures'])
+    sets = grouping_sets(spec)
+
+    if not dimensions:
+        return select(literal(0).label('grouping'), *measures)
+
+    if dialect == 'postgresql':
+        columns = [base.c[name] for name in dimensions]
+        return select(*columns, func.grouping(*columns).label('grouping'), *measures).group_by(
+            func.grouping_sets(*[tuple_(*[base.c[name] for name in grouped]) for grouped in sets])
+        )
+
+    # Same result without GROUPING SETS: one GROUP BY per set, with the mask GROUPING() would give
+    parts = []
+    for grouped in sets:
+        mask = sum(1 << (len(dimensions) - 1 - i) for i, name in enumerate(dimensions) if name not in grouped)
+        columns = [base.c[name] if name in grouped else null().label(name) for name in dimensions]
+        part = select(*columns, literal(mask).label('grouping'), *measure_columns(base, spec['measures']))
+        if grouped:
+            part = part.group_by(*[base.c[name] for name in grouped])
+        parts.append(part)
+    return union_all(*parts)
+
+def run_pivot(spec):
+    """Pivot result for a parsed spec, from the cache while no sale was written since"""
+    key = repr(tuple(sorted(spec.items())))
+    result, _ = cache.get_or_compute('pivot', key, ['sale'], lambda: compute_pivot(spec))
+    return result
+
+def compute_pivot(spec):
+    version = data_version()
+    dimensions = list(spec['rows'] + spec['cols'])
+    dialect = db.engine.dialect.name
+    base, source = base_rows(spec, dialect)
+
+    rows = db.session.execute(pivot_query(spec, base, dialect).limit(MAX_RESULT_ROWS + 1)).all()
+    if len(rows) > MAX_RESULT_ROWS:
+        raise ValueError(f'Pivot has more than {MAX_RESULT_ROWS} rows, narrow it with filters or dates')
+
+    row_mask = sum(1 << (len(dimensions) - 1 - i) for i, name in enumerate(dimensions) if name in spec['cols'])
+    col_mask = sum(1 << (len(dimensions) - 1 - i) for i, name in enumerate(dimensions) if name in spec['rows'])
+    total_mask = (1 << len(dimensions)) - 1
+
+    result = {'cells': [], 'row_totals': [], 'col_totals': [], 'grand_total': None}
+    for row in rows:
+        values = row._mapping
+        mask = values['grouping']
+        entry = {name: values[name] for name in dimensions if not mask & (1 << (len(dimensions) - 1 - dimensions.index(name)))}
+        for i, measure in enumerate(spec['measures']):
+            value = values[f'm{i}']
+            if value is not None:
+                value = round(to_rupees(value), 2) if measure in MONEY_MEASURES else int(value)
+            entry[measure] = value
+
+        # A set plays several roles when rows or cols is empty (row totals are then the cells)
+        if mask == total_mask:
+            result['grand_total'] = entry
+        if mask == 0:
+            result['cells'].append(entry)
+        if mask == row_mask:
+            result['row_totals'].append(entry)
+        if mask == col_mask:
+            result['col_totals'].append(entry)
+
+    for key_name in ('cells', 'row_totals', 'col_totals'):
+        result[key_name].sort(key=lambda entry: [str(entry.get(name) or '') for name in dimensions])
+
+    result.update({
+        'rows': list(spec['rows']),
+        'cols': list(spec['cols']),
+        'measures': list(spec['measures']),
+        'source': source,
+        'data_version': version
+    })
+    return result
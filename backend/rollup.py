@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Daily sales rollup
+
+Sales are aggregated per day, product, customer and payment status into
+sale_daily_rollup. A refresh only recomputes the days touched by sales
+written since the last refresh (found through the sync change versions),
+so late payment updates are picked up without rebuilding history.
+
+Usage:
+    python rollup.py refresh        # incremental refresh (run from cron)
+    python rollup.py rebuild        # recompute every day
+"""
+
+import sys
+from datetime import datetime, timedelta
+from models import db, Sale, SaleDailyRollup, RollupState, sale_business_days
+from sqlalchemy import func, insert, select
+from sync import current_change_version
+from config import Config
+
+ROLLUP_NAME = 'sale_daily'
+
+def sale_day():
+    """SQL expression for the (business) day a sale belongs to"""
+    return Sale.business_date
+
+def rollup_version():
+    """Change version the rollup reflects, or None if it was never built"""
+    state = db.session.get(RollupState, ROLLUP_NAME)
+    return state.change_version if state else None
+
+def stale_days():
+    """Days whose rollup rows miss sales written since the last refresh (None if it was never built)"""
+    version = rollup_version()
+    if version is None:
+        return None
+    return sorted({
+        parse_day(day) for (day,) in db.session.query(sale_day()).filter(Sale.change_version > version).distinct()
+    })
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else value
+
+def _rebuild_days(days):
+    """Replace the rollup rows for `days` (None means every day) with fresh aggregates"""
+    day = sale_day()
+    aggregate = select(
+        day,
+        Sale.product_name,
+        Sale.company_name,
+        Sale.customer_name,
+        Sale.payment_status,
+        func.sum(Sale.quantity_sold),
+        func.sum(Sale.sale_amount_paise),
+        func.count(Sale.id)
+    ).group_by(
+        day, Sale.product_name, Sale.company_name, Sale.customer_name, Sale.payment_status
+    )
+
+    delete = SaleDailyRollup.query
+    if days is not None:
+        aggregate = aggregate.where(sale_business_days(min(days), max(days)), day.in_(days))
+        delete = delete.filter(SaleDailyRollup.day.in_(days))
+    delete.delete(synchronize_session=False)
+
+    targets = ['day', 'product_name', 'company_name', 'customer_name', 'payment_status',
+               'quantity', 'amount_paise', 'sale_count']
+    if Config.MONEY_LEGACY_COLUMNS:
+        # Float rupees for workers of the previous release, see migrate_money_paise.py
+        aggregate = aggregate.add_columns(func.sum(Sale.sale_amount_paise) / 100.0)
+        targets.append('amount')
+    db.session.execute(insert(SaleDailyRollup.__table__).from_select(targets, aggregate))
+
+def refresh_rollup(full=False):
+    """Bring the rollup up to the latest change version; returns the number of days recomputed"""
+    target = current_change_version()
+    state = db.session.get(RollupState, ROLLUP_NAME)
+    if state is None:
+        state = RollupState(name=ROLLUP_NAME, change_version=0)
+        db.session.add(state)
+        full = True
+
+    if full:
+        _rebuild_days(None)
+        day_count = db.session.query(func.count(func.distinct(SaleDailyRollup.day))).scalar()
+    else:
+        days = sorted({
+            parse_day(day) for (day,) in db.session.query(sale_day()).filter(
+                Sale.change_version > state.change_version,
+                Sale.change_version <= target
+            ).distinct()
+        })
+        if days:
+            _rebuild_days(days)
+        day_count = len(days)
+
+    state.change_version = target
+    state.refreshed_at = datetime.utcnow()
+    db.session.commit()
+    return day_count
+
+def rebuild_day_range(first_day, last_day):
+    """Recompute every day from first_day to last_day, e.g. after their sales were archived"""
+    days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+    _rebuild_days(days)
+    db.session.commit()
+    return len(days)
+
+def product_sales_since(first_day):
+    """{(product_name, company_name): [quantity, transactions]} of sales from first_day on; days the
+    rollup is current for are read from it, days written since its last refresh from sale"""
+    stale = stale_days()
+    totals = {}
+    queries = []
+    if stale is None:
+        sale_days = sale_business_days(first_day)
+    else:
+        queries.append(db.session.query(
+            SaleDailyRollup.product_name,
+            SaleDailyRollup.company_name,
+            func.sum(SaleDailyRollup.quantity),
+            func.sum(SaleDailyRollup.sale_count)
+        ).filter(
+            SaleDailyRollup.day >= first_day,
+            SaleDailyRollup.day.notin_(stale)
+        ).group_by(SaleDailyRollup.product_name, SaleDailyRollup.company_name))
+        stale = [day for day in stale if day >= first_day]
+        sale_days = sale_business_days(stale[0], stale[-1]) & sale_day().in_(stale) if stale else None
+
+    if sale_days is not None:
+        queries.append(db.session.query(
+            Sale.product_name,
+            Sale.company_name,
+            func.sum(Sale.quantity_sold),
+            func.count(Sale.id)
+        ).filter(sale_days).group_by(Sale.product_name, Sale.company_name))
+
+    for query in queries:
+        for product_name, company_name, quantity, transactions in query:
+            entry = totals.setdefault((product_name, company_name), [0, 0])
+            entry[0] += int(quantity or 0)
+            entry[1] += int(transactions or 0)
+    return totals
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if command in ('refresh', 'rebuild'):
+            print(f"🔄 {'Rebuilding' if command == 'rebuild' else 'Refreshing'} daily sales rollup...")
+            day_count = refresh_rollup(full=command == 'rebuild')
+            print(f"✅ Rollup recomputed for {day_count} days (change version {rollup_version()})")
+        else:
+            print(__doc__)
+            sys.exit(1)
@@ -0,0 +1,119 @@
+"""
+Filtered, sorted and keyset-paginated sales search.
+
+The filters are chosen to line up with the composite indexes declared on
+Sale: (customer_name, sale_date), (payment_status, sale_date) and
+(product_name, company_name, sale_date). Pages are addressed with an opaque
+cursor holding the last row's sort value and id, so deep pages cost the same
+as the first one.
+"""
+
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+from datetime import datetime, timedelta
+from models import db, Sale
+from sqlalchemy import tuple_
+from serializers import columns
+from money import to_paise
+
+SORT_COLUMNS = {
+    'date': Sale.sale_date,
+    'amount': Sale.sale_amount_paise,
+    'customer': Sale.customer_name
+}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def parse_date(value, end_of_day=False):
+    """Parse YYYY-MM-DD or a full ISO timestamp; a bare end date includes that whole day"""
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def parse_amount(name, value):
+    """Paise for a rupee amount parameter; ValueError for empty or non-numeric values"""
+    try:
+        amount = Decimal(value.strip())
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite():
+        raise ValueError(f"{name} must be a number")
+    return to_paise(amount)
+
+def encode_cursor(sort_value, sale_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, sale_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor, sort_by):
+    try:
+        sort_value, sale_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if sort_by == 'date':
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(sale_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def build_search_query(args, fields):
+    """Build the search query from request args; returns (query, sort_by, limit)"""
+    sort_by = args.get('sort', 'date')
+    if sort_by not in SORT_COLUMNS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_COLUMNS)}")
+    descending = args.get('order', 'desc') != 'asc'
+    limit = max(1, min(args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    sort_column = SORT_COLUMNS[sort_by]
+
+    # The sort value and id ride along at the end of each row to build the next cursor
+    query = db.session.query(*columns(Sale, fields), sort_column, Sale.id)
+
+    if args.get('customer'):
+        query = query.filter(Sale.customer_name == args['customer'])
+    if args.get('product'):
+        query = query.filter(Sale.product_name == args['product'])
+    if args.get('company'):
+        query = query.filter(Sale.company_name == args['company'])
+    if args.get('payment_status'):
+        query = query.filter(Sale.payment_status == args['payment_status'])
+    if args.get('payment_method'):
+        query = query.filter(Sale.payment_method == args['payment_method'])
+    if args.get('date_from'):
+        query = query.filter(Sale.sale_date >= parse_date(args['date_from']))
+    if args.get('date_to'):
+        query = query.filter(Sale.sale_date < parse_date(args['date_to'], end_of_day=True))
+    if args.get('min_amount') is not None:
+        query = query.filter(Sale.sale_amount_paise >= parse_amount('min_amount', args['min_amount']))
+    if args.get('max_amount') is not None:
+        query = query.filter(Sale.sale_amount_paise <= parse_amount('max_amount', args['max_amount']))
+
+    if args.get('cursor'):
+        sort_value, sale_id = decode_cursor(args['cursor'], sort_by)
+        position = tuple_(sort_column, Sale.id)
+        if descending:
+            query = query.filter(position < tuple_(sort_value, sale_id))
+        else:
+            query = query.filter(position > tuple_(sort_value, sale_id))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Sale.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Sale.id.asc())
+
+    # One extra row tells us whether there is another page
+    return query.limit(limit + 1), sort_by, limit
+
+def explain(query):
+    """Query plan text for a query, using the dialect's EXPLAIN syntax"""
+    engine = db.engine
+    compiled = query.statement.compile(dialect=engine.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    connection = db.session.connection()
+    rows = connection.exec_driver_sql(prefix + str(compiled), params).fetchall()
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
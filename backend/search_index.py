@@ -0,0 +1,293 @@
+"""
+Product search backed by trigram similarity, and name autocomplete.
+
+On PostgreSQL with the pg_trgm extension (see migrate_search_indexes.py) the
+ranking is done by the database using GIN trigram indexes. Everywhere else an
+in-process inverted trigram index is kept per worker and caught up from the
+change versions stamped by sync.py.
+
+Autocomplete is always served from in-process sorted-array prefix indexes
+built from Stock and Sale.customer_name, caught up the same way.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+from models import db, Stock, Sale, StockTombstone
+from sqlalchemy import func, literal, text
+from sync import on_commit_change
+
+# Same minimum as pg_trgm's default similarity threshold
+MIN_SIMILARITY = 0.3
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_trigram_support = {}
+
+def trigrams(value):
+    """pg_trgm style trigrams: lowercase words padded with two leading and one trailing space"""
+    grams = set()
+    for word in _WORD_RE.findall((value or '').lower()):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+def trigram_search_available():
+    """True when the database can rank by trigram similarity itself"""
+    engine = db.engine
+    if engine.url not in _trigram_support:
+        available = False
+        if engine.dialect.name == 'postgresql':
+            available = db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+        _trigram_support[engine.url] = available
+    return _trigram_support[engine.url]
+
+def trigram_match(query):
+    """SQL filter using the GIN trigram indexes on product and company name"""
+    return db.or_(
+        literal(query).op('<%')(Stock.product_name),
+        literal(query).op('<%')(Stock.company_name)
+    )
+
+def trigram_score(query):
+    """SQL relevance score for a stock row"""
+    return func.greatest(
+        func.word_similarity(query, Stock.product_name),
+        func.word_similarity(query, Stock.company_name)
+    )
+
+class TrigramIndex:
+    """Inverted index from trigram to document ids with similarity ranking"""
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.documents = {}
+
+    def add(self, doc_id, *values):
+        self.remove(doc_id)
+        grams = set()
+        for value in values:
+            grams |= trigrams(value)
+        self.documents[doc_id] = grams
+        for gram in grams:
+            self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        grams = self.documents.pop(doc_id, None)
+        if not grams:
+            return
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def search(self, query, limit, min_similarity=MIN_SIMILARITY):
+        """Ids of the `limit` best matches, best first"""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for doc_id in self.postings.get(gram, ()):
+                shared[doc_id] += 1
+
+        scored = []
+        for doc_id, count in shared.items():
+            # Fraction of the query found in the document (like word_similarity),
+            # with plain similarity as a tie-breaker favouring closer matches
+            coverage = count / len(query_grams)
+            if coverage < min_similarity:
+                continue
+            similarity = count / (len(query_grams) + len(self.documents[doc_id]) - count)
+            scored.append((coverage, similarity, -doc_id))
+
+        return [-item[2] for item in heapq.nlargest(limit, scored)]
+
+class StockSearchIndex:
+    """Per-process trigram index over stock, kept current from change versions"""
+
+    def __init__(self):
+        self.index = TrigramIndex()
+        self.version = None
+        self.next_refresh = 0
+        self.lock = threading.Lock()
+
+    def mark_stale(self):
+        self.next_refresh = 0
+
+    def refresh(self):
+        """Load the catalog on first use, then apply only rows changed since the last refresh"""
+        interval = current_app.config.get('SEARCH_INDEX_REFRESH_SECONDS', 2)
+        with self.lock:
+            if time.monotonic() < self.next_refresh:
+                return
+
+            since = self.version or 0
+            stock_query = db.session.query(
+                Stock.id, Stock.product_name, Stock.company_name, Stock.change_version
+            )
+            if self.version is not None:
+                stock_query = stock_query.filter(Stock.change_version > since)
+            for stock_id, product_name, company_name, version in stock_query:
+                self.index.add(stock_id, product_name, company_name)
+                since = max(since, version or 0)
+
+            deleted = db.session.query(StockTombstone.stock_id, StockTombstone.change_version).filter(
+                StockTombstone.change_version > (self.version or 0)
+            )
+            for stock_id, version in deleted:
+                self.index.remove(stock_id)
+                since = max(since, version)
+
+            self.version = since
+            self.next_refresh = time.monotonic() + interval
+
+    def search(self, query, limit):
+        self.refresh()
+        return self.index.search(query, limit)
+
+class PrefixIndex:
+    """Sorted array of lowercase names for prefix lookups, weighted by usage"""
+
+    def __init__(self, max_entries=None):
+        self.keys = []
+        self.entries = {}
+        self.max_entries = max_entries
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, name, weight=1):
+        display = (name or '').strip()
+        key = display.lower()
+        if not key:
+            return
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[1] += weight
+            return
+        self.entries[key] = [display, weight]
+        bisect.insort(self.keys, key)
+        if self.max_entries and len(self.keys) > self.max_entries:
+            self._evict()
+
+    def discard(self, name, weight=1):
+        key = (name or '').strip().lower()
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry[1] -= weight
+        if entry[1] <= 0:
+            del self.entries[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def _evict(self):
+        """Drop the least used tenth of the entries to keep memory bounded"""
+        keep = self.max_entries * 9 // 10
+        for key, _ in heapq.nsmallest(len(self.keys) - keep, self.entries.items(), key=lambda item: item[1][1]):
+            del self.entries[key]
+        self.keys = sorted(self.entries)
+
+    def lookup(self, prefix, limit):
+        """Most used names starting with `prefix` (case-insensitive)"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        # Every key with the prefix sorts between these two bounds
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', start)
+        matches = heapq.nsmallest(
+            limit, (self.entries[key] for key in self.keys[start:end]), key=lambda entry: (-entry[1], entry[0])
+        )
+        return [entry[0] for entry in matches]
+
+class AutocompleteIndex:
+    """Per-process prefix indexes for product, company and customer names"""
+
+    KINDS = ('product', 'company', 'customer')
+
+    def __init__(self):
+        self.indexes = None
+        self.stock_names = {}
+        self.version = None
+        self.last_sale_id = 0
+        self.next_refresh = 0
+        self.lock = threading.Lock()
+
+    def mark_stale(self):
+        self.next_refresh = 0
+
+    def _set_stock(self, stock_id, product_name, company_name):
+        self._drop_stock(stock_id)
+        self.stock_names[stock_id] = (product_name, company_name)
+        self.indexes['product'].add(product_name)
+        self.indexes['company'].add(company_name)
+
+    def _drop_stock(self, stock_id):
+        names = self.stock_names.pop(stock_id, None)
+        if names is not None:
+            self.indexes['product'].discard(names[0])
+            self.indexes['company'].discard(names[1])
+
+    def refresh(self):
+        """Build on first use, then apply stock changes and new sales incrementally"""
+        config = current_app.config
+        with self.lock:
+            if time.monotonic() < self.next_refresh:
+                return
+
+            if self.indexes is None:
+                self.indexes = {
+                    'product': PrefixIndex(),
+                    'company': PrefixIndex(),
+                    'customer': PrefixIndex(config.get('AUTOCOMPLETE_MAX_CUSTOMERS'))
+                }
+
+            since = self.version or 0
+            stock_query = db.session.query(
+                Stock.id, Stock.product_name, Stock.company_name, Stock.change_version
+            )
+            if self.version is not None:
+                stock_query = stock_query.filter(Stock.change_version > since)
+            for stock_id, product_name, company_name, version in stock_query:
+                self._set_stock(stock_id, product_name, company_name)
+                since = max(since, version or 0)
+
+            deleted = db.session.query(StockTombstone.stock_id, StockTombstone.change_version).filter(
+                StockTombstone.change_version > (self.version or 0)
+            )
+            for stock_id, version in deleted:
+                self._drop_stock(stock_id)
+                since = max(since, version)
+            self.version = since
+
+            # Sales are append-only, so new customers are simply sales with a higher id
+            customers = db.session.query(
+                Sale.customer_name, func.count(Sale.id), func.max(Sale.id)
+            ).filter(Sale.id > self.last_sale_id).group_by(Sale.customer_name)
+            for customer_name, count, max_id in customers:
+                self.indexes['customer'].add(customer_name, count)
+                self.last_sale_id = max(self.last_sale_id, max_id)
+
+            self.next_refresh = time.monotonic() + config.get('SEARCH_INDEX_REFRESH_SECONDS', 2)
+
+    def lookup(self, kind, prefix, limit):
+        self.refresh()
+        return self.indexes[kind].lookup(prefix, limit)
+
+stock_search_index = StockSearchIndex()
+autocomplete_index = AutocompleteIndex()
+
+# Writes made by this process show up on the next lookup; other
+# workers' writes are picked up by the periodic refresh.
+on_commit_change(stock_search_index.mark_stale)
+on_commit_change(autocomplete_index.mark_stale)
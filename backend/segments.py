@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Customer RFM (recency, frequency, monetary) segmentation
+
+Per-customer totals come from one grouped query over the sales table. Each
+measure is scored 1-5 by quintile and customers are labelled from their
+recency and frequency scores, all with NumPy array operations. The result
+replaces the customer_segment table, which the analytics endpoint reads
+through its indexes.
+
+Usage:
+    python segments.py refresh    # recompute every customer (run from cron, e.g. nightly)
+"""
+
+import sys
+from datetime import datetime
+import numpy as np
+from models import db, Sale, CustomerSegment
+from sqlalchemy import func
+from sync import allocate_change_versions, SEGMENTS_COUNTER
+from config import Config
+from money import to_rupees
+
+SEGMENTS = ('champions', 'loyal', 'new', 'at_risk', 'hibernating', 'needs_attention')
+
+INSERT_BATCH_SIZE = 5000
+
+def quintile_scores(values, higher_is_better=True):
+    """Score each value 1-5 by the quintile it falls in; ties share a score"""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int16)
+    edges = np.quantile(values, [0.2, 0.4, 0.6, 0.8])
+    if higher_is_better:
+        return (np.searchsorted(edges, values, side='left') + 1).astype(np.int16)
+    return (5 - np.searchsorted(edges, values, side='right')).astype(np.int16)
+
+def label_segments(r_score, f_score):
+    """Segment name per customer from recency and frequency scores"""
+    return np.select([
+        (r_score >= 4) & (f_score >= 4),
+        (r_score >= 3) & (f_score >= 3),
+        (r_score >= 4) & (f_score <= 1),
+        (r_score <= 2) & (f_score >= 3),
+        (r_score <= 2) & (f_score <= 2),
+    ], SEGMENTS[:-1], default=SEGMENTS[-1])
+
+def refresh_segments(now=None):
+    """Recompute and store RFM scores for every customer; returns the number of customers"""
+    now = now or datetime.utcnow()
+    totals = db.session.query(
+        Sale.customer_name,
+        func.max(Sale.sale_date),
+        func.count(Sale.id),
+        func.sum(Sale.sale_amount_paise)
+    ).group_by(Sale.customer_name).all()
+
+    names = [row[0] for row in totals]
+    last_purchase = [row[1] for row in totals]
+    recency = np.array([(now - at).total_seconds() / 86400 for at in last_purchase], dtype=np.float64)
+    frequency = np.array([row[2] for row in totals], dtype=np.int64)
+    monetary = np.array([row[3] or 0 for row in totals], dtype=np.int64)
+
+    r_score = quintile_scores(recency, higher_is_better=False)
+    f_score = quintile_scores(frequency)
+    m_score = quintile_scores(monetary)
+    segment = label_segments(r_score, f_score)
+
+    CustomerSegment.query.delete()
+    table = CustomerSegment.__table__
+    for start in range(0, len(names), INSERT_BATCH_SIZE):
+        end = start + INSERT_BATCH_SIZE
+        rows = [{
+            'customer_name': name,
+            'last_purchase_at': at,
+            'recency_days': int(days),
+            'frequency': int(count),
+            'monetary_paise': int(amount),
+            'r_score': int(r),
+            'f_score': int(f),
+            'm_score': int(m),
+            'segment': str(label),
+            'refreshed_at': now
+        } for name, at, days, count, amount, r, f, m, label in zip(
+            names[start:end], last_purchase[start:end], recency[start:end], frequency[start:end],
+            monetary[start:end], r_score[start:end], f_score[start:end], m_score[start:end], segment[start:end]
+        )]
+        if Config.MONEY_LEGACY_COLUMNS:
+            # Float rupees for workers of the previous release, see migrate_money_paise.py
+            for row in rows:
+                row['monetary'] = to_rupees(row['monetary_paise'])
+        db.session.execute(table.insert(), rows)
+    allocate_change_versions(db.session.connection(), 1, SEGMENTS_COUNTER)
+    db.session.commit()
+    return len(names)
+
+if __name__ == '__main__':
+    from app import create_app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    app, database, StockModel, SaleModel = create_app()
+
+    with app.app_context():
+        if command == 'refresh':
+            print("🔄 Refreshing customer RFM segments...")
+            count = refresh_segments()
+            print(f"✅ Segments computed for {count} customers")
+        else:
+            print(__doc__)
+            sys.exit(1)
@@ -0,0 +1,132 @@
+"""
+Fast serialization path for list endpoints.
+
+Rows are selected as plain column tuples (no ORM objects or identity map),
+converted column by column and encoded with orjson when it is installed.
+Responses can be returned row-wise (the default, same shape as to_dict) or
+columnar with ?format=columns, and are compressed with brotli or gzip when the
+client asks for it in Accept-Encoding.
+"""
+
+import gzip
+import json
+from flask import request, current_app
+from money import to_rupees
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STOCK_FIELDS = ('id', 'product_name', 'company_name', 'quantity', 'unit_price', 'date_added')
+SALE_FIELDS = (
+    'id', 'product_name', 'company_name', 'quantity_sold', 'customer_name', 'unit_price',
+    'sale_amount', 'payment_status', 'payment_date', 'payment_method', 'sale_date'
+)
+DATETIME_FIELDS = {'date_added', 'payment_date', 'sale_date'}
+# API fields in rupees backed by integer paise columns
+MONEY_FIELDS = {'unit_price': 'unit_price_paise', 'sale_amount': 'sale_amount_paise'}
+
+# Small payloads are not worth the compression overhead
+MIN_COMPRESS_SIZE = 1024
+MAX_PAGE_SIZE = 10000
+
+def columns(model, fields):
+    """Model columns for the given field names, in order"""
+    return [getattr(model, MONEY_FIELDS.get(field, field)) for field in fields]
+
+def requested_fields(allowed):
+    """Fields selected with ?fields=a,b,c (all allowed fields when absent)"""
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return allowed
+
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if field and field not in fields:
+            fields.append(field)
+
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return tuple(fields) or allowed
+
+def paginate(query, model):
+    """Apply ?limit= and ?offset= to a query, with the primary key as a stable tie-breaker"""
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', type=int)
+    if limit is None and offset is None:
+        return query
+
+    query = query.order_by(model.id)
+    if limit is not None:
+        query = query.limit(max(0, min(limit, MAX_PAGE_SIZE)))
+    if offset:
+        query = query.offset(max(0, offset))
+    return query
+
+def format_datetime(value):
+    """Same output as strftime('%Y-%m-%d %H:%M:%S') but several times faster"""
+    return value.isoformat(' ', 'seconds') if value is not None else None
+
+def rows_to_columns(fields, rows):
+    """Transpose row tuples into per-field lists, formatting datetime and money columns"""
+    if not rows:
+        return [[] for _ in fields]
+    data = [list(column) for column in zip(*rows)]
+    for index, field in enumerate(fields):
+        if field in DATETIME_FIELDS:
+            data[index] = [format_datetime(value) for value in data[index]]
+        elif field in MONEY_FIELDS:
+            data[index] = [to_rupees(value) for value in data[index]]
+    return data
+
+def build_payload(fields, rows, fmt='rows'):
+    """Build a JSON-ready payload from row tuples in row or columnar format"""
+    data = rows_to_columns(fields, rows)
+    if fmt == 'columns':
+        return {
+            'fields': list(fields),
+            'columns': dict(zip(fields, data)),
+            'count': len(rows)
+        }
+    return [dict(zip(fields, row)) for row in zip(*data)]
+
+def encode_json(payload):
+    """Encode a payload to JSON bytes with the fastest available backend"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def compress(body):
+    """Compress a body according to the request's Accept-Encoding, returns (body, encoding)"""
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding == 'br':
+        return brotli.compress(body, quality=4), 'br'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=5), 'gzip'
+    return body, None
+
+def json_response(payload, status=200):
+    """Encoded, optionally compressed JSON response"""
+    body, encoding = compress(encode_json(payload))
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def rows_response(fields, rows, status=200):
+    """JSON response for row tuples, honouring ?format=columns"""
+    fmt = request.args.get('format', 'rows')
+    return json_response(build_payload(fields, rows, fmt), status)
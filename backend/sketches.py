@@ -0,0 +1,195 @@
+"""
+Approximate top-K products and customers (heavy hitters).
+
+Each business day of sales gets Space-Saving sketches of products by quantity and
+by revenue, and of customers by amount spent. A sketch keeps at most
+`capacity` counters; a counter's count never underestimates the true total
+and overestimates it by at most its recorded error. Sketches of several
+days merge into one with the same guarantee, so the top-K of any recent
+window is a merge of in-memory day buckets instead of a GROUP BY over the
+sales table.
+
+The buckets are loaded with grouped queries on first use, then caught up
+from sales with a higher id (sales are append-only) after every commit
+that wrote one. They are reloaded when sale partitions have been archived
+(partitions.py), which removes sales without writing any.
+"""
+
+import heapq
+import threading
+import time
+from flask import current_app
+from models import db, Sale
+from sqlalchemy import func
+from sync import on_commit_change, current_change_version, SALE_ARCHIVE_COUNTER
+from business_time import business_today, business_days_ago, business_day_start
+
+class SpaceSaving:
+    """Space-Saving summary of weighted items, with side totals kept per counter"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # item -> [count, error, quantity, revenue (paise), sales]
+        self.counters = {}
+        # Upper bound on the count of any item without a counter
+        self.floor = 0.0
+
+    def __len__(self):
+        return len(self.counters)
+
+    def add(self, item, weight, quantity=0, revenue=0, sales=1):
+        counter = self.counters.get(item)
+        if counter is None:
+            if len(self.counters) >= self.capacity:
+                # Replace the smallest counter; the newcomer inherits its count as error
+                smallest = min(self.counters, key=lambda key: self.counters[key][0])
+                base = self.counters.pop(smallest)[0]
+                self.floor = base
+            else:
+                base = 0.0
+            counter = self.counters[item] = [base, base, 0, 0, 0]
+        counter[0] += weight
+        counter[2] += quantity
+        counter[3] += revenue
+        counter[4] += sales
+
+    def merge(self, other):
+        """New sketch summarizing both inputs"""
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        for item in set(self.counters) | set(other.counters):
+            count, error, quantity, revenue, sales = 0.0, 0.0, 0, 0, 0
+            for sketch in (self, other):
+                counter = sketch.counters.get(item)
+                if counter is None:
+                    # Not tracked there, so it may have had up to that sketch's floor
+                    count += sketch.floor
+                    error += sketch.floor
+                else:
+                    count += counter[0]
+                    error += counter[1]
+                    quantity += counter[2]
+                    revenue += counter[3]
+                    sales += counter[4]
+            merged.counters[item] = [count, error, quantity, revenue, sales]
+
+        merged.floor = self.floor + other.floor
+        if len(merged.counters) > merged.capacity:
+            keep = heapq.nlargest(merged.capacity, merged.counters.items(), key=lambda entry: entry[1][0])
+            kept = dict(keep)
+            dropped = max(counter[0] for item, counter in merged.counters.items() if item not in kept)
+            merged.floor = max(merged.floor, dropped)
+            merged.counters = kept
+        return merged
+
+    def top(self, k):
+        """[(item, count, error, quantity, revenue, sales)] for the k largest counts"""
+        entries = heapq.nlargest(k, self.counters.items(), key=lambda entry: entry[1][0])
+        return [(item, *counter) for item, counter in entries]
+
+class HeavyHitters:
+    """Per-process day buckets of Space-Saving sketches over recent sales"""
+
+    KINDS = ('product_quantity', 'product_revenue', 'customer_revenue')
+
+    def __init__(self):
+        self.buckets = None
+        self.last_sale_id = 0
+        self.archive_version = None
+        self.next_refresh = 0
+        self.merged = {}
+        self.lock = threading.Lock()
+
+    def mark_stale(self):
+        self.next_refresh = 0
+
+    def _bucket(self, day):
+        bucket = self.buckets.get(day)
+        if bucket is None:
+            capacity = current_app.config.get('HEAVY_HITTERS_CAPACITY', 200)
+            bucket = self.buckets[day] = {kind: SpaceSaving(capacity) for kind in self.KINDS}
+        return bucket
+
+    def _add_products(self, day, product_name, company_name, quantity, revenue, sales):
+        bucket = self._bucket(day)
+        item = (product_name, company_name)
+        bucket['product_quantity'].add(item, quantity, quantity, revenue, sales)
+        bucket['product_revenue'].add(item, revenue, quantity, revenue, sales)
+
+    def _add_customer(self, day, customer_name, quantity, revenue, sales):
+        self._bucket(day)['customer_revenue'].add(customer_name, revenue, quantity, revenue, sales)
+
+    def _load(self, start):
+        """Fill the buckets from daily totals of sales up to the current highest id"""
+        self.buckets = {}
+        self.last_sale_id = db.session.query(func.max(Sale.id)).scalar() or 0
+        day = Sale.business_date
+        window = (Sale.sale_date >= business_day_start(start), Sale.id <= self.last_sale_id)
+
+        products = db.session.query(
+            day, Sale.product_name, Sale.company_name,
+            func.sum(Sale.quantity_sold), func.sum(Sale.sale_amount_paise), func.count(Sale.id)
+        ).filter(*window).group_by(day, Sale.product_name, Sale.company_name)
+        for day_value, product_name, company_name, quantity, revenue, sales in products:
+            self._add_products(day_value, product_name, company_name,
+                               int(quantity or 0), int(revenue or 0), sales)
+
+        customers = db.session.query(
+            day, Sale.customer_name,
+            func.sum(Sale.quantity_sold), func.sum(Sale.sale_amount_paise), func.count(Sale.id)
+        ).filter(*window).group_by(day, Sale.customer_name)
+        for day_value, customer_name, quantity, revenue, sales in customers:
+            self._add_customer(day_value, customer_name,
+                               int(quantity or 0), int(revenue or 0), sales)
+
+    def refresh(self):
+        """Load on first use, then add sales recorded since the last refresh"""
+        config = current_app.config
+        with self.lock:
+            if time.monotonic() < self.next_refresh:
+                return
+
+            start = business_days_ago(config.get('HEAVY_HITTERS_DAYS', 90))
+            archive_version = current_change_version(SALE_ARCHIVE_COUNTER)
+            if self.buckets is None or archive_version != self.archive_version:
+                self._load(start)
+                self.archive_version = archive_version
+                self.merged.clear()
+            else:
+                new_sales = db.session.query(
+                    Sale.id, Sale.business_date, Sale.product_name, Sale.company_name,
+                    Sale.customer_name, Sale.quantity_sold, Sale.sale_amount_paise
+                ).filter(Sale.id > self.last_sale_id).order_by(Sale.id)
+                for sale_id, day, product_name, company_name, customer_name, quantity, amount in new_sales:
+                    if day >= start:
+                        self._add_products(day, product_name, company_name, quantity, amount, 1)
+                        self._add_customer(day, customer_name, quantity, amount, 1)
+                    self.last_sale_id = sale_id
+                    self.merged.clear()
+
+            for day in [day for day in self.buckets if day < start]:
+                del self.buckets[day]
+                self.merged.clear()
+
+            self.next_refresh = time.monotonic() + config.get('SEARCH_INDEX_REFRESH_SECONDS', 2)
+
+    def covers(self, days):
+        return days <= current_app.config.get('HEAVY_HITTERS_DAYS', 90)
+
+    def top(self, kind, days, k):
+        """(entries, error bound) for the window of the last `days` days including today"""
+        self.refresh()
+        with self.lock:
+            key = (kind, days, business_today())
+            sketch = self.merged.get(key)
+            if sketch is None:
+                start = business_days_ago(days)
+                sketch = SpaceSaving(current_app.config.get('HEAVY_HITTERS_CAPACITY', 200))
+                for day, bucket in self.buckets.items():
+                    if day >= start:
+                        sketch = sketch.merge(bucket[kind])
+                self.merged[key] = sketch
+            return sketch.top(k), sketch.floor
+
+heavy_hitters = HeavyHitters()
+
+on_commit_change(heavy_hitters.mark_stale)
@@ -0,0 +1,143 @@
+from flask import Blueprint, request, jsonify
+from models import db, Stock, Sale, StockTombstone, SaleArchiveTombstone, ChangeCounter
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+sync_bp = Blueprint('sync', __name__)
+
+COUNTER_NAME = 'global'
+# Bumped when sale partitions are archived, which drops rows without stamping versions
+SALE_ARCHIVE_COUNTER = 'sale_archive'
+# Bumped by every refresh of the customer_segment table (segments.py)
+SEGMENTS_COUNTER = 'customer_segment'
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+SYNC_MODELS = (Stock, Sale)
+
+# INSERT ... ON CONFLICT constructs of the supported databases
+UPSERT_INSERT = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# Callbacks run after a commit that wrote Stock or Sale rows, see on_commit_change
+_commit_listeners = []
+
+def allocate_change_versions(connection, count, name=COUNTER_NAME):
+    """Reserve `count` consecutive change versions of counter `name` and return the first one"""
+    counter = ChangeCounter.__table__
+    # One upsert: concurrent first writes cannot both insert the counter row
+    statement = UPSERT_INSERT[connection.dialect.name](counter).values(name=name, value=count)
+    statement = statement.on_conflict_do_update(
+        index_elements=[counter.c.name],
+        set_={'value': counter.c.value + count}
+    ).returning(counter.c.value)
+
+    # The counter row stays locked until the writing transaction commits, so
+    # versions become visible to readers in the order they were handed out.
+    value = connection.execute(statement).scalar()
+    return value - count + 1
+
+def current_change_version(name=COUNTER_NAME):
+    """Latest change version of counter `name` handed out so far"""
+    value = db.session.query(ChangeCounter.value).filter_by(name=name).scalar()
+    return value or 0
+
+@event.listens_for(Session, 'before_flush')
+def stamp_change_versions(session, flush_context, instances):
+    """Stamp a fresh change version on every Stock/Sale write and tombstone deleted stock"""
+    changed = [obj for obj in session.new if isinstance(obj, SYNC_MODELS)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, SYNC_MODELS) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Stock)]
+
+    count = len(changed) + len(deleted)
+    if count == 0:
+        return
+
+    version = allocate_change_versions(session.connection(), count)
+    for obj in changed:
+        obj.change_version = version
+        version += 1
+    for stock in deleted:
+        session.add(StockTombstone(
+            stock_id=stock.id,
+            product_name=stock.product_name,
+            company_name=stock.company_name,
+            change_version=version
+        ))
+        version += 1
+
+def on_commit_change(callback):
+    """Register a callback to run after any commit that changed Stock or Sale rows"""
+    _commit_listeners.append(callback)
+    return callback
+
+@event.listens_for(Session, 'after_flush')
+def _note_sync_change(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SYNC_MODELS):
+            session.info['sync_changed'] = True
+            return
+
+@event.listens_for(Session, 'after_commit')
+def _notify_commit_listeners(session):
+    if session.info.pop('sync_changed', False):
+        for callback in _commit_listeners:
+            callback()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_sync_change(session):
+    session.info.pop('sync_changed', None)
+
+def changes_since(since, limit):
+    """Return up to `limit` changes after `since` as (kind, version, row) tuples in version order"""
+    # Fetch one extra row per table so we can tell whether another page exists
+    fetch = limit + 1
+    stocks = Stock.query.filter(Stock.change_version > since).order_by(Stock.change_version).limit(fetch).all()
+    sales = Sale.query.filter(Sale.change_version > since).order_by(Sale.change_version).limit(fetch).all()
+    tombstones = StockTombstone.query.filter(
+        StockTombstone.change_version > since
+    ).order_by(StockTombstone.change_version).limit(fetch).all()
+    archives = SaleArchiveTombstone.query.filter(
+        SaleArchiveTombstone.change_version > since
+    ).order_by(SaleArchiveTombstone.change_version).limit(fetch).all()
+
+    changes = [('stock', stock.change_version, stock) for stock in stocks]
+    changes += [('sale', sale.change_version, sale) for sale in sales]
+    changes += [('deleted_stock', tombstone.change_version, tombstone) for tombstone in tombstones]
+    changes += [('archived_sales', archive.change_version, archive) for archive in archives]
+    changes.sort(key=lambda change: change[1])
+    return changes[:limit], len(changes) > limit
+
+@sync_bp.route('', methods=['GET'])
+def get_changes():
+    """Get stock, sales, deleted stock and archived sale date ranges changed since a version cursor"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        changes, has_more = changes_since(since, limit)
+
+        payload = {'stock': [], 'sales': [], 'deleted_stock': [], 'archived_sales': []}
+        for kind, version, row in changes:
+            if kind in ('deleted_stock', 'archived_sales'):
+                # Archived sales: drop every synced sale with sale_date in [sale_date_from, sale_date_to)
+                payload[kind].append(row.to_dict())
+            else:
+                item = row.to_dict()
+                item['change_version'] = version
+                payload['stock' if kind == 'stock' else 'sales'].append(item)
+
+        payload.update({
+            'since': since,
+            'next_since': changes[-1][1] if changes else since,
+            'has_more': has_more,
+            'current_version': current_change_version()
+        })
+        return jsonify(payload), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
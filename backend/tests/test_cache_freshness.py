@@ -0,0 +1,106 @@
+"""Cached reads (cache.py, coalesce.py, conditional.py) never survive a write or the end of the business day"""
+
+from datetime import datetime, timedelta
+import pytest
+import business_time
+from cache import cache, NullBackend
+
+PRODUCT = 'Freshness Check'
+COMPANY = 'Freshness Co'
+
+DAILY_READS = [
+    '/api/analytics/dashboard-stats',
+    '/api/analytics/top-selling-products?days=1',
+    '/api/analytics/customer-analysis',
+    '/api/analytics/stock-movement',
+]
+
+@pytest.fixture
+def strict_client(app, client, monkeypatch):
+    """No stale-while-revalidate, and receipts without timestamps in the PDF"""
+    from reportlab import rl_config
+
+    monkeypatch.setitem(app.config, 'ANALYTICS_STALE_SECONDS', 0)
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    return client
+
+def fresh(client, path):
+    """The read computed from the database, bypassing every cached entry"""
+    backend = cache.get_backend()
+    cache.backend = NullBackend()
+    try:
+        return client.get(path).get_data()
+    finally:
+        cache.backend = backend
+
+def reads(sale_id=None):
+    paths = ['/api/stock', f'/api/stock/search?q={PRODUCT}', *DAILY_READS, '/api/analytics/pivot?rows=product']
+    if sale_id is not None:
+        paths.append(f'/api/sales/{sale_id}/receipt')
+    return paths
+
+def stale_reads(client, paths):
+    """Reads whose answer differs from a fresh computation"""
+    stale = []
+    for path in paths:
+        response = client.get(path)
+        if response.status_code != 200 or response.get_data() != fresh(client, path):
+            stale.append(path)
+    return stale
+
+def warm(client, paths):
+    for path in paths:
+        client.get(path)
+        client.get(path)
+
+def test_reads_are_fresh_after_every_write(strict_client):
+    client = strict_client
+
+    def stock_id():
+        return next(row['id'] for row in client.get('/api/stock').get_json() if row['product_name'] == PRODUCT)
+
+    warm(client, reads())
+    response = client.post('/api/stock', json={
+        'product_name': PRODUCT, 'company_name': COMPANY, 'quantity': 10, 'unit_price': 12.5
+    })
+    assert response.status_code == 201
+    assert stale_reads(client, reads()) == []
+
+    warm(client, reads())
+    assert client.put(f'/api/stock/{stock_id()}', json={'quantity': 25}).status_code == 200
+    assert stale_reads(client, reads()) == []
+
+    warm(client, reads())
+    response = client.post('/api/sales', json={
+        'product_name': PRODUCT, 'company_name': COMPANY, 'quantity_sold': 2,
+        'customer_name': 'Freshness Customer', 'unit_price': 12.5
+    })
+    assert response.status_code == 201
+    sale_id = response.get_json()['sale_id']
+    assert stale_reads(client, reads(sale_id)) == []
+
+    warm(client, reads(sale_id))
+    response = client.put(f'/api/sales/{sale_id}/payment', json={'payment_status': 'paid', 'payment_method': 'cash'})
+    assert response.status_code == 200
+    assert stale_reads(client, reads(sale_id)) == []
+
+    warm(client, reads(sale_id))
+    assert client.delete(f'/api/stock/{stock_id()}').status_code == 200
+    assert stale_reads(client, reads(sale_id)) == []
+
+def test_daily_reads_move_to_the_next_business_day(strict_client, monkeypatch):
+    client = strict_client
+    warm(client, DAILY_READS)
+    etags = {path: client.get(path).headers.get('ETag', '') for path in DAILY_READS}
+
+    class Tomorrow(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.utcnow() + timedelta(days=1)
+
+    monkeypatch.setattr(business_time, 'datetime', Tomorrow)
+    for path in DAILY_READS:
+        response = client.get(path, headers={'If-None-Match': etags[path]})
+        assert response.status_code == 200, path
+        assert response.headers.get('X-Cache') != 'hit', path
+        assert response.get_data() == fresh(client, path), path
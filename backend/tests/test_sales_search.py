@@ -0,0 +1,63 @@
+"""EXPLAIN checks that the sales search filters are answered from the composite indexes"""
+
+import random
+from datetime import datetime, timedelta
+import pytest
+from werkzeug.datastructures import MultiDict
+
+@pytest.fixture(scope='module')
+def seeded_sales(app):
+    """A few thousand sales over many customers, analyzed so the planner has statistics"""
+    from models import db, Sale
+    from business_time import business_date
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('index plans are checked on PostgreSQL (set TEST_DATABASE_URL)')
+
+        rng = random.Random(7)
+        now = datetime.utcnow()
+        rows = []
+        for i in range(5000):
+            sold_at = now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+            paid = rng.random() < 0.7
+            rows.append({
+                'product_name': f'Product {i % 50}',
+                'company_name': f'Company {i % 7}',
+                'quantity_sold': 1,
+                'customer_name': f'Customer {rng.randint(0, 999)}',
+                'unit_price_paise': 10000,
+                'sale_amount_paise': 10000,
+                'payment_status': 'paid' if paid else 'unpaid',
+                'payment_date': sold_at if paid else None,
+                'sale_date': sold_at,
+                'business_date': business_date(sold_at)
+            })
+        db.session.execute(Sale.__table__.insert(), rows)
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE sale'))
+        db.session.commit()
+    yield
+    with app.app_context():
+        Sale.query.delete()
+        db.session.commit()
+
+@pytest.mark.parametrize('params, expected_index', [
+    ({'customer': 'Customer 42'}, 'ix_sale_customer_date'),
+    ({'customer': 'Customer 42', 'date_from': '2024-01-01', 'date_to': '2024-01-31'}, 'ix_sale_customer_date'),
+    ({'payment_status': 'unpaid'}, 'ix_sale_status_date'),
+    ({'payment_status': 'paid', 'date_from': '2024-01-01'}, 'ix_sale_status_date'),
+])
+def test_search_uses_composite_index(app, seeded_sales, params, expected_index):
+    from models import db
+    from sales_search import build_search_query, explain
+    from serializers import SALE_FIELDS
+
+    with app.app_context():
+        # The planner may still prefer a sequential scan of a table this small
+        db.session.execute(db.text('SET enable_seqscan = off'))
+        query, _, _ = build_search_query(MultiDict(params), SALE_FIELDS)
+        plan = explain(query)
+        db.session.rollback()
+
+    assert expected_index in plan, plan
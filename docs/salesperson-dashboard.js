@@ -267,7 +267,7 @@ async function loadStockAlerts() {
 async function loadDailySales() {
     try {
         console.log('Loading daily sales...');
-        const response = await axios.get(`${API_BASE}/sales/daily?t=${Date.now()}`); // Add timestamp to prevent caching
+        const response = await axios.get(`${API_BASE}/sales/daily`);
         const data = response.data;
         console.log('Daily sales loaded:', data.sales.length, 'sales today');
 
@@ -340,7 +340,7 @@ async function loadDailySales() {
 async function loadStockData() {
     try {
         console.log('Loading stock data...');
-        const response = await axios.get(`${API_BASE}/stock?t=${Date.now()}`); // Add timestamp to prevent caching
+        const response = await axios.get(`${API_BASE}/stock?fields=id,product_name,company_name,quantity,unit_price`);
         stockData = response.data;
         console.log('Stock data loaded:', stockData.length, 'items');
         
@@ -367,7 +367,7 @@ async function loadStockData() {
 async function loadProducts() {
     try {
         console.log('Loading products for search...');
-        const response = await axios.get(`${API_BASE}/stock?t=${Date.now()}`); // Add timestamp to prevent caching
+        const response = await axios.get(`${API_BASE}/stock?fields=id,product_name,company_name,quantity,unit_price`);
         allProducts = response.data;
         console.log('Products loaded for search:', allProducts.length, 'products');
         setupProductSearch();
@@ -383,7 +383,7 @@ async function forceRefreshAllStockUI() {
         console.log('🔄 Force refreshing all stock UI elements...');
 
         // 1. Reload fresh stock data from server
-        const response = await axios.get(`${API_BASE}/stock?refresh=${Date.now()}`);
+        const response = await axios.get(`${API_BASE}/stock?fields=id,product_name,company_name,quantity,unit_price`);
         const freshStockData = response.data;
         console.log('✅ Fresh stock data loaded:', freshStockData.length, 'items');
 
@@ -440,8 +440,8 @@ async function forceRefreshDailySalesUI() {
     try {
         console.log('🔄 Force refreshing daily sales UI...');
 
-        // Force reload daily sales with fresh timestamp
-        const response = await axios.get(`${API_BASE}/sales/daily?refresh=${Date.now()}`);
+        // Always revalidated: the server answers If-None-Match with 304 until sales change
+        const response = await axios.get(`${API_BASE}/sales/daily`);
         const freshDailySales = response.data;
         console.log('✅ Fresh daily sales loaded:', freshDailySales.sales.length, 'sales today');
 
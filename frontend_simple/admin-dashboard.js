@@ -155,7 +155,7 @@ async function loadUsers() {
 async function loadDailySales() {
     try {
         console.log('Loading daily sales...');
-        const response = await axios.get(`${API_BASE}/sales/daily?t=${Date.now()}`); // Add timestamp to prevent caching
+        const response = await axios.get(`${API_BASE}/sales/daily`);
         const data = response.data;
         console.log('Daily sales loaded:', data.sales.length, 'sales today');
 